@@ -1,9 +1,25 @@
 import os
 import re
 import json
-import fitz  # PyMuPDF
-from docx import Document
-from pptx import Presentation
+import time
+from collections import deque
+
+# PyMuPDF (fitz), python-docx et python-pptx sont importés dans les fonctions qui s'en servent,
+# à la première extraction du format concerné : importer app reste rapide
+from content_classifier import (
+    CLASSIFIER,
+    detect_content_type,
+    detect_content_types,
+    is_code_line,
+    is_diagram_element,
+    is_math_formula,
+    is_table_like,
+)
+from block_grouper import GROUP_TYPE_MAP, MAX_GROUP_CHARS, iter_grouped
+from block_table import BlockTable
+import instrumentation
+import ooxml_extract
+from pdf_ocr import OCR_MAX_PENDING, OcrRouter, get_ocr_cache, needs_ocr
 
 def clean_text(text):
     text = re.sub(r'(?<!\n)\n(?!\n)', ' ', text)         # Lignes non terminées
@@ -12,275 +28,375 @@ def clean_text(text):
     text = re.sub(r'\[\s*\]', '', text)                  # [ ] orphelins
     return text.strip()
 
-def is_code_line(text):
-    """Détecte si une ligne ressemble à du code (tous langages)"""
-    # Patterns génériques pour tous les langages
-    code_patterns = [
-        # Syntaxe générale
-        r'^\s*[a-zA-Z_][a-zA-Z0-9_]*\s*\([^)]*\)\s*[\{:]',  # function() { ou function():
-        r'^\s*[{}]\s*$',                                      # Accolades seules
-        r'^\s*(if|else|while|for|do|switch|case|try|catch|finally)\s*[\(\{]',  # Structures de contrôle
-        r'^\s*(def|function|func|sub|proc|void|int|string|bool|float|double|char|var|let|const)\s+\w+',  # Déclarations
-        r'[=!<>]=|[+\-*/]=|\+\+|--|&&|\|\||<<|>>',           # Opérateurs
-        r'^\s*[a-zA-Z_][a-zA-Z0-9_]*\s*=[^=]',               # Assignations
-        r'^\s*[a-zA-Z_][a-zA-Z0-9_]*\.\w+\s*[\(=]',          # Méthodes/propriétés
-        r'[;{}]\s*$',                                         # Fin de ligne avec ; ou {}
-        
-        # Python spécifique
-        r'^\s*(import|from|class|def|if|elif|else|try|except|finally|with|for|while|return|yield|pass|break|continue)\s+',
-        r'^\s*@\w+',                                          # Décorateurs
-        r'^\s*#.*$',                                          # Commentaires Python
-        
-        # JavaScript/TypeScript
-        r'^\s*(const|let|var|function|class|interface|type|enum|export|import)\s+',
-        r'^\s*//.*$',                                         # Commentaires //
-        r'console\.(log|error|warn|info)',
-        
-        # Java/C#/C++
-        r'^\s*(public|private|protected|static|final|abstract|class|interface|enum|struct)\s+',
-        r'^\s*[a-zA-Z_][a-zA-Z0-9_]*\s+[a-zA-Z_][a-zA-Z0-9_]*\s*[;=\(]',  # Type variable
-        r'System\.(out|err)\.print',
-        r'^\s*/\*.*\*/',                                      # Commentaires /* */
-        
-        # C/C++
-        r'^\s*#(include|define|ifdef|ifndef|endif|pragma)',
-        r'^\s*(int|char|float|double|void|bool|long|short|unsigned)\s+\w+',
-        r'printf\s*\(',
-        
-        # SQL
-        r'^\s*(SELECT|INSERT|UPDATE|DELETE|CREATE|DROP|ALTER|FROM|WHERE|JOIN|GROUP BY|ORDER BY|HAVING)\s+',
-        
-        # HTML/XML
-        r'^\s*<[^>]+>.*</[^>]+>\s*$',                        # Tags complets
-        r'^\s*<[^/>]+/>\s*$',                                # Tags auto-fermants
-        
-        # CSS
-        r'^\s*[.#]?[a-zA-Z_-]+\s*\{',                       # Sélecteurs
-        r'^\s*[a-zA-Z-]+\s*:\s*[^;]+;\s*$',                 # Propriétés
-        
-        # Shell/Bash
-        r'^\s*(ls|cd|mkdir|rm|cp|mv|grep|find|cat|echo|chmod|sudo|git)\s+',
-        r'^\s*[a-zA-Z_][a-zA-Z0-9_]*=\$',                   # Variables bash
-        
-        # Autres indicateurs
-        r'^\s*\$\s*',                                        # Prompt shell
-        r'>>>\s*',                                           # Prompt Python
-        r'[a-zA-Z_][a-zA-Z0-9_]*::\w+',                     # Namespaces C++
-        r'[a-zA-Z_]\w*\[\d+\]',                             # Arrays
-        r'[a-zA-Z_]\w*\s*\*\s*\w+',                         # Pointeurs
-        r'this\.|self\.',                                    # Références objet
-    ]
-    
-    return any(re.search(pattern, text, re.IGNORECASE) for pattern in code_patterns)
-
-def is_math_formula(text):
-    """Détecte les formules mathématiques"""
-    math_patterns = [
-        r'[∑∏∫∂∆∇∞±≤≥≠≈∈∉∪∩∴∵α-ωΑ-Ω]',  # Symboles mathématiques
-        r'\b(sin|cos|tan|log|ln|exp|sqrt|lim|max|min|sum|prod)\b',
-        r'[a-zA-Z]\s*[₀-₉⁰-⁹]',                              # Indices/exposants
-        r'[a-zA-Z]\^[a-zA-Z0-9]',                            # Exposants avec ^
-        r'\b\d+/\d+\b',                                      # Fractions
-        r'[a-zA-Z]\s*=\s*[a-zA-Z0-9+\-*/\(\)\s]+',         # Équations
-    ]
-    
-    return any(re.search(pattern, text) for pattern in math_patterns)
-
-def is_diagram_element(text):
-    """Détecte les éléments de diagrammes/graphiques"""
-    diagram_patterns = [
-        # Éléments UML
-        r'^[A-Z][a-zA-Z0-9]*$',                             # Noms de classes
-        r'^\s*[+-]\s*\w+\s*:\s*\w+',                        # Attributs UML (+/-)
-        r'^\s*[+-]\s*\w+\s*\([^)]*\)\s*:\s*\w+',           # Méthodes UML
-        r'\w+\s*:\s*\w+',                                    # type:name
-        
-        # Éléments de graphiques
-        r'\b(Figure|Fig|Graph|Chart|Diagram|Schema|Table)\s*\d+',
-        r'\b(Axe|Axis|X|Y)\s*[:=]',
-        r'\b(min|max|moyenne|mean|médiane|median)\s*[:=]',
-        
-        # Symboles de diagrammes
-        r'[→←↑↓↔↕⟶⟵⟷]',                                   # Flèches
-        r'[□■○●△▲◇◆]',                                       # Formes géométriques
-        r'\|\s*\|',                                          # Barres parallèles
-        
-        # Structures de données
-        r'\w+\s*->\s*\w+',                                   # Pointeurs/liens
-        r'\[\s*\w+\s*\]\s*->\s*\[\s*\w+\s*\]',             # Boîtes liées
-    ]
-    
-    return any(re.search(pattern, text) for pattern in diagram_patterns)
-
-def is_table_like(text):
-    """Détecte les tableaux"""
-    return (
-        "\t" in text or
-        (text.count("|") >= 2 and len(text.split("|")) >= 3) or
-        (text.count(",") >= 3 and len(text) < 150) or
-        (re.search(r"\b\d{1,3}(\.\d{1,2})?\b", text) and "|" in text) or
-        re.search(r'^[|\s]*([A-Za-z0-9\s]+\s*\|\s*){2,}', text)
-    )
-
-def detect_content_type(text):
-    """Détecte le type de contenu"""
-    # Ordre d'importance dans la détection
-    if is_code_line(text):
-        return "code_line"
-    elif is_math_formula(text):
-        return "formula"
-    elif is_diagram_element(text):
-        return "diagram_element"
-    elif is_table_like(text):
-        return "table_row"
-    elif len(text) < 50 and text.isupper():
-        return "title"
-    elif text.endswith(":") and len(text) < 100:
-        return "section"
-    else:
-        return "paragraph"
+def iter_group_similar_blocks(blocks):
+    """
+    Version en flux de group_similar_blocks : consomme un itérable de blocs et
+    ne garde en mémoire que le groupe en cours.
+    """
+    return iter_grouped(blocks, GROUP_TYPE_MAP, MAX_GROUP_CHARS)
 
 def group_similar_blocks(content):
-    """Regroupe les blocs similaires consécutifs"""
-    if not content:
-        return content
+    """Regroupe les blocs similaires consécutifs (une BlockTable donne une BlockTable)"""
+    with instrumentation.stage("group"):
+        if isinstance(content, BlockTable):
+            return content.grouped(GROUP_TYPE_MAP, MAX_GROUP_CHARS)
+        return list(iter_group_similar_blocks(content))
+
+def clean_texts(texts, metrics=None):
+    """
+    clean_text sur une liste de textes. Avec l'instrumentation, retourne aussi le temps
+    de chaque texte (pour repérer les blocs lents) ; sinon ce temps vaut None.
+    """
+    if metrics is None:
+        return [clean_text(text) for text in texts], None
+    start = time.perf_counter()
+    cleaned = []
+    timings = []
+    for text in texts:
+        text_start = time.perf_counter()
+        cleaned.append(clean_text(text))
+        timings.append(time.perf_counter() - text_start)
+    metrics.add_time("clean_text", time.perf_counter() - start)
+    return cleaned, timings
+
+def classify_texts(texts, metrics=None, source=None, page=None, clean_timings=None):
+    """
+    detect_content_types, avec l'instrumentation : temps du batch, blocs par catégorie et,
+    si profile_blocks, chaque texte reclassé seul et chronométré (nettoyage compris)
+    pour garder les blocs les plus lents, avec le temps et le résultat de chaque famille
+    de patterns tentée (un bloc lent dans les patterns de code peut finir en paragraphe).
+    """
+    if metrics is None:
+        return detect_content_types(texts)
+    with metrics.stage("classify"):
+        block_types = detect_content_types(texts)
+    metrics.count_categories(block_types)
+    if metrics.profile_blocks:
+        with metrics.stage("profile_blocks"):
+            for i, text in enumerate(texts):
+                start = time.perf_counter()
+                _, steps = CLASSIFIER.classify_traced(text)
+                classify_time = time.perf_counter() - start
+                metrics.pattern_steps(steps)
+                clean_time = clean_timings[i] if clean_timings else 0.0
+                metrics.block(clean_time + classify_time, text, source, page,
+                              clean_text=clean_time, classify=classify_time,
+                              patterns={label: seconds for label, _, seconds in steps})
+    return block_types
+
+# Un bloc court est un titre si sa police dépasse nettement celle du corps de la page
+# et qu'il est en gras ou dans la plus grande police de la page
+HEADING_SIZE_RATIO = 1.25
+HEADING_MAX_CHARS = 120
+
+def iter_pdf_text_blocks(page, textpage=None):
+    """
+    Produit (texte, taille de police, gras) pour chaque bloc de texte d'une page.
+    La taille est celle de la plus grande police du bloc ; gras si tous ses caractères le sont.
+    textpage : page de texte déjà calculée (par exemple par l'OCR).
+    """
+    import fitz  # PyMuPDF
+
+    # Texte seul : sans TEXT_PRESERVE_IMAGES, PyMuPDF ne décode ni ne copie les images
+    text_flags = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+    bold_flag = fitz.TEXT_FONT_BOLD
+    for block in page.get_text("dict", flags=text_flags, textpage=textpage)["blocks"]:
+        parts = []
+        size = 0.0
+        chars = 0
+        bold_chars = 0
+        for line in block.get("lines", ()):
+            for span in line["spans"]:
+                span_text = span["text"]
+                parts.append(span_text)
+                n = len(span_text.strip())
+                if n:
+                    chars += n
+                    size = max(size, span["size"])
+                    if span["flags"] & bold_flag:
+                        bold_chars += n
+        if chars:
+            yield " ".join(parts), size, bold_chars == chars
+
+def body_font_size(text_blocks):
+    """Taille de police la plus représentée (en nombre de caractères) parmi les blocs"""
+    weights = {}
+    for text, size, _ in text_blocks:
+        weights[size] = weights.get(size, 0) + len(text)
+    return max(weights, key=weights.get) if weights else 0.0
+
+def is_heading(text, size, bold, body_size, top_size):
+    if len(text) > HEADING_MAX_CHARS or size < body_size * HEADING_SIZE_RATIO:
+        return False
+    return bold or size >= top_size
+
+def extract_pdf_page(page, page_num, source, textpage=None):
+    """Extrait les blocs (non regroupés) d'une page PDF, avec taille de police et graisse"""
+    metrics = instrumentation.METRICS
+    if metrics is not None:
+        page_start = time.perf_counter()
+    content = []
+    text_blocks = list(iter_pdf_text_blocks(page, textpage))
+    if metrics is not None:
+        metrics.add_time("pdf_parse", time.perf_counter() - page_start)
+    body_size = body_font_size(text_blocks)
+    top_size = max((size for _, size, _ in text_blocks), default=0.0)
     
-    grouped = []
-    current_group = [content[0]]
-    current_type = content[0]["type"]
+    texts, clean_timings = clean_texts([text for text, _, _ in text_blocks], metrics)
+    kept = [i for i, text in enumerate(texts) if text]
+    cleaned = [(texts[i], text_blocks[i][1], text_blocks[i][2]) for i in kept]
+    if clean_timings is not None:
+        clean_timings = [clean_timings[i] for i in kept]
+    # Toute la page est classée d'un coup
+    block_types = classify_texts([text for text, _, _ in cleaned], metrics, source, page_num, clean_timings)
     
-    for item in content[1:]:
-        # Types qui peuvent être groupés
-        groupable_types = ["code_line", "formula", "diagram_element", "table_row"]
+    for (text, size, bold), block_type in zip(cleaned, block_types):
+        # Titres détectés d'après la mise en page plutôt que d'après les majuscules
+        if block_type in ("paragraph", "title", "section"):
+            if is_heading(text, size, bold, body_size, top_size):
+                block_type = "title"
+            elif block_type == "title":
+                block_type = "paragraph"
         
-        if (item["type"] == current_type and 
-            current_type in groupable_types and
-            item.get("page", 1) == current_group[-1].get("page", 1)):
-            # Ajouter au groupe actuel
-            current_group.append(item)
-        else:
-            # Finaliser le groupe précédent
-            if len(current_group) > 1 and current_type in groupable_types:
-                # Déterminer le type de groupe
-                group_type_map = {
-                    "code_line": "code_block",
-                    "formula": "formula_block", 
-                    "diagram_element": "diagram",
-                    "table_row": "table"
-                }
-                
-                grouped_text = "\n".join([g["text"] for g in current_group])
-                grouped.append({
-                    "source": current_group[0]["source"],
-                    "page": current_group[0].get("page", current_group[0].get("slide", 1)),
-                    "type": group_type_map[current_type],
-                    "text": grouped_text
-                })
-            else:
-                # Ajouter tel quel si pas de regroupement
-                grouped.extend(current_group)
-            
-            # Commencer un nouveau groupe
-            current_group = [item]
-            current_type = item["type"]
-    
-    # Finaliser le dernier groupe
-    if len(current_group) > 1 and current_type in ["code_line", "formula", "diagram_element", "table_row"]:
-        group_type_map = {
-            "code_line": "code_block",
-            "formula": "formula_block", 
-            "diagram_element": "diagram",
-            "table_row": "table"
-        }
-        grouped_text = "\n".join([g["text"] for g in current_group])
-        grouped.append({
-            "source": current_group[0]["source"],
-            "page": current_group[0].get("page", current_group[0].get("slide", 1)),
-            "type": group_type_map[current_type],
-            "text": grouped_text
+        content.append({
+            "source": source,
+            "page": page_num,
+            "type": block_type,
+            "text": text,
+            "font_size": round(size, 1),
+            "bold": bold
         })
-    else:
-        grouped.extend(current_group)
     
-    return grouped
+    if metrics is not None:
+        metrics.page(source, page_num, time.perf_counter() - page_start, len(content))
+    return content
+
+def extract_pdf_page_reference(page, page_num, source):
+    """Ancienne extraction (get_text("dict") complet, concaténation), gardée pour le benchmark"""
+    content = []
+    for block in page.get_text("dict")["blocks"]:
+        if "lines" not in block:
+            continue
+        text = ""
+        for line in block["lines"]:
+            for span in line["spans"]:
+                text += span["text"] + " "
+        text = clean_text(text)
+        if not text:
+            continue
+        content.append({"source": source, "page": page_num, "type": detect_content_type(text), "text": text})
+    return content
+
+def benchmark_pdf(paths, repeat=3):
+    """Temps et pic mémoire (tracemalloc) des deux extractions de pages PDF"""
+    import time
+    import tracemalloc
+
+    import fitz  # PyMuPDF
+
+    report = []
+    for path in paths:
+        source = os.path.basename(path)
+        row = {"path": path}
+        for name, extract_page in [("reference", extract_pdf_page_reference), ("layout", extract_pdf_page)]:
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                with fitz.open(path) as doc:
+                    for page_num, page in enumerate(doc, start=1):
+                        extract_page(page, page_num, source)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            tracemalloc.start()
+            with fitz.open(path) as doc:
+                for page_num, page in enumerate(doc, start=1):
+                    extract_page(page, page_num, source)
+            row[name] = {"seconds": best, "peak_bytes": tracemalloc.get_traced_memory()[1]}
+            tracemalloc.stop()
+        report.append(row)
+    return report
+
+def route_pdf_page(doc, page, page_num, source, router):
+    """
+    Extraction d'une page PDF aiguillée vers l'OCR : retourne (blocs extraits directement,
+    Future des blocs OCR si la sonde juge la page scannée, sinon None).
+    router est un OcrRouter, ou None pour ne jamais passer par l'OCR.
+    """
+    blocks = extract_pdf_page(page, page_num, source)
+    if router is None or not needs_ocr(page, blocks):
+        return blocks, None
+    if instrumentation.METRICS is not None:
+        instrumentation.METRICS.count("ocr_pages")
+    return blocks, router.submit(doc, page, page_num)
+
+def routed_page_blocks(source, page_num, future, blocks):
+    """Blocs finals d'une page routée : ceux de l'OCR, ou l'extraction directe si l'OCR échoue"""
+    if future is None:
+        return blocks
+    try:
+        return future.result()
+    except Exception as exc:
+        print(f"⚠️  OCR impossible pour {source} page {page_num} : {exc}")
+        if instrumentation.METRICS is not None:
+            instrumentation.METRICS.count("ocr_failed_pages")
+        return blocks
+
+def iter_pdf_pages(filepath, ocr=True):
+    """
+    Générateur : produit les blocs (non regroupés) de chaque page, une page à la fois.
+    Les pages scannées (sans texte, couvertes d'images) partent dans le pool OCR pendant
+    que les suivantes sont extraites ; les résultats sont rendus dans l'ordre des pages.
+    Si l'OCR échoue (Tesseract absent…), la page garde son extraction directe.
+    """
+    import fitz  # PyMuPDF
+
+    source = os.path.basename(filepath)
+    router = OcrRouter(filepath, cache=get_ocr_cache) if ocr else None
+    pending = deque()  # (numéro de page, Future OCR ou None, blocs extraits directement)
+    try:
+        with fitz.open(filepath) as doc:
+            for page_num, page in enumerate(doc, start=1):
+                blocks, future = route_pdf_page(doc, page, page_num, source, router)
+                pending.append((page_num, future, blocks))
+                # Rend tout ce qui est prêt en tête ; attend l'OCR si trop de pages sont en attente
+                while pending and (pending[0][1] is None or pending[0][1].done()
+                                   or len(pending) > OCR_MAX_PENDING):
+                    yield routed_page_blocks(source, *pending.popleft())
+            while pending:
+                yield routed_page_blocks(source, *pending.popleft())
+    finally:
+        if router is not None:
+            router.close()
 
 def extract_pdf(filepath):
-    doc = fitz.open(filepath)
     content = []
-    
-    for page_num, page in enumerate(doc, start=1):
-        blocks = page.get_text("dict")["blocks"]
-        
-        for block in blocks:
-            if "lines" not in block:
-                continue
-            
-            text = ""
-            for line in block["lines"]:
-                for span in line["spans"]:
-                    text += span["text"] + " "
-            
-            text = clean_text(text)
-            if not text:
-                continue
-            
-            block_type = detect_content_type(text)
-            
-            content.append({
-                "source": os.path.basename(filepath),
-                "page": page_num,
-                "type": block_type,
-                "text": text
-            })
+    for page_content in iter_pdf_pages(filepath):
+        content.extend(page_content)
     
     return group_similar_blocks(content)
 
-def extract_docx(filepath):
-    doc = Document(filepath)
+# Les paragraphes DOCX sont classés par paquets, pour garder un flux à mémoire bornée
+DOCX_CLASSIFY_BATCH = 512
+
+def office_blocks(source, entries, unit_key, page=None):
+    """
+    Blocs d'une suite de (texte brut, type imposé ou None, position, notes) d'un fichier Office :
+    nettoyage, puis classification en un seul appel des entrées sans type imposé (les titres
+    viennent du style Word, les lignes de tableau de la structure du document).
+    unit_key est la clé de position ("section" ou "slide") ; page, si elle est donnée, est
+    l'unité chronométrée pour l'instrumentation.
+    """
+    metrics = instrumentation.METRICS
+    if metrics is not None and page is not None:
+        unit_start = time.perf_counter()
+    texts, clean_timings = clean_texts([raw for raw, _, _, _ in entries], metrics)
+    kept = [i for i, text in enumerate(texts) if text]
+    to_classify = [i for i in kept if entries[i][1] is None]
+    block_types = classify_texts([texts[i] for i in to_classify], metrics, source, page,
+                                 clean_timings and [clean_timings[i] for i in to_classify])
+    block_types.reverse()
     content = []
+    for i in kept:
+        _, fixed_type, position, notes = entries[i]
+        bloc = {
+            "source": source,
+            unit_key: position,
+            "type": fixed_type or block_types.pop(),
+            "text": texts[i]
+        }
+        if notes:
+            bloc["notes"] = True
+        content.append(bloc)
+    if metrics is not None and page is not None:
+        metrics.page(source, page, time.perf_counter() - unit_start, len(content))
+    return content
+
+def _ends_section(para):
+    """Un paragraphe qui porte un sectPr est le dernier de sa section Word"""
+    ppr = para._p.pPr
+    return ppr is not None and ppr.sectPr is not None
+
+def iter_docx_blocks_reference(filepath):
+    """
+    Ancienne extraction DOCX par python-docx, conservée comme référence pour les mesures :
+    charge tout le document et ne voit que les paragraphes du corps (ni tableaux ni zones de texte).
+    """
+    from docx import Document
+
+    doc = Document(filepath)
+    source = os.path.basename(filepath)
+    batch = []
+    section = 1
     
     for para in doc.paragraphs:
-        text = clean_text(para.text)
-        if not text:
-            continue
-        
-        style = para.style.name.lower()
-        
-        if "heading" in style:
-            block_type = "title"
-        else:
-            block_type = detect_content_type(text)
-        
-        content.append({
-            "source": os.path.basename(filepath),
-            "type": block_type,
-            "text": text
-        })
+        raw = para.text
+        if raw:
+            style = para.style.name.lower()
+            batch.append((raw, "title" if "heading" in style else None, section, False))
+            if len(batch) >= DOCX_CLASSIFY_BATCH:
+                yield from office_blocks(source, batch, "section")
+                batch = []
+        # Le saut de section est souvent porté par un paragraphe vide
+        if _ends_section(para):
+            section += 1
     
-    return group_similar_blocks(content)
+    yield from office_blocks(source, batch, "section")
+
+def iter_docx_blocks(filepath):
+    """Générateur : produit les blocs (non regroupés) d'un DOCX en lisant son XML en flux"""
+    return ooxml_extract.iter_docx_blocks(filepath)
+
+def extract_docx(filepath):
+    return group_similar_blocks(iter_docx_blocks(filepath))
+
+def extract_pptx_slide_reference(slide, slide_num, source):
+    """Ancienne extraction d'une diapositive par python-pptx (formes de premier niveau seulement)"""
+    entries = [(shape.text, None, slide_num, False) for shape in slide.shapes if hasattr(shape, "text")]
+    return office_blocks(source, entries, "slide", page=slide_num)
+
+def iter_pptx_slides_reference(filepath):
+    """Référence pour les mesures : diapositives lues par python-pptx, une à la fois"""
+    from pptx import Presentation
 
-def extract_pptx(filepath):
     prs = Presentation(filepath)
-    content = []
+    source = os.path.basename(filepath)
     
     for slide_num, slide in enumerate(prs.slides, start=1):
-        for shape in slide.shapes:
-            if hasattr(shape, "text"):
-                text = clean_text(shape.text)
-                if not text:
-                    continue
-                
-                block_type = detect_content_type(text)
-                
-                content.append({
-                    "source": os.path.basename(filepath),
-                    "slide": slide_num,
-                    "type": block_type,
-                    "text": text
-                })
+        yield extract_pptx_slide_reference(slide, slide_num, source)
+
+def iter_pptx_slides(filepath):
+    """Générateur : produit les blocs (non regroupés) de chaque diapositive, notes comprises"""
+    return ooxml_extract.iter_pptx_slides(filepath)
+
+def extract_pptx(filepath):
+    content = []
+    for slide_content in iter_pptx_slides(filepath):
+        content.extend(slide_content)
     
     return group_similar_blocks(content)
 
+def iter_blocks(filepath):
+    """Générateur : produit les blocs non regroupés de n'importe quel format supporté"""
+    ext = os.path.splitext(filepath)[-1].lower()
+    if ext == ".pdf":
+        for page_content in iter_pdf_pages(filepath):
+            yield from page_content
+    elif ext == ".docx":
+        yield from iter_docx_blocks(filepath)
+    elif ext == ".pptx":
+        for slide_content in iter_pptx_slides(filepath):
+            yield from slide_content
+    else:
+        raise ValueError("Format non supporté : " + ext)
+
+def extract_stream(filepath):
+    """Générateur : version en flux de extract_any, mémoire bornée par une page et le groupe en cours"""
+    return iter_group_similar_blocks(iter_blocks(filepath))
+
+def extract_table(filepath):
+    """Comme extract_any, mais en BlockTable (représentation compacte en colonnes)"""
+    return group_similar_blocks(BlockTable.from_blocks(iter_blocks(filepath)))
+
 def extract_any(filepath):
     ext = os.path.splitext(filepath)[-1].lower()
     if ext == ".pdf":
@@ -295,35 +411,38 @@ def extract_any(filepath):
 # ---- MAIN ----
 
 if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "--bench":
+        for row in benchmark_pdf(sys.argv[2:] or ["JavaLesBases.pdf", "document.pdf"]):
+            ref, new = row["reference"], row["layout"]
+            print(f"⏱️  {row['path']} : {ref['seconds'] * 1000:.0f} ms → {new['seconds'] * 1000:.0f} ms, "
+                  f"pic mémoire {ref['peak_bytes'] / 1024:.0f} Ko → {new['peak_bytes'] / 1024:.0f} Ko")
+        sys.exit(0)
+
+    # INGEST_METRICS=rapport.json (ou .prom) : temps par étape et par page, blocs les plus lents
+    metrics_path = instrumentation.enable_from_env()
     INPUT_FILE = "JavaLesBases.pdf"  # ← change selon ton fichier
-    output = extract_any(INPUT_FILE)
+    OUTPUT_FILE = "output_structured.json"  # .jsonl (une ligne par bloc) ou .blk (binaire, mmap)
+    output = extract_table(INPUT_FILE)
 
-    # Sauvegarde JSON
-    with open("output_structured.json", "w", encoding="utf-8") as f:
-        json.dump(output, f, ensure_ascii=False, indent=2)
+    # Sauvegarde (format selon l'extension)
+    from block_export import write_export
+    write_export(output, OUTPUT_FILE)
 
-    print(f"✅ Extraction structurée sauvegardée dans output_structured.json ({len(output)} blocs)")
+    print(f"✅ Extraction structurée sauvegardée dans {OUTPUT_FILE} ({len(output)} blocs)")
 
-    # Sauvegarde SQLite
+    # Sauvegarde SQLite (idempotente : un fichier inchangé n'est pas ré-inséré)
     import sqlite3
+    from corpus_db import configure_for_load, file_hash, ingest_blocs
     db_path = "corpus.db"
     conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS blocs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            source TEXT,
-            page INTEGER,
-            bloc_type TEXT,
-            contenu TEXT
-        )
-    ''')
-    for bloc in output:
-        c.execute('INSERT INTO blocs (source, page, bloc_type, contenu) VALUES (?, ?, ?, ?)',
-                  (bloc.get('source'), bloc.get('page'), bloc.get('type'), bloc.get('text')))
-    conn.commit()
+    configure_for_load(conn)
+    inserted = ingest_blocs(conn, os.path.basename(INPUT_FILE), file_hash(INPUT_FILE), output)
     conn.close()
-    print(f"✅ Extraction structurée sauvegardée aussi dans {db_path} ({len(output)} blocs)")
+    if inserted is None:
+        print(f"⏭️  {INPUT_FILE} inchangé depuis la dernière ingestion dans {db_path}")
+    else:
+        print(f"✅ Extraction structurée sauvegardée aussi dans {db_path} ({inserted} blocs)")
     
     # Afficher un aperçu des types de blocs détectés
     type_counts = {}
@@ -340,4 +459,7 @@ if __name__ == "__main__":
         examples = [item for item in output if item["type"] == block_type]
         if examples:
             print(f"\n{block_type.upper()} (exemple) :")
-            print(f"  {examples[0]['text'][:100]}...")
\ No newline at end of file
+            print(f"  {examples[0]['text'][:100]}...")    
+    if metrics_path:
+        instrumentation.METRICS.write(metrics_path)
+        print(f"\n⏱️  Rapport d'instrumentation écrit dans {metrics_path}")
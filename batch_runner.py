@@ -0,0 +1,286 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+import aiohttp
+
+from llm_cache import cache_key, get_cache
+
+JOBS_PATH = "jobs.jsonl"
+CONCURRENCY = 16
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5   # secondes
+BACKOFF_MAX = 30.0
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+# Limites de débit par fournisseur (requêtes par seconde, rafale autorisée)
+PROVIDERS = {
+    "openrouter": {
+        "url_env": "OPENROUTER_URL",
+        "url": "https://openrouter.ai/api/v1/chat/completions",
+        "key_env": "OPENROUTER_API_KEY",
+        "rate": 5.0,
+        "burst": 10,
+    },
+    "openai": {
+        "url_env": "OPENAI_URL",
+        "url": "https://api.openai.com/v1/chat/completions",
+        "key_env": "OPENAI_API_KEY",
+        "rate": 3.0,
+        "burst": 5,
+    },
+}
+
+
+class RateLimiter:
+    """Seau à jetons asynchrone : au plus `rate` requêtes par seconde, rafales jusqu'à `burst`"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class RetryableError(Exception):
+    pass
+
+
+def job_request(job):
+    """
+    Traduit un job en (fournisseur, modèle, messages, paramètres), avec les mêmes prompts
+    que les scripts unitaires : les réponses sont donc partagées via le cache LLM.
+    """
+    kind = job.get("kind", "quiz")
+    if kind == "quiz":
+        import generate_quiz_from_course as quiz
+        messages = [{"role": "user", "content": quiz.build_quiz_prompt(job["source"])}]
+        return job.get("provider", "openrouter"), quiz.MODEL, messages, {}
+    if kind == "diagram":
+        import generer_visuel as visuel
+        diagram_type = job.get("diagram_type") or visuel.detect_diagram_type(job["request"])
+        messages = visuel.diagram_messages(diagram_type, visuel.build_diagram_request(job["source"], job["request"]))
+        return job.get("provider", "openai"), visuel.OPENAI_MODEL, messages, {"temperature": visuel.DIAGRAM_TEMPERATURE}
+    raise ValueError(f"Type de job '{kind}' non supporté.")
+
+
+def load_jobs(path):
+    with open(path, encoding="utf-8") as f:
+        jobs = [json.loads(line) for line in f if line.strip()]
+    for index, job in enumerate(jobs):
+        job.setdefault("job_id", f"{index}")
+    return jobs
+
+
+def load_done(results_path):
+    """Ids des jobs déjà réussis lors d'une exécution précédente (reprise)"""
+    done = set()
+    if os.path.exists(results_path):
+        with open(results_path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    result = json.loads(line)
+                    if result.get("status") == "ok":
+                        done.add(result["job_id"])
+    return done
+
+
+class BatchRunner:
+    """
+    Exécute des jobs de génération (quiz, diagrammes) en parallèle :
+    concurrence bornée, connexions HTTP keep-alive partagées, limite de débit par
+    fournisseur, reprises avec backoff exponentiel à gigue, et journal de résultats
+    JSON Lines qui permet de reprendre un lot interrompu.
+    """
+
+    def __init__(self, concurrency=CONCURRENCY, max_retries=MAX_RETRIES, providers=PROVIDERS, use_cache=True,
+                 render_dir=None, renderer=None, request_fn=job_request):
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.providers = providers
+        self.cache = get_cache() if use_cache else None
+        self.limiters = {name: RateLimiter(p["rate"], p["burst"]) for name, p in providers.items()}
+        # Job → (fournisseur, modèle, messages, paramètres) ; job_request lit le cours dans corpus.db
+        self.request_fn = request_fn
+        # Rendu des diagrammes : le pool du renderer plafonne le nombre de processus `dot`
+        self.render_dir = render_dir
+        self.renderer = renderer
+        self.stats = {"ok": 0, "error": 0, "cached": 0, "retries": 0, "skipped": 0}
+
+    async def _post(self, session, provider, payload):
+        config = self.providers[provider]
+        url = os.getenv(config["url_env"], config["url"])
+        headers = {"Authorization": f"Bearer {os.getenv(config['key_env'], '')}"}
+        for attempt in range(self.max_retries + 1):
+            await self.limiters[provider].acquire()
+            try:
+                async with session.post(url, json=payload, headers=headers) as response:
+                    if response.status in RETRY_STATUSES:
+                        raise RetryableError(f"HTTP {response.status}")
+                    response.raise_for_status()
+                    body = await response.json()
+                    return body["choices"][0]["message"]["content"]
+            except (RetryableError, aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == self.max_retries:
+                    raise
+                self.stats["retries"] += 1
+                # Backoff exponentiel avec gigue complète
+                await asyncio.sleep(random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)))
+
+    async def _run_job(self, session, job, semaphore, results):
+        async with semaphore:
+            try:
+                provider, model, messages, params = await asyncio.to_thread(self.request_fn, job)
+                key = cache_key(model, messages, params)
+                content = self.cache.get(key) if self.cache else None
+                if content is not None:
+                    self.stats["cached"] += 1
+                else:
+                    content = await self._post(session, provider, {"model": model, "messages": messages, **params})
+                    if self.cache:
+                        self.cache.put(key, content, model)
+                result = {"job_id": job["job_id"], "status": "ok", "response": content}
+                if self.render_dir and job.get("kind") == "diagram":
+                    result["diagram"] = await self._render(job, content)
+                self.stats["ok"] += 1
+            except Exception as exc:
+                result = {"job_id": job["job_id"], "status": "error", "error": f"{type(exc).__name__}: {exc}"}
+                self.stats["error"] += 1
+            results.write(json.dumps(result, ensure_ascii=False) + "\n")
+            results.flush()
+
+    async def _render(self, job, content):
+        import generer_visuel as visuel
+        from diagram_render import get_renderer
+
+        renderer = self.renderer or get_renderer()
+        fmt = job.get("format", "svg")
+        dot_code, _ = visuel.split_dot_response(content)
+        data = await asyncio.wrap_future(renderer.submit(visuel.prepare_dot(dot_code), fmt))
+        path = os.path.join(self.render_dir, f"{job['job_id']}.{fmt}")
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    async def run(self, jobs, results_path):
+        done = load_done(results_path)
+        pending = [job for job in jobs if job["job_id"] not in done]
+        self.stats["skipped"] = len(jobs) - len(pending)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60)
+        timeout = aiohttp.ClientTimeout(total=300)
+        with open(results_path, "a", encoding="utf-8") as results:
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+                await asyncio.gather(*(self._run_job(session, job, semaphore, results) for job in pending))
+        return self.stats
+
+
+def run_batch(jobs_path=JOBS_PATH, results_path=None, concurrency=CONCURRENCY, use_cache=True,
+              render_dir=None, dot_processes=None):
+    results_path = results_path or os.path.splitext(jobs_path)[0] + ".results.jsonl"
+    renderer = None
+    if render_dir:
+        from diagram_render import DiagramRenderer, MAX_DOT_PROCESSES
+
+        os.makedirs(render_dir, exist_ok=True)
+        renderer = DiagramRenderer(max_processes=dot_processes or MAX_DOT_PROCESSES)
+    runner = BatchRunner(concurrency=concurrency, use_cache=use_cache, render_dir=render_dir, renderer=renderer)
+    try:
+        return asyncio.run(runner.run(load_jobs(jobs_path), results_path))
+    finally:
+        if renderer:
+            renderer.close()
+
+
+# ---- Benchmark contre un faux serveur LLM local ----
+
+async def _fake_llm_server(latency, error_rate):
+    from aiohttp import web
+
+    async def completions(request):
+        body = await request.json()
+        await asyncio.sleep(latency)
+        if random.random() < error_rate:
+            return web.Response(status=503)
+        content = f"Réponse simulée pour {body['model']}"
+        return web.json_response({"choices": [{"message": {"content": content}}]})
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", completions)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/v1/chat/completions"
+
+
+def _bench_request(job):
+    """Prompt synthétique de taille réaliste : le benchmark ne lit ni n'écrit corpus.db"""
+    extrait = " ".join(f"Bloc {i} du cours {job['source']}." for i in range(200))
+    return job.get("provider", "openrouter"), "bench-model", [{"role": "user", "content": extrait}], {}
+
+
+async def _benchmark(job_count, concurrencies, latency, error_rate):
+    import tempfile
+
+    server, url = await _fake_llm_server(latency, error_rate)
+    providers = {name: {**config, "url_env": "_BENCH_URL", "url": url, "rate": 1000.0, "burst": 1000}
+                 for name, config in PROVIDERS.items()}
+    report = []
+    try:
+        for concurrency in concurrencies:
+            with tempfile.TemporaryDirectory() as tmp:
+                jobs = [{"job_id": str(i), "kind": "quiz", "source": f"cours{i}.pdf"} for i in range(job_count)]
+                runner = BatchRunner(concurrency=concurrency, providers=providers, use_cache=False,
+                                     request_fn=_bench_request)
+                start = time.perf_counter()
+                stats = await runner.run(jobs, os.path.join(tmp, "results.jsonl"))
+                elapsed = time.perf_counter() - start
+                report.append({"concurrency": concurrency, "seconds": elapsed,
+                               "jobs_per_sec": job_count / elapsed, **stats})
+    finally:
+        await server.cleanup()
+    return report
+
+
+# ---- MAIN ----
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Génération en lot de quiz et de diagrammes à partir d'un fichier JSON Lines")
+    parser.add_argument("jobs", nargs="?", default=JOBS_PATH,
+                        help='fichier de jobs, une ligne par job : {"job_id", "kind": "quiz"|"diagram", "source", "request"}')
+    parser.add_argument("-o", "--results", help="journal de résultats (défaut : <jobs>.results.jsonl)")
+    parser.add_argument("-c", "--concurrency", type=int, default=CONCURRENCY, help="requêtes simultanées")
+    parser.add_argument("--no-cache", action="store_true", help="n'utilise pas le cache LLM")
+    parser.add_argument("--render", metavar="DIR", help="rend aussi les diagrammes dans DIR (<job_id>.<format>)")
+    parser.add_argument("--dot-processes", type=int, help="processus dot simultanés au plus pendant le rendu")
+    parser.add_argument("--bench", type=int, metavar="JOBS", help="benchmark contre un faux serveur LLM local")
+    parser.add_argument("--latency", type=float, default=0.2, help="latence simulée du faux serveur (s)")
+    args = parser.parse_args()
+
+    if args.bench:
+        print(f"⏱️  {args.bench} jobs, latence simulée {args.latency * 1000:.0f} ms :")
+        for row in asyncio.run(_benchmark(args.bench, [1, 4, args.concurrency], args.latency, 0.05)):
+            print(f"  - concurrence {row['concurrency']:>3} : {row['jobs_per_sec']:7.1f} jobs/s "
+                  f"({row['ok']} ok, {row['error']} erreurs, {row['retries']} reprises)")
+    else:
+        stats = run_batch(args.jobs, args.results, args.concurrency, use_cache=not args.no_cache,
+                          render_dir=args.render, dot_processes=args.dot_processes)
+        print(f"✅ Lot terminé : {stats['ok']} ok, {stats['error']} erreurs, {stats['cached']} depuis le cache, "
+              f"{stats['skipped']} déjà faits, {stats['retries']} reprises")
@@ -0,0 +1,284 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import fitz  # PyMuPDF
+from docx import Document
+from docx.enum.section import WD_SECTION
+from pptx import Presentation
+from pptx.util import Pt
+
+from app import extract_any, group_similar_blocks, iter_blocks
+from corpus_db import configure_for_load, ingest_blocs
+from dot_normalizer import clean_dot_labels, synthetic_class_diagram
+from search_blocs import search_blocs
+
+RESULTS_PATH = "bench_results.json"
+SCALES = (5, 20, 80)            # pages (PDF), diapositives (PPTX) ou équivalent en paragraphes (DOCX)
+REPEAT = 3
+REGRESSION_THRESHOLD = 0.25     # +25 % par rapport à la référence
+# En dessous, un cas est trop court pour être comparé de façon fiable
+MIN_COMPARED_SECONDS = 0.002
+DEFAULT_MIX = {"paragraph": 0.45, "code": 0.2, "formula": 0.1, "table": 0.1, "uml": 0.15}
+SEARCH_TERMS = ["classe", "héritage", "tableau", "méthode", "interface", "variable"]
+
+# ---- Générateur de cours synthétiques ----
+
+WORDS = ("objet classe méthode attribut héritage interface tableau boucle variable référence constructeur "
+         "exception paquetage instance valeur programme fonction compilateur mémoire type entier chaîne "
+         "les des une le la du de et en pour par sur dans avec qui que est sont on peut chaque").split()
+CLASS_NAMES = ["Animal", "Chien", "Chat", "Compte", "Client", "Point", "Forme", "Cercle", "Vehicule", "Moteur"]
+FIELD_TYPES = ["int", "String", "double", "boolean"]
+
+
+def _paragraph(rng):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(20, 60))]
+    return [" ".join(words).capitalize() + "."]
+
+
+def _code(rng):
+    name = rng.choice(CLASS_NAMES)
+    lines = [f"public class {name} {{"]
+    for i in range(rng.randint(2, 6)):
+        lines.append(f"    private {rng.choice(FIELD_TYPES)} champ{i} = {rng.randint(0, 99)};")
+    lines.append(f'    System.out.println("{name}");')
+    lines.append("}")
+    return lines
+
+
+def _formula(rng):
+    a, b = rng.randint(1, 9), rng.randint(2, 9)
+    return rng.choice([[f"f(x) = sin(x) + {a} * cos(x)"], [f"E = m * c^{b}"], [f"∑ xᵢ / n = {a}/{b}"],
+                       [f"y = {a}x + {b}", f"z = sqrt(x^2 + y^{b})"]])
+
+
+def _table(rng):
+    rows = ["Nom | Age | Note"]
+    for _ in range(rng.randint(2, 6)):
+        rows.append(f"{rng.choice(CLASS_NAMES)} | {rng.randint(18, 60)} | {rng.randint(0, 20)}.{rng.randint(0, 9)}")
+    return rows
+
+
+def _uml(rng):
+    name, parent = rng.sample(CLASS_NAMES, 2)
+    lines = [name]
+    lines += [f"- champ{i} : {rng.choice(FIELD_TYPES)}" for i in range(rng.randint(1, 4))]
+    lines += [f"+ methode{i}() : void" for i in range(rng.randint(1, 3))]
+    lines.append(f"{name} -> {parent}")
+    return lines
+
+
+GENERATORS = {"paragraph": _paragraph, "code": _code, "formula": _formula, "table": _table, "uml": _uml}
+# Nombre moyen d'éléments (paragraphes ou groupes de lignes) par page
+ITEMS_PER_PAGE = 6
+
+
+def synthetic_course(units, mix=None, seed=0):
+    """
+    Contenu d'un cours de `units` pages : liste de (titre, [éléments]), chaque élément étant
+    une liste de lignes d'un même genre (paragraphe, code, formules, tableau, texte UML).
+    Déterministe pour une graine donnée.
+    """
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    kinds, weights = list(mix), list(mix.values())
+    course = []
+    for unit in range(units):
+        items = [GENERATORS[rng.choices(kinds, weights)[0]](rng) for _ in range(rng.randint(3, 2 * ITEMS_PER_PAGE - 3))]
+        course.append((f"Chapitre {unit + 1} : {rng.choice(CLASS_NAMES)}", items))
+    return course
+
+
+def write_pdf(course, path):
+    """Une page par chapitre : titre en gras, puis une ligne par bloc (le paragraphe est renvoyé à la ligne)"""
+    doc = fitz.open()
+    for title, items in course:
+        page = doc.new_page()
+        page.insert_text((50, 60), title, fontsize=18, fontname="hebo")
+        y = 100
+        for lines in items:
+            for line in lines:
+                if y > 800:
+                    break
+                if len(line) > 90:
+                    rect = fitz.Rect(50, y, 545, y + 80)
+                    page.insert_textbox(rect, line, fontsize=10, fontname="helv")
+                    y += 90
+                else:
+                    page.insert_text((50, y), line, fontsize=10, fontname="cour" if line[:1] in " p}" else "helv")
+                    y += 18
+            y += 10
+    doc.save(path)
+    doc.close()
+
+
+def write_docx(course, path):
+    """Un titre Word par chapitre, un paragraphe par ligne, une section tous les 4 chapitres"""
+    doc = Document()
+    for unit, (title, items) in enumerate(course):
+        if unit and unit % 4 == 0:
+            doc.add_section(WD_SECTION.NEW_PAGE)
+        doc.add_heading(title, level=1)
+        for lines in items:
+            for line in lines:
+                doc.add_paragraph(line)
+    doc.save(path)
+
+
+def write_pptx(course, path):
+    """Une diapositive par chapitre, une zone de texte par ligne"""
+    prs = Presentation()
+    layout = prs.slide_layouts[5]  # titre seul
+    for title, items in course:
+        slide = prs.slides.add_slide(layout)
+        slide.shapes.title.text = title
+        top = Pt(110)
+        for lines in items:
+            for line in lines:
+                box = slide.shapes.add_textbox(Pt(30), top, Pt(660), Pt(14))
+                box.text_frame.text = line
+                top += Pt(16)
+    prs.save(path)
+
+
+WRITERS = {"pdf": write_pdf, "docx": write_docx, "pptx": write_pptx}
+
+
+def generate_corpus(directory, scales=SCALES, mix=None, seed=0):
+    """Écrit un PDF, un DOCX et un PPTX par échelle ; retourne {(format, échelle): chemin}"""
+    paths = {}
+    for scale in scales:
+        course = synthetic_course(scale, mix, seed + scale)
+        for fmt, writer in WRITERS.items():
+            path = os.path.join(directory, f"cours_{scale}.{fmt}")
+            writer(course, path)
+            paths[fmt, scale] = path
+    return paths
+
+
+# ---- Mesures ----
+
+def measure(fn, repeat=REPEAT):
+    """Meilleur temps et médiane sur `repeat` exécutions, et le dernier résultat"""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return {"seconds": min(times), "median": statistics.median(times)}, result
+
+
+def _ingest(db_path, source, blocks):
+    conn = sqlite3.connect(db_path)
+    try:
+        configure_for_load(conn)
+        return ingest_blocs(conn, source, "bench", blocks, force=True)
+    finally:
+        conn.close()
+
+
+def run_suite(directory, scales=SCALES, repeat=REPEAT, mix=None, seed=0):
+    """Exécute tous les cas ; retourne {nom du cas: {seconds, median, items}}"""
+    cases = {}
+    paths = generate_corpus(directory, scales, mix, seed)
+    for scale in scales:
+        for fmt in WRITERS:
+            stats, blocks = measure(lambda: extract_any(paths[fmt, scale]), repeat)
+            cases[f"extract_any/{fmt}/{scale}"] = {**stats, "items": len(blocks)}
+
+        raw = list(iter_blocks(paths["pdf", scale]))
+        stats, _ = measure(lambda: group_similar_blocks(raw), repeat)
+        cases[f"group_similar_blocks/{scale}"] = {**stats, "items": len(raw)}
+
+        db_path = os.path.join(directory, f"bench_{scale}.db")
+        grouped = extract_any(paths["pdf", scale])
+        source = os.path.basename(paths["pdf", scale])
+        stats, _ = measure(lambda: _ingest(db_path, source, grouped), repeat)
+        cases[f"ingest/{scale}"] = {**stats, "items": len(grouped)}
+
+        stats, _ = measure(lambda: [search_blocs(term, db_path=db_path, limit=20) for term in SEARCH_TERMS], repeat)
+        cases[f"search_blocs/{scale}"] = {**stats, "items": len(SEARCH_TERMS)}
+
+        dot_code = synthetic_class_diagram(scale * 10, seed)
+        stats, _ = measure(lambda: clean_dot_labels(dot_code), repeat)
+        cases[f"clean_dot_labels/{scale * 10}"] = {**stats, "items": len(dot_code)}
+    return cases
+
+
+def compare(cases, baseline, threshold=REGRESSION_THRESHOLD, min_seconds=MIN_COMPARED_SECONDS):
+    """Cas plus lents que la référence de plus de `threshold` : liste de (nom, référence, mesure)"""
+    regressions = []
+    for name, stats in cases.items():
+        reference = baseline.get(name)
+        if reference is None or reference["seconds"] < min_seconds:
+            continue
+        if stats["seconds"] > reference["seconds"] * (1 + threshold):
+            regressions.append((name, reference["seconds"], stats["seconds"]))
+    return regressions
+
+
+def parse_mix(text):
+    """"code=0.3,paragraph=0.5" → {"code": 0.3, "paragraph": 0.5}"""
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        if kind.strip() not in GENERATORS:
+            raise argparse.ArgumentTypeError(f"genre inconnu : {kind} (attendu : {', '.join(GENERATORS)})")
+        mix[kind.strip()] = float(weight)
+    return mix
+
+
+# ---- MAIN ----
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks hors ligne sur des cours synthétiques (PDF, DOCX, PPTX)")
+    parser.add_argument("--scales", default=",".join(map(str, SCALES)), help="tailles en pages, séparées par des virgules")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="exécutions par cas (le meilleur temps est retenu)")
+    parser.add_argument("--mix", type=parse_mix, default=None, help="proportions, ex. code=0.3,paragraph=0.4,uml=0.3")
+    parser.add_argument("--seed", type=int, default=0, help="graine du générateur")
+    parser.add_argument("-o", "--output", default=RESULTS_PATH, help="fichier JSON des résultats")
+    parser.add_argument("--baseline", help="résultats de référence (JSON) à comparer")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="ralentissement toléré par rapport à la référence (0.25 = +25 %%)")
+    parser.add_argument("--keep", metavar="DIR", help="garde les fichiers générés dans DIR")
+    args = parser.parse_args()
+
+    scales = [int(scale) for scale in args.scales.split(",")]
+    if args.keep:
+        os.makedirs(args.keep, exist_ok=True)
+        cases = run_suite(args.keep, scales, args.repeat, args.mix, args.seed)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            cases = run_suite(tmp, scales, args.repeat, args.mix, args.seed)
+
+    results = {
+        "meta": {"date": datetime.now(timezone.utc).isoformat(timespec="seconds"), "python": platform.python_version(),
+                 "machine": platform.machine(), "scales": scales, "repeat": args.repeat, "seed": args.seed,
+                 "mix": args.mix or DEFAULT_MIX},
+        "cases": cases,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+    for name, stats in cases.items():
+        print(f"⏱️  {name:<28} {stats['seconds'] * 1000:9.2f} ms ({stats['items']} éléments)")
+    print(f"✅ Résultats écrits dans {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["cases"]
+        regressions = compare(cases, baseline, args.threshold)
+        for name, reference, seconds in regressions:
+            print(f"❌ {name} : {reference * 1000:.2f} ms → {seconds * 1000:.2f} ms (+{(seconds / reference - 1) * 100:.0f} %)")
+        if regressions:
+            sys.exit(1)
+        print(f"✅ Aucune régression au-delà de +{args.threshold * 100:.0f} % par rapport à {args.baseline}")
@@ -0,0 +1,420 @@
+import json
+import mmap
+import os
+import struct
+from array import array
+
+import numpy as np
+
+import instrumentation
+from block_table import BLOCK_TYPE_CODES, FLAG_BOLD, FLAG_LAYOUT, FLAG_NOTES, FLAG_OCR, UNIT_KEYS, UNIT_NONE, BlockTable
+
+# Format selon l'extension du fichier d'export
+EXPORT_FORMATS = {".json": "json", ".jsonl": "jsonl", ".blk": "binary"}
+
+# ---- Format binaire (.blk) ----
+#
+#   en-tête   : MAGIC, version (u16), options (u16)
+#   blocs     : un enregistrement par bloc, dans l'ordre — en-tête fixe RECORD, puis le texte UTF-8
+#               (dont la longueur est le premier champ) ; avec OPT_IDS, l'id (i64) suit l'en-tête
+#   chaînes   : nombre (u32), puis pour chaque chaîne sa longueur (u32) et ses octets UTF-8
+#               (sources et types, référencés par index dans les enregistrements)
+#   index     : position (u64) de chaque enregistrement
+#   séries    : une entrée RUN_DTYPE par suite de blocs de même (source, unité, page)
+#   pied      : FOOTER (positions des chaînes, de l'index et des séries, nombres de blocs et de séries, MAGIC)
+#
+# Tout est en little-endian. Le pied est à une position fixe depuis la fin : un lecteur ouvre le
+# fichier en mmap et va directement au bloc i ou à la page N sans lire ce qui précède.
+MAGIC = b"CBLK"
+FORMAT_VERSION = 1
+OPT_IDS = 1
+HEADER = struct.Struct("<4sHH")
+RECORD = struct.Struct("<IIIIHBB")  # longueur du texte, source, type, page, taille de police × 10, unité, drapeaux
+RECORD_ID = struct.Struct("<q")
+FOOTER = struct.Struct("<QQQQQ4s")
+RECORD_DTYPE = np.dtype([("text_len", "<u4"), ("source", "<u4"), ("type", "<u4"), ("page", "<u4"),
+                         ("font_size", "<u2"), ("unit", "u1"), ("flags", "u1")])
+RUN = struct.Struct("<IBIQ")     # source, unité, page, index du premier bloc
+RUN_DTYPE = np.dtype([("source", "<u4"), ("unit", "u1"), ("page", "<u4"), ("start", "<u8")])
+UNIT_NAMES = {unit: key for key, unit in UNIT_KEYS.items()}
+
+
+def export_format(path, fmt=None):
+    if fmt:
+        return fmt
+    ext = os.path.splitext(path)[-1].lower()
+    try:
+        return EXPORT_FORMATS[ext]
+    except KeyError:
+        raise ValueError(f"Format d'export non supporté : {ext} (attendu : {', '.join(EXPORT_FORMATS)})")
+
+
+def _bloc_fields(bloc):
+    """(source, type, unité, page, taille × 10, drapeaux, id, texte) d'un bloc au format dict"""
+    unit, page = UNIT_NONE, 0
+    for key, key_unit in UNIT_KEYS.items():
+        if key in bloc:
+            unit, page = key_unit, bloc[key]
+            break
+    font_size = bloc.get("font_size")
+    flags = (FLAG_OCR if bloc.get("ocr") else 0) | (FLAG_NOTES if bloc.get("notes") else 0)
+    if font_size is not None:
+        flags |= FLAG_LAYOUT | (FLAG_BOLD if bloc.get("bold") else 0)
+    return (bloc["source"], bloc["type"], unit, page, round(font_size * 10) if font_size is not None else 0,
+            flags, bloc.get("id"), bloc["text"].encode("utf-8"))
+
+
+def _table_fields(table):
+    """Mêmes champs, lus directement dans les colonnes d'une BlockTable"""
+    arena, offsets = table.arena, table.offsets
+    for i in range(len(table)):
+        yield (table.source(i), table.block_type(i), table.units[i], table.pages[i], table.font_sizes[i],
+               table.flags[i], table.ids[i] if table.ids is not None else None,
+               bytes(arena[offsets[i]:offsets[i + 1]]))
+
+
+def write_binary(blocks, f):
+    """Écrit des blocs (dicts ou BlockTable) au format binaire, au fil de l'eau ; retourne leur nombre"""
+    if isinstance(blocks, BlockTable):
+        fields = _table_fields(blocks)
+        with_ids = blocks.ids is not None
+    else:
+        fields = map(_bloc_fields, blocks)
+        first = next(fields, None)
+        with_ids = first is not None and first[6] is not None
+        if first is not None:
+            fields = _chain(first, fields)
+
+    strings = {}
+    positions = array("Q")
+    runs = bytearray()
+    run_key = None
+    position = f.write(HEADER.pack(MAGIC, FORMAT_VERSION, OPT_IDS if with_ids else 0))
+    for source, block_type, unit, page, font_size, flags, bloc_id, text in fields:
+        source_id = strings.setdefault(source, len(strings))
+        type_id = strings.setdefault(block_type, len(strings))
+        if (source_id, unit, page) != run_key:
+            run_key = (source_id, unit, page)
+            runs += RUN.pack(source_id, unit, page, len(positions))
+        positions.append(position)
+        position += f.write(RECORD.pack(len(text), source_id, type_id, page, font_size, unit, flags))
+        if with_ids:
+            if bloc_id is None:
+                raise ValueError("Les ids doivent être fournis pour tous les blocs ou pour aucun.")
+            position += f.write(RECORD_ID.pack(bloc_id))
+        position += f.write(text)
+
+    strings_offset = position
+    position += f.write(struct.pack("<I", len(strings)))
+    for string in strings:
+        encoded = string.encode("utf-8")
+        position += f.write(struct.pack("<I", len(encoded)) + encoded)
+    index_offset = position
+    position += f.write(positions.tobytes())
+    runs_offset = position
+    f.write(bytes(runs))
+    f.write(FOOTER.pack(strings_offset, index_offset, runs_offset, len(positions),
+                        len(runs) // RUN.size, MAGIC))
+    return len(positions)
+
+
+def _chain(first, rest):
+    yield first
+    yield from rest
+
+
+class BlockFile:
+    """
+    Lecture d'un export binaire en mmap : len(), accès direct au bloc i, blocs d'une page
+    (page()), parcours en flux, ou chargement complet en BlockTable (to_table()).
+    Les blocs sont rendus au format dict, avec les mêmes clés que l'extraction.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self.mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.mm) < HEADER.size + FOOTER.size:
+            raise ValueError(f"{path} : fichier trop court pour un export binaire")
+        magic, version, options = HEADER.unpack_from(self.mm, 0)
+        strings_offset, index_offset, runs_offset, count, run_count, end_magic = \
+            FOOTER.unpack_from(self.mm, len(self.mm) - FOOTER.size)
+        if magic != MAGIC or end_magic != MAGIC:
+            raise ValueError(f"{path} : pas un export binaire de blocs")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path} : version {version} du format non supportée")
+        self.with_ids = bool(options & OPT_IDS)
+        self._text_start = RECORD.size + (RECORD_ID.size if self.with_ids else 0)
+
+        self.strings = []
+        position = strings_offset + 4
+        for _ in range(struct.unpack_from("<I", self.mm, strings_offset)[0]):
+            size = struct.unpack_from("<I", self.mm, position)[0]
+            self.strings.append(self.mm[position + 4:position + 4 + size].decode("utf-8"))
+            position += 4 + size
+        self.positions = np.frombuffer(self.mm, dtype="<u8", count=count, offset=index_offset)
+        self.runs = np.frombuffer(self.mm, dtype=RUN_DTYPE, count=run_count, offset=runs_offset)
+        self._run_index = None
+
+    def close(self):
+        # Les vues NumPy doivent être libérées avant de fermer le mmap
+        self.positions = self.runs = None
+        self.mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.positions)
+
+    def _read(self, position):
+        """(bloc, position de l'enregistrement suivant)"""
+        mm = self.mm
+        text_len, source_id, type_id, page, font_size, unit, flags = RECORD.unpack_from(mm, position)
+        bloc = {}
+        if self.with_ids:
+            bloc["id"] = RECORD_ID.unpack_from(mm, position + RECORD.size)[0]
+        bloc["source"] = self.strings[source_id]
+        if unit != UNIT_NONE:
+            bloc[UNIT_NAMES[unit]] = page
+        bloc["type"] = self.strings[type_id]
+        start = position + self._text_start
+        bloc["text"] = mm[start:start + text_len].decode("utf-8")
+        if flags & FLAG_LAYOUT:
+            bloc["font_size"] = font_size / 10
+            bloc["bold"] = bool(flags & FLAG_BOLD)
+        if flags & FLAG_OCR:
+            bloc["ocr"] = True
+        if flags & FLAG_NOTES:
+            bloc["notes"] = True
+        return bloc, start + text_len
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("index de bloc hors limites")
+        return self._read(int(self.positions[i]))[0]
+
+    def __iter__(self):
+        position = HEADER.size
+        for _ in range(len(self)):
+            bloc, position = self._read(position)
+            yield bloc
+
+    def iter_range(self, start, stop):
+        """Blocs start..stop-1, lus à la suite à partir du premier"""
+        if start >= stop:
+            return
+        position = int(self.positions[start])
+        for _ in range(start, stop):
+            bloc, position = self._read(position)
+            yield bloc
+
+    def page(self, page, source=None, unit="page"):
+        """
+        Blocs d'une page (ou diapositive, section) : l'index des séries donne directement les
+        enregistrements concernés. source peut être omis si l'export ne contient qu'un fichier.
+        """
+        if self._run_index is None:
+            # Séries regroupées par (source, unité, page), bornes de chaque série
+            starts = self.runs["start"].tolist()
+            ends = starts[1:] + [len(self)]
+            self._run_index = {}
+            for run, start, end in zip(self.runs.tolist(), starts, ends):
+                self._run_index.setdefault((self.strings[run[0]], run[1], run[2]), []).append((start, end))
+        unit_code = UNIT_KEYS[unit]
+        if source is None:
+            sources = {key[0] for key in self._run_index}
+            if len(sources) > 1:
+                raise ValueError("L'export contient plusieurs sources : préciser source=")
+            source = next(iter(sources), None)
+        blocs = []
+        for start, end in self._run_index.get((source, unit_code, page), []):
+            blocs.extend(self.iter_range(start, end))
+        return blocs
+
+    def to_table(self):
+        """
+        Charge tout l'export en BlockTable, sans passer par des dicts : les en-têtes fixes sont
+        lus d'un coup aux positions de l'index et les textes forment directement l'arène.
+        """
+        table = BlockTable()
+        count = len(self)
+        if not count:
+            return table
+        data = np.frombuffer(self.mm, dtype=np.uint8)
+        positions = self.positions.astype(np.int64)
+        headers = data[positions[:, None] + np.arange(RECORD.size)].copy().view(RECORD_DTYPE).ravel()
+        text_starts = positions + self._text_start
+        text_lens = headers["text_len"].astype(np.int64)
+
+        mm = self.mm
+        table.arena = bytearray().join([mm[start:start + size]
+                                        for start, size in zip(text_starts.tolist(), text_lens.tolist())])
+        table.offsets.frombytes(np.cumsum(text_lens, dtype=np.uint64).tobytes())
+
+        # Sources et types : index de la table de chaînes → ids de la table
+        source_map = np.zeros(len(self.strings), dtype=np.uint32)
+        type_map = np.zeros(len(self.strings), dtype=np.uint8)
+        for string_id in np.unique(headers["source"]).tolist():
+            source_map[string_id] = table._intern(self.strings[string_id])
+        for string_id in np.unique(headers["type"]).tolist():
+            block_type = self.strings[string_id]
+            if block_type not in BLOCK_TYPE_CODES:
+                raise ValueError(f"Type de bloc '{block_type}' non supporté.")
+            type_map[string_id] = BLOCK_TYPE_CODES[block_type]
+        table.source_ids.frombytes(source_map[headers["source"]].tobytes())
+        table.types.frombytes(type_map[headers["type"]].tobytes())
+        table.units.frombytes(headers["unit"].tobytes())
+        table.pages.frombytes(headers["page"].astype(np.uint32).tobytes())
+        table.font_sizes.frombytes(headers["font_size"].astype(np.uint16).tobytes())
+        table.flags.frombytes(headers["flags"].tobytes())
+        if self.with_ids:
+            ids = data[(positions + RECORD.size)[:, None] + np.arange(RECORD_ID.size)].copy().view("<i8").ravel()
+            table.ids = array("q", ids.astype(np.int64).tobytes())
+        return table
+
+
+# ---- Export / import, tous formats ----
+
+def iter_jsonl_writer(blocs, f):
+    """Écrit chaque bloc sur une ligne JSON au fil de l'eau et le retransmet"""
+    for bloc in blocs:
+        f.write(json.dumps(bloc, ensure_ascii=False))
+        f.write("\n")
+        yield bloc
+
+
+def write_export(blocks, path, fmt=None):
+    """
+    Écrit des blocs (dicts ou BlockTable) dans path, au format déduit de l'extension :
+    .json (indenté, comme output_structured.json), .jsonl (un bloc par ligne) ou .blk (binaire).
+    Retourne le nombre de blocs écrits.
+    """
+    fmt = export_format(path, fmt)
+    with instrumentation.stage(f"export_{fmt}"):
+        if fmt == "binary":
+            with open(path, "wb") as f:
+                return write_binary(blocks, f)
+        with open(path, "w", encoding="utf-8") as f:
+            if fmt == "jsonl":
+                return sum(1 for _ in iter_jsonl_writer(blocks, f))
+            if not isinstance(blocks, BlockTable):
+                blocks = list(blocks)
+                json.dump(blocks, f, ensure_ascii=False, indent=2)
+            else:
+                blocks.write_json(f)
+            return len(blocks)
+
+
+def iter_export(path, fmt=None):
+    """Générateur : blocs (dicts) d'un export ; JSON Lines et binaire sont lus en flux"""
+    fmt = export_format(path, fmt)
+    if fmt == "binary":
+        with BlockFile(path) as blocks:
+            yield from blocks
+        return
+    with open(path, encoding="utf-8") as f:
+        if fmt == "jsonl":
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(f)
+
+
+def load_table(path, fmt=None):
+    """Charge un export entier en BlockTable (directement depuis les colonnes pour le binaire)"""
+    if export_format(path, fmt) == "binary":
+        with BlockFile(path) as blocks:
+            return blocks.to_table()
+    return BlockTable.from_blocks(iter_export(path, fmt))
+
+
+# ---- MAIN : aller-retour et comparaison avec le JSON indenté ----
+
+def sample_blocks():
+    """Blocs couvrant tous les cas du format : unités, police, OCR, Unicode, texte vide, ids"""
+    return [
+        {"source": "cours.pdf", "page": 1, "type": "title", "text": "Chapitre 1 — Les bases", "font_size": 18.5,
+         "bold": True},
+        {"source": "cours.pdf", "page": 1, "type": "code_block", "text": "int x = 1;\nint y = 2;"},
+        {"source": "cours.pdf", "page": 2, "type": "paragraph", "text": "Scanné : équation ∑ xᵢ 🙂", "font_size": 11.0,
+         "bold": False, "ocr": True},
+        {"source": "cours.pdf", "page": 2, "type": "paragraph", "text": ""},
+        {"source": "slides.pptx", "slide": 3, "type": "table_row", "text": "a | b | c"},
+        {"source": "slides.pptx", "slide": 3, "type": "paragraph", "text": "Insister sur ce point", "notes": True},
+        {"source": "notes.docx", "section": 2, "type": "formula", "text": "E = mc²"},
+        {"source": "notes.docx", "type": "diagram", "text": "A -> B"},
+    ]
+
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+    import time
+
+    from app import extract_table
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        cases = [("dicts", sample_blocks()), ("ids", [{"id": i, **b} for i, b in enumerate(sample_blocks())]),
+                 ("vide", [])]
+        for name, blocks in cases:
+            for ext in EXPORT_FORMATS:
+                for label, source in [("dicts", blocks), ("BlockTable", BlockTable.from_blocks(blocks))]:
+                    path = os.path.join(tmp, f"{name}{ext}")
+                    write_export(source, path)
+                    ok = list(iter_export(path)) == blocks and load_table(path) == blocks
+                    if ext == ".blk":
+                        with BlockFile(path) as f:
+                            ok = ok and [f[i] for i in range(len(f))] == blocks
+                    if not ok:
+                        failures += 1
+                        print(f"❌ aller-retour {name} {ext} depuis {label}")
+        with BlockFile(os.path.join(tmp, "dicts.blk")) as f:
+            if (f.page(2, source="cours.pdf") != sample_blocks()[2:4] or f.page(3, "slides.pptx", unit="slide")
+                    != sample_blocks()[4:6] or f.page(9, "cours.pdf") != []):
+                failures += 1
+                print("❌ accès par page")
+    print(f"{'✅' if not failures else '❌'} aller-retour JSON, JSON Lines et binaire")
+
+    # Gros export : les fichiers d'exemple répétés sous des noms différents
+    paths = sys.argv[1:] or ["JavaLesBases.pdf", "document.pdf"]
+    copies = 50
+    blocks = [bloc for path in paths for bloc in extract_table(path)]
+    corpus = BlockTable.from_blocks({**bloc, "source": f"{i}-{bloc['source']}"}
+                                    for i in range(copies) for bloc in blocks)
+    target = corpus[len(corpus) // 2]
+    print(f"📦 {len(corpus):,} blocs ({copies} copies de {', '.join(paths)}) :")
+    with tempfile.TemporaryDirectory() as tmp:
+        for ext in EXPORT_FORMATS:
+            path = os.path.join(tmp, "corpus" + ext)
+            start = time.perf_counter()
+            write_export(corpus, path)
+            write_time = time.perf_counter() - start
+            start = time.perf_counter()
+            loaded = list(iter_export(path))
+            read_time = time.perf_counter() - start
+            assert loaded == list(corpus), f"aller-retour {ext}"
+            # Blocs d'une page au milieu du corpus
+            start = time.perf_counter()
+            if ext == ".blk":
+                with BlockFile(path) as f:
+                    page = f.page(target["page"], source=target["source"])
+            else:
+                page = [b for b in iter_export(path) if b["source"] == target["source"] and b.get("page") == target["page"]]
+            page_time = time.perf_counter() - start
+            line = (f"  - {ext:<6} {os.path.getsize(path) / 2**20:6.1f} Mo, écriture {write_time * 1000:5.0f} ms, "
+                    f"lecture {read_time * 1000:5.0f} ms, page {target['page']} de {target['source']} "
+                    f"({len(page)} blocs) en {page_time * 1000:6.1f} ms")
+            if ext == ".blk":
+                start = time.perf_counter()
+                table = load_table(path)
+                line += f", BlockTable en {(time.perf_counter() - start) * 1000:.0f} ms"
+                assert table == corpus
+            print(line)
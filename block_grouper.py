@@ -0,0 +1,228 @@
+import random
+
+# Types qui peuvent être groupés, et type du bloc obtenu
+GROUP_TYPE_MAP = {
+    "code_line": "code_block",
+    "formula": "formula_block",
+    "diagram_element": "diagram",
+    "table_row": "table"
+}
+
+# Clés de position d'un bloc : un groupe ne franchit jamais une page, une diapositive
+# ou une section Word (ni un changement de fichier source), et ne mêle pas les notes de
+# l'orateur au contenu de la diapositive
+POSITION_KEYS = ("page", "slide", "section")
+
+# Un groupe plus long que le budget de contexte (~500 tokens, voir context_builder)
+# serait toujours écarté : au-delà, le groupe est coupé et un nouveau commence
+MAX_GROUP_CHARS = 2000
+
+
+def block_position(bloc):
+    """(source, clé de position, valeur) d'un bloc ; clé et valeur valent None pour un bloc sans position"""
+    for key in POSITION_KEYS:
+        if key in bloc:
+            return bloc["source"], key, bloc[key]
+    return bloc["source"], None, None
+
+
+def _merged(first, texts, group_type):
+    bloc = {"source": first["source"]}
+    _, key, value = block_position(first)
+    if key is not None:
+        bloc[key] = value
+    bloc["type"] = group_type
+    bloc["text"] = "\n".join(texts)
+    if first.get("notes"):
+        bloc["notes"] = True
+    return bloc
+
+
+def iter_grouped(blocks, group_type_map=GROUP_TYPE_MAP, max_chars=MAX_GROUP_CHARS):
+    """
+    Étape de pipeline (générateur) : fusionne les blocs consécutifs de même type groupable
+    et de même position en un bloc du type correspondant, textes joints par "\\n".
+    Un groupe fait au plus max_chars caractères (None : pas de limite), sauf s'il ne contient
+    qu'un bloc ; un groupe d'un seul bloc est rendu tel quel.
+    Un seul passage : ne garde que les textes du groupe en cours et leur longueur totale.
+    """
+    first = None
+    texts = []
+    length = 0
+    group_type = None
+    position = None
+
+    for item in blocks:
+        text = item["text"]
+        if first is not None:
+            if (item["type"] == first["type"] and block_position(item) == position
+                    and item.get("notes", False) == first.get("notes", False)
+                    and (max_chars is None or length + 1 + len(text) <= max_chars)):
+                texts.append(text)
+                length += 1 + len(text)
+                continue
+            yield _merged(first, texts, group_type) if len(texts) > 1 else first
+            first = None
+
+        group_type = group_type_map.get(item["type"])
+        if group_type is None:
+            yield item
+            continue
+        first = item
+        texts = [text]
+        length = len(text)
+        position = block_position(item)
+
+    if first is not None:
+        yield _merged(first, texts, group_type) if len(texts) > 1 else first
+
+
+def iter_grouped_reference(blocks, group_type_map=GROUP_TYPE_MAP):
+    """
+    Ancien regroupement, conservé comme référence pour les vérifications : ne compare que
+    "page" (1 si absente), si bien que les diapositives et les sections sont fusionnées
+    entre elles, et le bloc fusionné porte toujours une clé "page".
+    """
+    current_group = []
+    current_type = None
+
+    def flush():
+        if len(current_group) > 1:
+            yield {
+                "source": current_group[0]["source"],
+                "page": current_group[0].get("page", current_group[0].get("slide", 1)),
+                "type": group_type_map[current_type],
+                "text": "\n".join(g["text"] for g in current_group)
+            }
+        else:
+            yield from current_group
+
+    for item in blocks:
+        if (current_group and item["type"] == current_type and
+                item.get("page", 1) == current_group[-1].get("page", 1)):
+            current_group.append(item)
+            continue
+        yield from flush()
+        if item["type"] in group_type_map:
+            current_group = [item]
+            current_type = item["type"]
+        else:
+            current_group = []
+            current_type = None
+            yield item
+    yield from flush()
+
+
+# ---- Vérifications par propriétés ----
+
+def random_blocks(rng, count, position_key="page"):
+    """Suite aléatoire de blocs sur quelques positions, avec de longues séries groupables"""
+    types = list(GROUP_TYPE_MAP) + ["paragraph", "title"]
+    blocks = []
+    position = 1
+    block_type = rng.choice(types)
+    for _ in range(count):
+        if rng.random() < 0.1:
+            position += 1
+        if rng.random() < 0.3:
+            block_type = rng.choice(types)
+        bloc = {"source": "doc"}
+        if position_key is not None:
+            bloc[position_key] = position
+        bloc["type"] = block_type
+        bloc["text"] = "x" * rng.choice([1, 5, 40, 300, 2500])
+        if position_key == "slide" and rng.random() < 0.2:
+            bloc["notes"] = True
+        blocks.append(bloc)
+    return blocks
+
+
+def check_properties(blocks, grouped, max_chars, group_type_map=GROUP_TYPE_MAP):
+    """
+    Propriétés d'un regroupement : ordre et textes conservés, pas de groupe à cheval sur
+    deux positions, taille bornée, et résultat stable si on le regroupe à nouveau.
+    Retourne la liste des propriétés violées.
+    """
+    failures = []
+    merged_types = set(group_type_map.values())
+    consumed = 0
+    for bloc in grouped:
+        if bloc["type"] in merged_types and bloc["type"] not in group_type_map:
+            # Les membres sont les blocs suivants dont les textes joints redonnent le groupe
+            end, length = consumed, -1
+            while end < len(blocks) and length < len(bloc["text"]):
+                length += 1 + len(blocks[end]["text"])
+                end += 1
+            members = blocks[consumed:end]
+            if len(members) < 2 or "\n".join(m["text"] for m in members) != bloc["text"]:
+                failures.append("textes")
+                break
+            if any(group_type_map.get(m["type"]) != bloc["type"] for m in members):
+                failures.append("type")
+            if any(block_position(m) != block_position(bloc) or m.get("notes") != bloc.get("notes")
+                   for m in members):
+                failures.append("frontière")
+            if max_chars is not None and len(bloc["text"]) > max_chars:
+                failures.append("taille")
+            consumed = end
+        else:
+            if consumed >= len(blocks) or blocks[consumed] != bloc:
+                failures.append("ordre")
+                break
+            consumed += 1
+    if consumed != len(blocks):
+        failures.append("blocs perdus")
+    if list(iter_grouped(grouped, group_type_map, max_chars)) != grouped:
+        failures.append("idempotence")
+    return sorted(set(failures))
+
+
+# ---- MAIN ----
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    from app import iter_blocks
+    from block_table import BlockTable
+
+    rng = random.Random(0)
+    failures = 0
+    for case in range(300):
+        position_key = rng.choice(["page", "slide", "section", None])
+        max_chars = rng.choice([None, 50, 2000])
+        blocks = random_blocks(rng, rng.randint(0, 200), position_key)
+        grouped = list(iter_grouped(blocks, max_chars=max_chars))
+        problems = check_properties(blocks, grouped, max_chars)
+        if BlockTable.from_blocks(grouped) != BlockTable.from_blocks(blocks).grouped(GROUP_TYPE_MAP, max_chars):
+            problems.append("BlockTable")
+        if position_key == "page" and max_chars is None and grouped != list(iter_grouped_reference(blocks)):
+            problems.append("référence")
+        if problems:
+            failures += 1
+            print(f"❌ cas {case} ({position_key}, max {max_chars}) : {', '.join(problems)}")
+    print(f"{'✅' if not failures else '❌'} {300 - failures}/300 suites aléatoires")
+
+    # Sur de vrais PDF : sans limite de taille, résultat identique à l'ancien regroupement
+    for path in sys.argv[1:] or ["JavaLesBases.pdf", "document.pdf"]:
+        blocks = list(iter_blocks(path))
+        start = time.perf_counter()
+        grouped = list(iter_grouped(blocks, max_chars=None))
+        elapsed = time.perf_counter() - start
+        same = grouped == list(iter_grouped_reference(blocks))
+        capped = list(iter_grouped(blocks))
+        problems = check_properties(blocks, capped, MAX_GROUP_CHARS)
+        table_same = BlockTable.from_blocks(blocks).grouped(GROUP_TYPE_MAP, MAX_GROUP_CHARS) == capped
+        print(f"{'✅' if same and not problems and table_same else '❌'} {path} : {len(blocks)} blocs → "
+              f"{len(grouped)} ({len(capped)} avec max {MAX_GROUP_CHARS} car.) en {elapsed * 1000:.1f} ms"
+              + (f" — {', '.join(problems)}" if problems else ""))
+
+    # Temps linéaire : un seul très long groupe, puis beaucoup de petits
+    for count in (100_000, 400_000):
+        for label, blocks in [("une série", [{"source": "s", "page": 1, "type": "code_line", "text": "x = 1"}] * count),
+                              ("alternés", [{"source": "s", "page": 1, "type": t, "text": "x = 1"}
+                                            for t in ["code_line", "code_line", "paragraph"] * (count // 3)])]:
+            start = time.perf_counter()
+            for _ in iter_grouped(blocks, max_chars=None):
+                pass
+            print(f"⏱️  {count} blocs ({label}) : {(time.perf_counter() - start) * 1000:.0f} ms")
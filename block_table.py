@@ -0,0 +1,326 @@
+import json
+from array import array
+
+import numpy as np
+
+from content_classifier import TYPE_LABELS
+
+# Types de blocs : ceux du classifieur, puis ceux produits par le regroupement
+BLOCK_TYPES = TYPE_LABELS + ("code_block", "formula_block", "diagram", "table")
+BLOCK_TYPE_CODES = {label: code for code, label in enumerate(BLOCK_TYPES)}
+
+# Unité de position d'un bloc : aucune, page (PDF), diapositive (PPTX) ou section (DOCX)
+UNIT_NONE, UNIT_PAGE, UNIT_SLIDE, UNIT_SECTION = 0, 1, 2, 3
+UNIT_KEYS = {"page": UNIT_PAGE, "slide": UNIT_SLIDE, "section": UNIT_SECTION}
+
+# Drapeaux par bloc
+FLAG_LAYOUT = 1   # font_size et bold présents (PDF)
+FLAG_BOLD = 2
+FLAG_OCR = 4
+FLAG_NOTES = 8  # notes de l'orateur (PPTX)
+
+BLOCK_KEYS = {"id", "source", "page", "slide", "section", "type", "text", "font_size", "bold", "ocr", "notes"}
+
+
+class BlockTable:
+    """
+    Table de blocs en colonnes : sources internées, types en petits entiers, pages et
+    tailles de police dans des array, et tout le texte dans une seule arène UTF-8.
+    Se parcourt et s'indexe comme une liste de dicts (mêmes clés, même ordre que les
+    blocs d'origine), les dicts n'étant construits qu'à la lecture.
+    """
+
+    def __init__(self):
+        self.sources = []
+        self._source_ids = {}
+        self.source_ids = array("I")
+        self.types = array("B")
+        self.units = array("B")
+        self.pages = array("I")
+        self.font_sizes = array("H")  # taille × 10
+        self.flags = array("B")
+        self.ids = None               # ids SQLite (résultats de recherche)
+        self.arena = bytearray()
+        self.offsets = array("Q", [0])
+
+    @classmethod
+    def from_blocks(cls, blocks):
+        table = cls()
+        table.extend(blocks)
+        return table
+
+    def __len__(self):
+        return len(self.types)
+
+    def _intern(self, source):
+        source_id = self._source_ids.get(source)
+        if source_id is None:
+            source_id = self._source_ids[source] = len(self.sources)
+            self.sources.append(source)
+        return source_id
+
+    def add(self, source, block_type, text, unit=UNIT_NONE, page=0, font_size=None, bold=False, ocr=False,
+            bloc_id=None, notes=False):
+        if bloc_id is not None and self.ids is None:
+            if len(self):
+                raise ValueError("Les ids doivent être fournis pour tous les blocs ou pour aucun.")
+            self.ids = array("q")
+        if self.ids is not None:
+            self.ids.append(bloc_id)
+        self.source_ids.append(self._intern(source))
+        try:
+            self.types.append(BLOCK_TYPE_CODES[block_type])
+        except KeyError:
+            raise ValueError(f"Type de bloc '{block_type}' non supporté.")
+        self.units.append(unit)
+        self.pages.append(page)
+        flags = (FLAG_OCR if ocr else 0) | (FLAG_NOTES if notes else 0)
+        if font_size is not None:
+            flags |= FLAG_LAYOUT | (FLAG_BOLD if bold else 0)
+        self.font_sizes.append(round(font_size * 10) if font_size is not None else 0)
+        self.flags.append(flags)
+        self.arena += text.encode("utf-8")
+        self.offsets.append(len(self.arena))
+
+    def append(self, bloc):
+        """Ajoute un bloc au format dict (celui des fonctions d'extraction)"""
+        unknown = bloc.keys() - BLOCK_KEYS
+        if unknown:
+            raise ValueError(f"Champs de bloc non supportés : {', '.join(sorted(unknown))}")
+        unit, page = UNIT_NONE, 0
+        for key, key_unit in UNIT_KEYS.items():
+            if key in bloc:
+                unit, page = key_unit, bloc[key]
+                break
+        self.add(bloc["source"], bloc["type"], bloc["text"], unit, page,
+                 bloc.get("font_size"), bloc.get("bold", False), bloc.get("ocr", False), bloc.get("id"),
+                 bloc.get("notes", False))
+
+    def extend(self, blocks):
+        if isinstance(blocks, BlockTable):
+            blocks = iter(blocks)
+        for bloc in blocks:
+            self.append(bloc)
+
+    # ---- Lecture colonne par colonne ----
+
+    def text(self, i):
+        return self.arena[self.offsets[i]:self.offsets[i + 1]].decode("utf-8")
+
+    def iter_texts(self):
+        arena, offsets = self.arena, self.offsets
+        for i in range(len(self)):
+            yield arena[offsets[i]:offsets[i + 1]].decode("utf-8")
+
+    def source(self, i):
+        return self.sources[self.source_ids[i]]
+
+    def block_type(self, i):
+        return BLOCK_TYPES[self.types[i]]
+
+    # ---- Vue dict ----
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("index de bloc hors limites")
+        bloc = {}
+        if self.ids is not None:
+            bloc["id"] = self.ids[i]
+        bloc["source"] = self.sources[self.source_ids[i]]
+        unit = self.units[i]
+        if unit == UNIT_PAGE:
+            bloc["page"] = self.pages[i]
+        elif unit == UNIT_SLIDE:
+            bloc["slide"] = self.pages[i]
+        elif unit == UNIT_SECTION:
+            bloc["section"] = self.pages[i]
+        bloc["type"] = BLOCK_TYPES[self.types[i]]
+        bloc["text"] = self.text(i)
+        flags = self.flags[i]
+        if flags & FLAG_LAYOUT:
+            bloc["font_size"] = self.font_sizes[i] / 10
+            bloc["bold"] = bool(flags & FLAG_BOLD)
+        if flags & FLAG_OCR:
+            bloc["ocr"] = True
+        if flags & FLAG_NOTES:
+            bloc["notes"] = True
+        return bloc
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __eq__(self, other):
+        if isinstance(other, (BlockTable, list)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def to_list(self):
+        return list(self)
+
+    # ---- Regroupement ----
+
+    def grouped(self, group_type_map, max_chars=None):
+        """
+        Même résultat que block_grouper.iter_grouped sur la vue dict, sans construire de dicts :
+        les frontières de groupes sont calculées sur les colonnes (NumPy), les blocs isolés
+        sont recopiés par tranches et seuls les groupes fusionnés passent par Python.
+        """
+        out = BlockTable()
+        out.sources = list(self.sources)
+        out._source_ids = dict(self._source_ids)
+        n = len(self)
+        if not n:
+            return out
+        merged_code = np.arange(len(BLOCK_TYPES), dtype=np.uint8)
+        groupable = np.zeros(len(BLOCK_TYPES), dtype=bool)
+        for block_type, group_type in group_type_map.items():
+            merged_code[BLOCK_TYPE_CODES[block_type]] = BLOCK_TYPE_CODES[group_type]
+            groupable[BLOCK_TYPE_CODES[block_type]] = True
+
+        types = np.frombuffer(self.types, dtype=np.uint8)
+        units = np.frombuffer(self.units, dtype=np.uint8)
+        pages = np.frombuffer(self.pages, dtype=np.uint32)
+        source_ids = np.frombuffer(self.source_ids, dtype=np.uint32)
+        flags = np.frombuffer(self.flags, dtype=np.uint8)
+        notes = flags & FLAG_NOTES
+        offsets = np.frombuffer(self.offsets, dtype=np.uint64)
+        # Un groupe ne franchit ni une page, ni une diapositive, ni une section, ni un fichier,
+        # et ne mêle pas notes de l'orateur et contenu
+        continues = np.zeros(n, dtype=bool)
+        continues[1:] = ((types[1:] == types[:-1]) & groupable[types[1:]] & (units[1:] == units[:-1])
+                         & (pages[1:] == pages[:-1]) & (source_ids[1:] == source_ids[:-1])
+                         & (notes[1:] == notes[:-1]))
+        if max_chars is not None:
+            self._split_long_runs(continues, offsets, max_chars)
+        starts = np.flatnonzero(~continues)
+        ends = np.append(starts[1:], n)
+        merged = ends - starts > 1
+
+        out.source_ids.frombytes(source_ids[starts].tobytes())
+        out.types.frombytes(np.where(merged, merged_code[types[starts]], types[starts]).astype(np.uint8).tobytes())
+        out.units.frombytes(units[starts].tobytes())
+        out.pages.frombytes(pages[starts].tobytes())
+        out.font_sizes.frombytes(np.where(merged, 0, np.frombuffer(self.font_sizes, dtype=np.uint16)[starts])
+                                 .astype(np.uint16).tobytes())
+        out.flags.frombytes(np.where(merged, notes[starts], flags[starts]).astype(np.uint8).tobytes())
+        if self.ids is not None:
+            out.ids = array("q", np.frombuffer(self.ids, dtype=np.int64)[starts].tobytes())
+
+        # Arène : les blocs isolés sont recopiés par tranches contiguës, les groupes joints par "\n"
+        arena = self.arena
+        pieces = []
+        copied = 0
+        for start, end in zip(starts[merged].tolist(), ends[merged].tolist()):
+            pieces.append(arena[copied:offsets[start]])
+            pieces.append(b"\n".join(arena[offsets[k]:offsets[k + 1]] for k in range(start, end)))
+            copied = int(offsets[end])
+        pieces.append(arena[copied:])
+        out.arena = bytearray().join(pieces)
+        # Chaque groupe fusionné gagne (taille - 1) séparateurs
+        lengths = offsets[ends] - offsets[starts] + np.where(merged, ends - starts - 1, 0).astype(np.uint64)
+        out.offsets = array("Q", [0])
+        out.offsets.frombytes(np.cumsum(lengths, dtype=np.uint64).tobytes())
+        return out
+
+    def _split_long_runs(self, continues, offsets, max_chars):
+        """
+        Coupe les séries trop longues comme iter_grouped : un bloc commence un nouveau groupe
+        si le groupe en cours dépasserait max_chars caractères. Les caractères ne sont comptés
+        (en décodant) que pour les séries dont la taille en octets dépasse déjà la limite.
+        """
+        starts = np.flatnonzero(~continues)
+        ends = np.append(starts[1:], len(continues))
+        sizes = offsets[ends] - offsets[starts] + (ends - starts - 1).astype(np.uint64)
+        long_runs = np.flatnonzero((sizes > max_chars) & (ends - starts > 1))
+        for start, end in zip(starts[long_runs].tolist(), ends[long_runs].tolist()):
+            length = len(self.text(start))
+            for k in range(start + 1, end):
+                size = len(self.text(k))
+                if length + 1 + size > max_chars:
+                    continues[k] = False
+                    length = size
+                else:
+                    length += 1 + size
+
+    # ---- Écriture ----
+
+    def db_rows(self, document_id):
+        """Lignes (document_id, page, bloc_type, contenu) pour l'insertion SQLite, sans passer par des dicts"""
+        units, pages, types = self.units, self.pages, self.types
+        for i, text in enumerate(self.iter_texts()):
+            # Comme bloc_row : seules les pages et les diapositives vont dans la colonne page
+            yield document_id, pages[i] if units[i] in (UNIT_PAGE, UNIT_SLIDE) else None, BLOCK_TYPES[types[i]], text
+
+    def write_json(self, f, indent=2):
+        """Même texte que json.dump(list(table), f, ensure_ascii=False, indent=indent), écrit bloc par bloc"""
+        if not len(self):
+            f.write("[]")
+            return
+        pad = " " * indent
+        f.write("[\n")
+        for i in range(len(self)):
+            if i:
+                f.write(",\n")
+            f.write(pad + json.dumps(self[i], ensure_ascii=False, indent=indent).replace("\n", "\n" + pad))
+        f.write("\n]")
+
+    def nbytes(self):
+        """Taille approximative en mémoire (colonnes, arène et sources)"""
+        import sys
+
+        columns = [self.source_ids, self.types, self.units, self.pages, self.font_sizes, self.flags, self.offsets]
+        if self.ids is not None:
+            columns.append(self.ids)
+        return (sum(sys.getsizeof(column) for column in columns) + sys.getsizeof(self.arena)
+                + sum(sys.getsizeof(source) for source in self.sources))
+
+
+# ---- MAIN : économie mémoire sur un gros corpus ----
+
+if __name__ == "__main__":
+    import sys
+    import time
+    import tracemalloc
+
+    from app import group_similar_blocks, iter_blocks
+    from block_grouper import GROUP_TYPE_MAP, MAX_GROUP_CHARS
+
+    paths = sys.argv[1:] or ["JavaLesBases.pdf", "document.pdf"]
+    copies = 50
+    blocks = [bloc for path in paths for bloc in iter_blocks(path)]
+    # Gros corpus : chaque fichier répété sous des noms de source différents
+    # (une seule chaîne par source, comme à l'extraction)
+    names = {}
+    corpus = [{**bloc, "source": names.setdefault((i, bloc["source"]), f"{i}-{bloc['source']}")}
+              for i in range(copies) for bloc in blocks]
+
+    tracemalloc.start()
+    as_dicts = [dict(bloc, text=bloc["text"].encode().decode()) for bloc in corpus]
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    tracemalloc.start()
+    start = time.perf_counter()
+    table = BlockTable.from_blocks(corpus)
+    build = time.perf_counter() - start
+    table_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    assert list(table) == as_dicts, "la vue dict diffère des blocs d'origine"
+    start = time.perf_counter()
+    grouped_table = table.grouped(GROUP_TYPE_MAP, MAX_GROUP_CHARS)
+    table_group = time.perf_counter() - start
+    start = time.perf_counter()
+    grouped_dicts = group_similar_blocks(as_dicts)
+    dict_group = time.perf_counter() - start
+    assert list(grouped_table) == grouped_dicts, "le regroupement en colonnes diffère"
+
+    print(f"📦 {len(table):,} blocs ({copies} copies de {', '.join(paths)}) :")
+    print(f"  - liste de dicts : {dict_bytes / 2**20:.1f} Mo")
+    print(f"  - BlockTable     : {table_bytes / 2**20:.1f} Mo (construite en {build:.2f}s), "
+          f"soit {dict_bytes / table_bytes:.1f}x moins")
+    print(f"  - regroupement   : {dict_group * 1000:.0f} ms sur les dicts, {table_group * 1000:.0f} ms en colonnes")
@@ -0,0 +1,306 @@
+import re
+import time
+from array import array
+
+# Patterns génériques pour tous les langages (recherche insensible à la casse)
+CODE_PATTERNS = [
+    # Syntaxe générale
+    r'^\s*[a-zA-Z_][a-zA-Z0-9_]*\s*\([^)]*\)\s*[\{:]',  # function() { ou function():
+    r'^\s*[{}]\s*$',                                      # Accolades seules
+    r'^\s*(if|else|while|for|do|switch|case|try|catch|finally)\s*[\(\{]',  # Structures de contrôle
+    r'^\s*(def|function|func|sub|proc|void|int|string|bool|float|double|char|var|let|const)\s+\w+',  # Déclarations
+    r'[=!<>]=|[+\-*/]=|\+\+|--|&&|\|\||<<|>>',           # Opérateurs
+    r'^\s*[a-zA-Z_][a-zA-Z0-9_]*\s*=[^=]',               # Assignations
+    r'^\s*[a-zA-Z_][a-zA-Z0-9_]*\.\w+\s*[\(=]',          # Méthodes/propriétés
+    r'[;{}]\s*$',                                         # Fin de ligne avec ; ou {}
+
+    # Python spécifique
+    r'^\s*(import|from|class|def|if|elif|else|try|except|finally|with|for|while|return|yield|pass|break|continue)\s+',
+    r'^\s*@\w+',                                          # Décorateurs
+    r'^\s*#.*$',                                          # Commentaires Python
+
+    # JavaScript/TypeScript
+    r'^\s*(const|let|var|function|class|interface|type|enum|export|import)\s+',
+    r'^\s*//.*$',                                         # Commentaires //
+    r'console\.(log|error|warn|info)',
+
+    # Java/C#/C++
+    r'^\s*(public|private|protected|static|final|abstract|class|interface|enum|struct)\s+',
+    r'^\s*[a-zA-Z_][a-zA-Z0-9_]*\s+[a-zA-Z_][a-zA-Z0-9_]*\s*[;=\(]',  # Type variable
+    r'System\.(out|err)\.print',
+    r'^\s*/\*.*\*/',                                      # Commentaires /* */
+
+    # C/C++
+    r'^\s*#(include|define|ifdef|ifndef|endif|pragma)',
+    r'^\s*(int|char|float|double|void|bool|long|short|unsigned)\s+\w+',
+    r'printf\s*\(',
+
+    # SQL
+    r'^\s*(SELECT|INSERT|UPDATE|DELETE|CREATE|DROP|ALTER|FROM|WHERE|JOIN|GROUP BY|ORDER BY|HAVING)\s+',
+
+    # HTML/XML
+    r'^\s*<[^>]+>.*</[^>]+>\s*$',                        # Tags complets
+    r'^\s*<[^/>]+/>\s*$',                                # Tags auto-fermants
+
+    # CSS
+    r'^\s*[.#]?[a-zA-Z_-]+\s*\{',                       # Sélecteurs
+    r'^\s*[a-zA-Z-]+\s*:\s*[^;]+;\s*$',                 # Propriétés
+
+    # Shell/Bash
+    r'^\s*(ls|cd|mkdir|rm|cp|mv|grep|find|cat|echo|chmod|sudo|git)\s+',
+    r'^\s*[a-zA-Z_][a-zA-Z0-9_]*=\$',                   # Variables bash
+
+    # Autres indicateurs
+    r'^\s*\$\s*',                                        # Prompt shell
+    r'>>>\s*',                                           # Prompt Python
+    r'[a-zA-Z_][a-zA-Z0-9_]*::\w+',                     # Namespaces C++
+    r'[a-zA-Z_]\w*\[\d+\]',                             # Arrays
+    r'[a-zA-Z_]\w*\s*\*\s*\w+',                         # Pointeurs
+    r'this\.|self\.',                                    # Références objet
+]
+
+MATH_PATTERNS = [
+    r'[∑∏∫∂∆∇∞±≤≥≠≈∈∉∪∩∴∵α-ωΑ-Ω]',  # Symboles mathématiques
+    r'\b(sin|cos|tan|log|ln|exp|sqrt|lim|max|min|sum|prod)\b',
+    r'[a-zA-Z]\s*[₀-₉⁰-⁹]',                              # Indices/exposants
+    r'[a-zA-Z]\^[a-zA-Z0-9]',                            # Exposants avec ^
+    r'\b\d+/\d+\b',                                      # Fractions
+    r'[a-zA-Z]\s*=\s*[a-zA-Z0-9+\-*/\(\)\s]+',         # Équations
+]
+
+DIAGRAM_PATTERNS = [
+    # Éléments UML
+    r'^[A-Z][a-zA-Z0-9]*$',                             # Noms de classes
+    r'^\s*[+-]\s*\w+\s*:\s*\w+',                        # Attributs UML (+/-)
+    r'^\s*[+-]\s*\w+\s*\([^)]*\)\s*:\s*\w+',           # Méthodes UML
+    r'\w+\s*:\s*\w+',                                    # type:name
+
+    # Éléments de graphiques
+    r'\b(Figure|Fig|Graph|Chart|Diagram|Schema|Table)\s*\d+',
+    r'\b(Axe|Axis|X|Y)\s*[:=]',
+    r'\b(min|max|moyenne|mean|médiane|median)\s*[:=]',
+
+    # Symboles de diagrammes
+    r'[→←↑↓↔↕⟶⟵⟷]',                                   # Flèches
+    r'[□■○●△▲◇◆]',                                       # Formes géométriques
+    r'\|\s*\|',                                          # Barres parallèles
+
+    # Structures de données
+    r'\w+\s*->\s*\w+',                                   # Pointeurs/liens
+    r'\[\s*\w+\s*\]\s*->\s*\[\s*\w+\s*\]',             # Boîtes liées
+]
+
+TABLE_NUMBER_PATTERN = r"\b\d{1,3}(\.\d{1,2})?\b"
+TABLE_COLUMNS_PATTERN = r'^[|\s]*([A-Za-z0-9\s]+\s*\|\s*){2,}'
+
+
+# Réécritures équivalentes des patterns qui reprennent chaque mot à chacune de ses lettres
+# (coût quadratique en la longueur du mot) : la recherche ne démarre plus qu'en début de mot.
+# Un tel pattern trouve une correspondance ssi le mot qui précède le séparateur contient
+# un caractère autorisé au départ, d'où le lookahead.
+LINEAR_REWRITES = {
+    r'[a-zA-Z_][a-zA-Z0-9_]*::\w+': r'(?<![a-zA-Z0-9_])(?=[a-zA-Z0-9_]*?[a-zA-Z_])[a-zA-Z0-9_]+::\w+',
+    r'[a-zA-Z_]\w*\[\d+\]': r'(?<!\w)(?=\w*?[a-zA-Z_])\w+\[\d+\]',
+    r'[a-zA-Z_]\w*\s*\*\s*\w+': r'(?<!\w)(?=\w*?[a-zA-Z_])\w+\s*\*\s*\w+',
+    r'\w+\s*:\s*\w+': r'(?<!\w)\w+\s*:\s*\w+',
+    r'\w+\s*->\s*\w+': r'(?<!\w)\w+\s*->\s*\w+',
+}
+
+# Codes des types de blocs renvoyés par le mode batch (array('B'), un octet par bloc)
+TYPE_LABELS = ("paragraph", "code_line", "formula", "diagram_element", "table_row", "title", "section")
+TYPE_CODES = {label: code for code, label in enumerate(TYPE_LABELS)}
+
+
+def _alternation(patterns, flags=0):
+    """Fusionne une liste de patterns en une seule regex compilée."""
+    return re.compile("|".join(f"(?:{LINEAR_REWRITES.get(p, p)})" for p in patterns), flags)
+
+
+# ---- Fonctions de référence (règles d'origine, un re.search par pattern) ----
+
+def is_code_line(text):
+    """Détecte si une ligne ressemble à du code (tous langages)"""
+    return any(re.search(pattern, text, re.IGNORECASE) for pattern in CODE_PATTERNS)
+
+def is_math_formula(text):
+    """Détecte les formules mathématiques"""
+    return any(re.search(pattern, text) for pattern in MATH_PATTERNS)
+
+def is_diagram_element(text):
+    """Détecte les éléments de diagrammes/graphiques"""
+    return any(re.search(pattern, text) for pattern in DIAGRAM_PATTERNS)
+
+def is_table_like(text):
+    """Détecte les tableaux"""
+    return (
+        "\t" in text or
+        (text.count("|") >= 2 and len(text.split("|")) >= 3) or
+        (text.count(",") >= 3 and len(text) < 150) or
+        (re.search(TABLE_NUMBER_PATTERN, text) and "|" in text) or
+        re.search(TABLE_COLUMNS_PATTERN, text)
+    )
+
+def detect_content_type_reference(text):
+    """Détecte le type de contenu avec les règles d'origine (sert de référence de parité)"""
+    # Ordre d'importance dans la détection
+    if is_code_line(text):
+        return "code_line"
+    elif is_math_formula(text):
+        return "formula"
+    elif is_diagram_element(text):
+        return "diagram_element"
+    elif is_table_like(text):
+        return "table_row"
+    elif len(text) < 50 and text.isupper():
+        return "title"
+    elif text.endswith(":") and len(text) < 100:
+        return "section"
+    else:
+        return "paragraph"
+
+
+class ContentClassifier:
+    """
+    Classifieur de blocs : chaque catégorie est fusionnée en une seule alternation
+    compilée une fois pour toutes, ce qui donne un passage regex par catégorie
+    au lieu d'un re.search par pattern. Les patterns de code ancrés en début de texte
+    sont testés une seule fois (match) au lieu d'être tentés à chaque position.
+    """
+
+    def __init__(self):
+        anchored = [p[1:] for p in CODE_PATTERNS if p.startswith("^")]
+        self.code_start_re = _alternation(anchored, re.IGNORECASE)
+        self.code_re = _alternation([p for p in CODE_PATTERNS if not p.startswith("^")], re.IGNORECASE)
+        self.math_re = _alternation(MATH_PATTERNS)
+        self.diagram_re = _alternation(DIAGRAM_PATTERNS)
+        self.table_number_re = re.compile(TABLE_NUMBER_PATTERN)
+        self.table_columns_re = re.compile(TABLE_COLUMNS_PATTERN)
+        # Familles de patterns, dans l'ordre où classify les tente : (label si trouvée, test)
+        self.pattern_steps = (
+            ("code_line", lambda text: bool(self.code_start_re.match(text) or self.code_re.search(text))),
+            ("formula", lambda text: self.math_re.search(text) is not None),
+            ("diagram_element", lambda text: self.diagram_re.search(text) is not None),
+            ("table_row", self.is_table_like),
+        )
+
+    def is_table_like(self, text):
+        if "\t" in text:
+            return True
+        pipes = text.count("|")
+        # text.split("|") donne toujours pipes + 1 morceaux
+        if pipes >= 2:
+            return True
+        if text.count(",") >= 3 and len(text) < 150:
+            return True
+        if pipes and self.table_number_re.search(text):
+            return True
+        return self.table_columns_re.search(text) is not None
+
+    def classify(self, text):
+        """Retourne le même label que detect_content_type_reference, en un seul passage."""
+        if self.code_start_re.match(text) or self.code_re.search(text):
+            return "code_line"
+        if self.math_re.search(text):
+            return "formula"
+        if self.diagram_re.search(text):
+            return "diagram_element"
+        if self.is_table_like(text):
+            return "table_row"
+        return self._layout_label(text)
+
+    def _layout_label(self, text):
+        """Dernières règles, sans regex : titre en majuscules, section, paragraphe"""
+        if len(text) < 50 and text.isupper():
+            return "title"
+        if text.endswith(":") and len(text) < 100:
+            return "section"
+        return "paragraph"
+
+    def classify_traced(self, text):
+        """
+        classify instrumenté : retourne (label, étapes), où étapes donne pour chaque famille
+        de patterns tentée, dans l'ordre, (label de la famille, trouvée, secondes).
+        Plus lent que classify : réservé au chemin instrumenté.
+        """
+        clock = time.perf_counter
+        steps = []
+        for label, test in self.pattern_steps:
+            start = clock()
+            matched = bool(test(text))
+            steps.append((label, matched, clock() - start))
+            if matched:
+                return label, steps
+        return self._layout_label(text), steps
+
+    def classify_codes(self, texts):
+        """
+        Classification batch dédoublonnée : classe tous les textes d'une page ou d'un document et
+        retourne un array('B') de codes (indices dans TYPE_LABELS), identiques aux labels
+        de classify. Le gain vient seulement du dédoublonnage : chaque texte distinct n'est
+        classé qu'une fois (en-têtes et pieds de page répétés, numéros de page…) ; des
+        textes tous distincts sont classés au même rythme qu'un appel à classify par bloc.
+        """
+        classify = self.classify
+        unique = {text: TYPE_CODES[classify(text)] for text in dict.fromkeys(texts)}
+        return array("B", [unique[text] for text in texts])
+
+    def classify_many(self, texts):
+        """Comme classify_codes, mais retourne la liste des labels"""
+        return [TYPE_LABELS[code] for code in self.classify_codes(texts).tolist()]
+
+
+# Instance partagée, compilée à l'import
+CLASSIFIER = ContentClassifier()
+
+
+def detect_content_type(text):
+    """Détecte le type de contenu"""
+    return CLASSIFIER.classify(text)
+
+
+def detect_content_types(texts):
+    """Détecte le type de contenu d'une liste de textes (mode batch)"""
+    return CLASSIFIER.classify_many(texts)
+
+
+# ---- MAIN : parité et micro-benchmark ----
+
+if __name__ == "__main__":
+    import random
+    import sys
+
+    from block_export import iter_export
+
+    input_json = sys.argv[1] if len(sys.argv) > 1 else "output_structured.json"
+    texts = [bloc["text"] for bloc in iter_export(input_json)]
+
+    # Corpus réel + chaînes aléatoires ciblant les patterns réécrits
+    rng = random.Random(0)
+    alphabet = "aZ_9é :*[]->=;{}|,\t\n.(#<>/"
+    fuzz = ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 24))) for _ in range(50_000)]
+    checked = texts + fuzz
+    batch = CLASSIFIER.classify_many(checked)
+    mismatches = [
+        (text, expected, got)
+        for text, expected, got in zip(checked, map(detect_content_type_reference, checked), batch)
+        if expected != got or got != CLASSIFIER.classify(text) or got != CLASSIFIER.classify_traced(text)[0]
+    ]
+    if mismatches:
+        print(f"❌ {len(mismatches)} divergences sur {len(checked)} blocs :")
+        for text, expected, got in mismatches[:10]:
+            print(f"  - attendu {expected}, obtenu {got} : {text[:80]!r}")
+        sys.exit(1)
+    print(f"✅ Parité vérifiée sur {len(texts)} blocs de {input_json} et {len(fuzz)} chaînes aléatoires")
+
+    # 120k blocs tirés du corpus (avec les répétitions d'un vrai document), puis 120k blocs tous distincts
+    sampled = [rng.choice(texts) for _ in range(120_000)]
+    distinct = [f"{text} {i}" if i % 2 else f"{i} {text}" for i, text in enumerate(sampled)]
+    for label, blocks in [("tirés du corpus", sampled), ("tous distincts", distinct)]:
+        print(f"⏱️  {len(blocks):,} blocs {label} :")
+        for name, fn in [("référence, bloc par bloc", lambda b: [detect_content_type_reference(t) for t in b]),
+                         ("compilé, bloc par bloc", lambda b: [CLASSIFIER.classify(t) for t in b]),
+                         ("batch dédoublonné (codes array('B'))", CLASSIFIER.classify_codes)]:
+            start = time.perf_counter()
+            fn(blocks)
+            elapsed = time.perf_counter() - start
+            print(f"  - {name}: {len(blocks) / elapsed:,.0f} blocs/s")
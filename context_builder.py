@@ -0,0 +1,111 @@
+import re
+from collections import Counter
+from contextlib import closing
+
+from corpus_db import DB_PATH, fts_query, get_store
+
+# Budget par défaut : ~500 tokens, soit à peu près les 2000 caractères d'avant
+CONTEXT_TOKENS = 500
+CHARS_PER_TOKEN = 4
+# En dessous, un bloc (numéro de page, en-tête répété…) n'apporte rien au modèle
+MIN_BLOCK_CHARS = 30
+# Budget restant en dessous duquel on arrête de lire
+MIN_REMAINING_TOKENS = 16
+# Blocs candidats demandés à l'index sémantique quand l'index plein texte ne trouve rien
+SEMANTIC_CANDIDATES = 50
+# Mots des titres gardés pour décrire les thèmes d'un cours (requête des quiz)
+TOPIC_TERMS = 24
+
+STOPWORDS = set("""
+    les des une un le la du de et en au aux ce ces cet cette pour par sur dans avec sans qui que quoi
+    dont est sont son sa ses leur leurs mon ma mes ton ta tes nous vous ils elles il elle on pas plus
+    moins tout tous toute toutes fait faire donne donner génère générer explique expliquer chaque
+    entre comme mais ou où the and for with
+""".split())
+
+
+def estimate_tokens(text):
+    """Estimation grossière du nombre de tokens (≈ 4 caractères par token en français)"""
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def request_terms(request):
+    """Mots significatifs d'une requête utilisateur (sans mots vides ni mots trop courts)"""
+    words = re.findall(r"\w+", request.lower())
+    return list(dict.fromkeys(w for w in words if len(w) > 2 and w not in STOPWORDS))
+
+
+def _pack(rows, max_tokens):
+    """
+    Remplit le budget avec les blocs dans l'ordre où ils arrivent, en sautant ceux qui ne
+    tiennent pas ; arrête la lecture dès que le budget restant est négligeable.
+    """
+    selected = []
+    remaining = max_tokens
+    for row in rows:
+        bloc_id, page, contenu = row[0], row[1], row[3]
+        if len(contenu) < MIN_BLOCK_CHARS:
+            continue
+        cost = estimate_tokens(contenu)
+        if cost > remaining:
+            continue
+        selected.append((page, bloc_id, contenu))
+        remaining -= cost
+        if remaining < MIN_REMAINING_TOKENS:
+            break
+    return selected
+
+
+def course_topics(source, max_terms=TOPIC_TERMS, db_path=DB_PATH):
+    """
+    Requête décrivant les thèmes d'un cours : les mots significatifs qui reviennent dans le
+    plus de titres (détectés à la mise en page), du plus fréquent au moins fréquent.
+    La page de garde et la bibliographie, sans titres récurrents, n'y pèsent presque pas.
+    Chaîne vide si le cours n'a aucun titre.
+    """
+    counts = Counter()
+    with closing(get_store(db_path).iter_course_blocs(source)) as rows:
+        for _, _, bloc_type, contenu in rows:
+            if bloc_type == "title":
+                counts.update(set(request_terms(contenu)))
+    return " ".join(term for term, _ in counts.most_common(max_terms))
+
+
+def build_context(source, request=None, max_tokens=CONTEXT_TOKENS, db_path=DB_PATH):
+    """
+    Construit le contexte envoyé au modèle pour un cours : les blocs les plus pertinents
+    pour la requête (BM25 sur l'index plein texte) sont lus un par un et ajoutés tant que
+    le budget de tokens le permet, puis remis dans l'ordre du cours.
+    Si aucun mot de la requête n'apparaît dans le cours, les blocs les plus proches selon
+    l'index sémantique (s'il a été construit) sont essayés. Sans requête, ou à défaut, les
+    blocs sont pris dans l'ordre du document en ignorant les fragments trop courts.
+    """
+    store = get_store(db_path)
+    selected = []
+    terms = request_terms(request) if request else []
+    if terms:
+        with closing(store.iter_ranked_blocs(source, fts_query(" ".join(terms), any_term=True))) as rows:
+            selected = _pack(rows, max_tokens)
+    if terms and not selected:
+        # Importé seulement ici : NumPy n'est chargé que si l'index sémantique sert
+        from embedding_index import semantic_search
+
+        hits = semantic_search(request, source=source, db_path=db_path, limit=SEMANTIC_CANDIDATES)
+        selected = _pack([(b["id"], b["page"], b["bloc_type"], b["contenu"]) for b in hits], max_tokens)
+    if not selected:
+        with closing(store.iter_course_blocs(source)) as rows:
+            selected = _pack(rows, max_tokens)
+    selected.sort()
+    return "\n".join(contenu for _, _, contenu in selected)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 3:
+        print("Usage: python context_builder.py <nom_du_pdf> <requete utilisateur> [budget_tokens]")
+        sys.exit(1)
+    budget = int(sys.argv[3]) if len(sys.argv) > 3 else CONTEXT_TOKENS
+    context = build_context(sys.argv[1], sys.argv[2], budget)
+    print(context)
+    print(f"\n[{estimate_tokens(context)} tokens estimés / budget {budget}]")
@@ -0,0 +1,511 @@
+import hashlib
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from itertools import islice
+
+import instrumentation
+
+DB_PATH = "corpus.db"
+BATCH_SIZE = 500
+# Dossier de l'index sémantique, à côté de la base (voir embedding_index)
+EMBEDDINGS_DIRNAME = "embeddings"
+
+
+# Les triggers tiennent blocs_fts à jour ligne par ligne ; l'ingestion en masse les
+# suspend (fts_sync.enabled = 0, dans sa propre transaction) et met l'index à jour
+# en une requête ensembliste, bien plus rapide qu'un passage FTS5 par ligne.
+FTS_TRIGGERS = [
+    '''CREATE TRIGGER IF NOT EXISTS blocs_fts_ai AFTER INSERT ON blocs
+    WHEN (SELECT enabled FROM fts_sync) BEGIN
+        INSERT INTO blocs_fts(rowid, contenu) VALUES (new.id, new.contenu);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS blocs_fts_ad AFTER DELETE ON blocs
+    WHEN (SELECT enabled FROM fts_sync) BEGIN
+        INSERT INTO blocs_fts(blocs_fts, rowid, contenu) VALUES ('delete', old.id, old.contenu);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS blocs_fts_au AFTER UPDATE OF contenu ON blocs
+    WHEN (SELECT enabled FROM fts_sync) BEGIN
+        INSERT INTO blocs_fts(blocs_fts, rowid, contenu) VALUES ('delete', old.id, old.contenu);
+        INSERT INTO blocs_fts(rowid, contenu) VALUES (new.id, new.contenu);
+    END''',
+]
+
+
+def _table_exists(conn, name):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchone() is not None
+
+
+def _migration_initial_schema(conn):
+    """v1 : table blocs d'origine (bases créées par les premières versions de app.py)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS blocs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source TEXT,
+            page INTEGER,
+            bloc_type TEXT,
+            contenu TEXT
+        )
+    ''')
+
+
+def _migration_fts_index(conn):
+    """
+    v2 : index plein texte FTS5 sur blocs.contenu, à contenu externe (pas de copie du texte),
+    maintenu par triggers. Le tokenizer unicode61 avec remove_diacritics ignore casse
+    et accents : « energie » trouve « Énergie ».
+    """
+    if not _table_exists(conn, "blocs_fts"):
+        conn.execute('''
+            CREATE VIRTUAL TABLE blocs_fts USING fts5(
+                contenu,
+                content='blocs',
+                content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        ''')
+        conn.execute("INSERT INTO blocs_fts(blocs_fts) VALUES ('rebuild')")
+    if not _table_exists(conn, "fts_sync"):
+        conn.execute("CREATE TABLE fts_sync (enabled INTEGER NOT NULL)")
+        conn.execute("INSERT INTO fts_sync (enabled) VALUES (1)")
+    for name in ("blocs_fts_ai", "blocs_fts_ad", "blocs_fts_au"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    for trigger in FTS_TRIGGERS:
+        conn.execute(trigger)
+
+
+def _migration_documents(conn):
+    """
+    v3 : la source est normalisée dans une table documents à id entier ; blocs ne garde
+    que document_id. Les hashes de contenu déjà enregistrés sont conservés ; les sources
+    sans hash seront simplement ré-ingérées.
+    """
+    conn.execute('''
+        CREATE TABLE documents_v3 (
+            id INTEGER PRIMARY KEY,
+            source TEXT NOT NULL UNIQUE,
+            content_hash TEXT,
+            bloc_count INTEGER NOT NULL DEFAULT 0,
+            ingested_at TEXT
+        )
+    ''')
+    if _table_exists(conn, "documents"):
+        conn.execute('''
+            INSERT INTO documents_v3 (source, content_hash, bloc_count, ingested_at)
+            SELECT source, content_hash, bloc_count, ingested_at FROM documents
+        ''')
+        conn.execute("DROP TABLE documents")
+    conn.execute('''
+        INSERT OR IGNORE INTO documents_v3 (source, bloc_count)
+        SELECT COALESCE(source, ''), COUNT(*) FROM blocs GROUP BY COALESCE(source, '')
+    ''')
+    conn.execute("ALTER TABLE documents_v3 RENAME TO documents")
+
+    conn.execute('''
+        CREATE TABLE blocs_v3 (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+            page INTEGER,
+            bloc_type TEXT,
+            contenu TEXT
+        )
+    ''')
+    # Les ids sont conservés : l'index FTS (rowid = blocs.id) reste valide
+    conn.execute('''
+        INSERT INTO blocs_v3 (id, document_id, page, bloc_type, contenu)
+        SELECT b.id, d.id, b.page, b.bloc_type, b.contenu
+        FROM blocs b JOIN documents d ON d.source = COALESCE(b.source, '')
+    ''')
+    for name in ("blocs_fts_ai", "blocs_fts_ad", "blocs_fts_au"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    conn.execute("DROP TABLE blocs")
+    conn.execute("ALTER TABLE blocs_v3 RENAME TO blocs")
+    for trigger in FTS_TRIGGERS:
+        conn.execute(trigger)
+
+
+def _migration_indexes(conn):
+    """v4 : index composites pour les requêtes chaudes (texte d'un cours, filtres par type)"""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_blocs_document_page ON blocs (document_id, page, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_blocs_type_document ON blocs (bloc_type, document_id)")
+
+
+# Migrations appliquées dans l'ordre ; PRAGMA user_version = nombre de migrations appliquées.
+# Ne jamais modifier une migration publiée : en ajouter une nouvelle à la fin.
+MIGRATIONS = [
+    _migration_initial_schema,
+    _migration_fts_index,
+    _migration_documents,
+    _migration_indexes,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """
+    Amène la base à SCHEMA_VERSION ; chaque migration s'exécute dans sa propre transaction
+    avec la mise à jour de user_version. Retourne la liste des versions appliquées.
+    """
+    applied = []
+    while schema_version(conn) < SCHEMA_VERSION:
+        conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Relecture sous verrou : un autre processus a pu migrer entre-temps
+            version = schema_version(conn)
+            if version < SCHEMA_VERSION:
+                MIGRATIONS[version](conn)
+                conn.execute(f"PRAGMA user_version = {version + 1}")
+                applied.append(version + 1)
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+    return applied
+
+
+def configure_for_load(conn):
+    """Pragmas de chargement : WAL et synchronous=NORMAL (sûr en WAL, bien moins de fsync)"""
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+
+
+def file_hash(filepath, chunk_size=1 << 20):
+    """Hash SHA-256 du contenu d'un fichier, lu par morceaux"""
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def document_hash(conn, source):
+    """Hash de contenu enregistré pour une source, ou None si elle n'a jamais été ingérée"""
+    row = conn.execute("SELECT content_hash FROM documents WHERE source = ?", (source,)).fetchone()
+    return row[0] if row else None
+
+
+def _bloc_row(document_id, bloc):
+    return (document_id, bloc.get('page', bloc.get('slide')), bloc.get('type'), bloc.get('text'))
+
+
+def insert_blocs(conn, document_id, blocs, batch_size=BATCH_SIZE):
+    """
+    Insère un itérable de blocs d'un document par lots avec executemany.
+    L'itérable n'est jamais matérialisé : au plus batch_size lignes sont en mémoire.
+    Une BlockTable fournit directement ses lignes, sans passer par des dicts.
+    Retourne le nombre de blocs insérés.
+    """
+    if hasattr(blocs, "db_rows"):
+        rows = blocs.db_rows(document_id)
+    else:
+        rows = (_bloc_row(document_id, bloc) for bloc in blocs)
+    total = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        with instrumentation.stage("sqlite_insert"):
+            conn.executemany('INSERT INTO blocs (document_id, page, bloc_type, contenu) VALUES (?, ?, ?, ?)', batch)
+        total += len(batch)
+    return total
+
+
+def ingest_blocs(conn, source, content_hash, blocs, batch_size=BATCH_SIZE, force=False):
+    """
+    Remplace atomiquement les blocs d'une source, dans une seule transaction.
+    Si le hash de contenu est déjà celui enregistré (et sans force), rien n'est fait
+    et None est retourné ; sinon retourne le nombre de blocs insérés.
+    Un index sémantique existant à côté de la base est mis à jour après le commit.
+    """
+    migrate(conn)
+    if not force and document_hash(conn, source) == content_hash:
+        return None
+
+    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("INSERT OR IGNORE INTO documents (source) VALUES (?)", (source,))
+        document_id = conn.execute("SELECT id FROM documents WHERE source = ?", (source,)).fetchone()[0]
+        conn.execute("UPDATE fts_sync SET enabled = 0")
+        conn.execute(
+            "INSERT INTO blocs_fts(blocs_fts, rowid, contenu)"
+            " SELECT 'delete', id, contenu FROM blocs WHERE document_id = ?",
+            (document_id,),
+        )
+        conn.execute("DELETE FROM blocs WHERE document_id = ?", (document_id,))
+        count = insert_blocs(conn, document_id, blocs, batch_size)
+        with instrumentation.stage("sqlite_fts"):
+            conn.execute(
+                "INSERT INTO blocs_fts(rowid, contenu) SELECT id, contenu FROM blocs WHERE document_id = ?",
+                (document_id,),
+            )
+        conn.execute("UPDATE fts_sync SET enabled = 1")
+        conn.execute(
+            "UPDATE documents SET content_hash = ?, bloc_count = ?, ingested_at = ? WHERE id = ?",
+            (content_hash, count, datetime.now(timezone.utc).isoformat(timespec="seconds"), document_id),
+        )
+    except BaseException:
+        conn.rollback()
+        raise
+    with instrumentation.stage("sqlite_commit"):
+        conn.commit()
+    sync_embeddings(conn)
+    return count
+
+
+def sync_embeddings(conn):
+    """
+    Met à jour l'index sémantique de la base de conn s'il a été construit (sinon ne fait
+    rien, sans importer NumPy). Retourne (blocs ajoutés, blocs retirés), ou None.
+    """
+    db_path = conn.execute("PRAGMA database_list").fetchone()[2]
+    if not db_path or not os.path.isdir(os.path.join(os.path.dirname(db_path), EMBEDDINGS_DIRNAME)):
+        return None
+    from embedding_index import get_index
+
+    with instrumentation.stage("embeddings_sync"):
+        return get_index(db_path).sync(conn)
+
+
+def fts_query(keyword, any_term=False):
+    """
+    Transforme une saisie libre en requête FTS5 : chaque mot est cité (pas d'opérateurs
+    involontaires) et cherché en préfixe, les mots sont combinés en ET (ou en OU avec any_term).
+    """
+    terms = ['"' + term.replace('"', '""') + '"*' for term in keyword.split()]
+    return (" OR " if any_term else " ").join(terms)
+
+
+class CorpusStore:
+    """
+    Accès partagé et durable à corpus.db : un pool de connexions de lecture réutilisables
+    entre threads et un unique écrivain protégé par un verrou. Les requêtes sont des
+    constantes de classe : chaque connexion garde ses statements préparés en cache
+    (cached_statements) d'un appel à l'autre.
+    """
+
+    SEARCH_SQL = (
+        "SELECT b.id, d.source, b.page, b.bloc_type, b.contenu, bm25(blocs_fts) AS score,"
+        " snippet(blocs_fts, 0, '[', ']', '…', 12)"
+        " FROM blocs_fts JOIN blocs b ON b.id = blocs_fts.rowid"
+        " JOIN documents d ON d.id = b.document_id"
+        " WHERE blocs_fts MATCH ?1"
+        " AND (?2 IS NULL OR d.source = ?2)"
+        " AND (?3 IS NULL OR b.bloc_type = ?3)"
+        " ORDER BY score LIMIT ?4 OFFSET ?5"
+    )
+    COURSE_SQL = (
+        "SELECT b.contenu FROM documents d JOIN blocs b ON b.document_id = d.id"
+        " WHERE d.source = ? ORDER BY b.page, b.id"
+    )
+    COURSE_BLOCS_SQL = (
+        "SELECT b.id, b.page, b.bloc_type, b.contenu FROM documents d JOIN blocs b ON b.document_id = d.id"
+        " WHERE d.source = ? ORDER BY b.page, b.id"
+    )
+    RANKED_SQL = (
+        "SELECT b.id, b.page, b.bloc_type, b.contenu, bm25(blocs_fts) AS score"
+        " FROM blocs_fts JOIN blocs b ON b.id = blocs_fts.rowid"
+        " JOIN documents d ON d.id = b.document_id"
+        " WHERE blocs_fts MATCH ? AND d.source = ?"
+        " ORDER BY score"
+    )
+    # Lookups par lots : listes IN de taille fixe (complétées par des NULL) pour
+    # réutiliser toujours le même statement préparé
+    LOOKUP_CHUNK = 64
+    COURSES_SQL = (
+        "SELECT d.source, b.contenu FROM documents d JOIN blocs b ON b.document_id = d.id"
+        " WHERE d.source IN ({}) ORDER BY b.document_id, b.page, b.id"
+        .format(",".join("?" * LOOKUP_CHUNK))
+    )
+    BLOCS_SQL = (
+        "SELECT b.id, d.source, b.page, b.bloc_type, b.contenu FROM blocs b"
+        " JOIN documents d ON d.id = b.document_id WHERE b.id IN ({})"
+        .format(",".join("?" * LOOKUP_CHUNK))
+    )
+
+    def __init__(self, db_path=DB_PATH, pool_size=4):
+        self.db_path = db_path
+        self._idle_readers = queue.LifoQueue()
+        self._reader_slots = threading.BoundedSemaphore(pool_size)
+        self._write_lock = threading.Lock()
+        self._writer = self._connect()
+        with self.writer() as conn:
+            migrate(conn)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=256)
+
+    @contextmanager
+    def reader(self):
+        """Emprunte une connexion de lecture au pool (bloque si toutes sont occupées)"""
+        with self._reader_slots:
+            try:
+                conn = self._idle_readers.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+                conn.execute("PRAGMA query_only = ON")
+            try:
+                yield conn
+            finally:
+                self._idle_readers.put(conn)
+
+    @contextmanager
+    def writer(self):
+        """Accès exclusif à l'unique connexion d'écriture"""
+        with self._write_lock:
+            yield self._writer
+
+    def close(self):
+        with self._write_lock:
+            self._writer.close()
+        while True:
+            try:
+                self._idle_readers.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def search(self, keyword, source=None, bloc_type=None, limit=None, offset=0):
+        """Recherche plein texte classée par BM25 (voir search_blocs)"""
+        query = fts_query(keyword)
+        if not query:
+            return []
+        params = (query, source or None, bloc_type or None, -1 if limit is None else limit, offset)
+        with self.reader() as conn:
+            rows = conn.execute(self.SEARCH_SQL, params).fetchall()
+        return [
+            {
+                "id": row[0],
+                "source": row[1],
+                "page": row[2],
+                "bloc_type": row[3],
+                "contenu": row[4],
+                "score": row[5],
+                "snippet": row[6],
+            }
+            for row in rows
+        ]
+
+    def course_text(self, source):
+        """Texte concaténé de tous les blocs d'une source, dans l'ordre du document"""
+        with self.reader() as conn:
+            return " ".join(row[0] for row in conn.execute(self.COURSE_SQL, (source,)))
+
+    def iter_course_blocs(self, source):
+        """Générateur paresseux des blocs d'une source dans l'ordre du document : (id, page, type, contenu)"""
+        with self.reader() as conn:
+            yield from conn.execute(self.COURSE_BLOCS_SQL, (source,))
+
+    def iter_ranked_blocs(self, source, query):
+        """
+        Générateur paresseux des blocs d'une source correspondant à une requête FTS5, du plus
+        pertinent au moins pertinent (BM25) : (id, page, type, contenu, score).
+        Arrêter l'itération libère la connexion sans lire la suite.
+        """
+        with self.reader() as conn:
+            yield from conn.execute(self.RANKED_SQL, (query, source))
+
+    def _chunks(self, values):
+        values = list(values)
+        for i in range(0, len(values), self.LOOKUP_CHUNK):
+            chunk = values[i:i + self.LOOKUP_CHUNK]
+            yield chunk + [None] * (self.LOOKUP_CHUNK - len(chunk))
+
+    def course_texts(self, sources):
+        """Texte de plusieurs sources en un aller-retour par paquet : {source: texte}"""
+        textes = {source: [] for source in sources}
+        with self.reader() as conn:
+            for chunk in self._chunks(textes):
+                for source, contenu in conn.execute(self.COURSES_SQL, chunk):
+                    textes[source].append(contenu)
+        return {source: " ".join(parts) for source, parts in textes.items()}
+
+    def get_blocs(self, ids):
+        """Blocs correspondant à une liste d'ids, dans l'ordre demandé"""
+        found = {}
+        with self.reader() as conn:
+            for chunk in self._chunks(ids):
+                for row in conn.execute(self.BLOCS_SQL, chunk):
+                    found[row[0]] = {
+                        "id": row[0],
+                        "source": row[1],
+                        "page": row[2],
+                        "bloc_type": row[3],
+                        "contenu": row[4],
+                    }
+        return [found[i] for i in ids if i in found]
+
+    def ingest(self, source, content_hash, blocs, force=False):
+        """Ingestion atomique et idempotente via l'écrivain unique (voir ingest_blocs)"""
+        with self.writer() as conn:
+            return ingest_blocs(conn, source, content_hash, blocs, force=force)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(db_path=DB_PATH):
+    """CorpusStore partagé par processus pour une base donnée"""
+    key = os.path.abspath(db_path)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = CorpusStore(db_path)
+        return _stores[key]
+
+
+# Requêtes chaudes et index qu'elles doivent utiliser (vérifié par check_query_plans)
+HOT_QUERIES = {
+    "texte d'un cours": (CorpusStore.COURSE_SQL, ("cours.pdf",), "idx_blocs_document_page"),
+    "filtre source + type": (
+        "SELECT b.id FROM blocs b JOIN documents d ON d.id = b.document_id"
+        " WHERE d.source = ? AND b.bloc_type = ?",
+        ("cours.pdf", "code_block"),
+        "idx_blocs_type_document",
+    ),
+    "filtre type": ("SELECT id FROM blocs WHERE bloc_type = ?", ("table",), "idx_blocs_type_document"),
+}
+
+
+def query_plan(conn, sql, params=()):
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def check_query_plans(conn):
+    """
+    Vérifie avec EXPLAIN QUERY PLAN que chaque requête chaude passe par son index et ne
+    trie pas avec un B-tree temporaire. Lève AssertionError sinon ; retourne les plans.
+    """
+    plans = {}
+    for name, (sql, params, index) in HOT_QUERIES.items():
+        plan = query_plan(conn, sql, params)
+        plans[name] = plan
+        assert any(index in step for step in plan), f"{name} : index {index} non utilisé ({plan})"
+        assert not any("TEMP B-TREE" in step for step in plan), f"{name} : tri temporaire ({plan})"
+        assert not any(step.startswith("SCAN b") or step == "SCAN blocs" for step in plan), \
+            f"{name} : parcours complet de blocs ({plan})"
+    return plans
+
+
+if __name__ == "__main__":
+    import sys
+
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+    conn = sqlite3.connect(db_path)
+    applied = migrate(conn)
+    if applied:
+        print(f"✅ {db_path} migrée (versions appliquées : {applied})")
+    print(f"Schéma en version {schema_version(conn)}/{SCHEMA_VERSION}")
+    conn.execute("ANALYZE")
+    for name, plan in check_query_plans(conn).items():
+        print(f"  - {name} : {' ; '.join(plan)}")
+    conn.close()
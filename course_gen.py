@@ -0,0 +1,168 @@
+import argparse
+import subprocess
+import sys
+import time
+
+# Point d'entrée unique : python course_gen.py <ingest|search|index|quiz|diagram> …
+# Chaque sous-commande importe ses modules à son exécution seulement, et ces modules
+# n'importent leurs dépendances lourdes (PyMuPDF, python-docx, python-pptx, NumPy, openai,
+# requests, python-dotenv) qu'au premier usage : une recherche ne paie que SQLite.
+
+DB_PATH = "corpus.db"  # comme corpus_db.DB_PATH, sans importer corpus_db au démarrage
+
+# Sous-commande → (module importé au démarrage, budget d'import en ms mesuré par -X importtime)
+STARTUP_BUDGETS = {
+    "cli": ("course_gen", 30),
+    "ingest": ("ingest", 60),
+    "search": ("search_blocs", 60),
+    "quiz": ("generate_quiz_from_course", 60),
+    "diagram": ("generer_visuel", 60),
+}
+# Aucune sous-commande ne doit les importer avant d'en avoir besoin
+HEAVY_MODULES = ("fitz", "pymupdf", "docx", "pptx", "numpy", "openai", "requests", "dotenv", "graphviz")
+
+
+def cmd_ingest(args):
+    from ingest import ingest_file
+
+    # Un index sémantique existant suit les ingestions (ajouts incrémentaux)
+    for path in args.paths:
+        start = time.perf_counter()
+        count = ingest_file(path, args.db, force=args.force, index=args.index)
+        if count is None:
+            print(f"⏭️  {path} inchangé, ignoré")
+        else:
+            print(f"✅ {path} : {count} blocs ingérés en {time.perf_counter() - start:.2f}s")
+
+
+def cmd_search(args):
+    if args.semantic:
+        from embedding_index import semantic_search as search
+    else:
+        from search_blocs import search_blocs as search
+
+    results = search(args.keyword, source=args.source, bloc_type=args.type, db_path=args.db, limit=args.limit)
+    for bloc in results:
+        snippet = bloc["snippet"] if "snippet" in bloc else f"({bloc['score']:.2f}) {bloc['contenu'][:80]}"
+        print(f"- [{bloc['source']}][page {bloc['page']}][{bloc['bloc_type']}] {snippet}")
+    if not results:
+        print(f"Aucun bloc ne contient '{args.keyword}'.")
+
+
+def cmd_index(args):
+    from embedding_index import get_index, sync_index
+
+    start = time.perf_counter()
+    added, removed = sync_index(args.db, args.model, rebuild=args.rebuild)
+    print(f"✅ Index sémantique : {added} blocs ajoutés, {removed} retirés, {len(get_index(args.db))} au total "
+          f"en {time.perf_counter() - start:.1f}s")
+
+
+def cmd_quiz(args):
+    from generate_quiz_from_course import run_quiz
+
+    run_quiz(args.source)
+
+
+def cmd_diagram(args):
+    from generer_visuel import main_full, main_stream
+
+    print(f"Génération de diagramme pour : {args.source}\nRequête : {args.request}")
+    (main_stream if args.stream else main_full)(args.source, args.request)
+
+
+# ---- Mesure du démarrage ----
+
+def import_times(module):
+    """
+    Importe module dans un interpréteur neuf avec -X importtime.
+    Retourne (temps cumulé de l'import en ms, noms de tous les modules importés).
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True, check=True)
+    cumulative = None
+    modules = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumul, name = line.split("|")
+        if not cumul.strip().isdigit():
+            continue  # ligne d'en-tête
+        modules.add(name.strip())
+        if name.strip() == module and not name[1:].startswith(" "):
+            cumulative = int(cumul) / 1000
+    return cumulative, modules
+
+
+def check_startup(repeat=5):
+    """Compare le temps d'import de chaque sous-commande à son budget ; retourne la liste des échecs"""
+    failures = []
+    for command, (module, budget) in STARTUP_BUDGETS.items():
+        runs = [import_times(module) for _ in range(repeat)]
+        best = min(ms for ms, _ in runs)
+        heavy = sorted(name for name in runs[0][1] if name.split(".")[0] in HEAVY_MODULES)
+        ok = best <= budget and not heavy
+        print(f"{'✅' if ok else '❌'} {command:<8} import {module} : {best:6.1f} ms (budget {budget} ms)"
+              + (f" — importe {', '.join(heavy)}" if heavy else ""))
+        if not ok:
+            failures.append(command)
+    return failures
+
+
+def cmd_startup(args):
+    failures = check_startup(args.repeat)
+    sys.exit(1 if failures else 0)
+
+
+# ---- MAIN ----
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="course-gen", description="Cours → blocs, recherche, quiz et diagrammes")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest = commands.add_parser("ingest", help="ingère des cours (PDF, DOCX, PPTX) dans la base")
+    ingest.add_argument("paths", nargs="+", help="fichiers à ingérer")
+    ingest.add_argument("--db", default=DB_PATH, help="base SQLite")
+    ingest.add_argument("--force", action="store_true", help="ré-ingère même si le fichier est inchangé")
+    ingest.add_argument("--index", action="store_true",
+                        help="met aussi à jour l'index sémantique (toujours fait s'il existe déjà)")
+    ingest.set_defaults(func=cmd_ingest)
+
+    search = commands.add_parser("search", help="recherche plein texte dans les blocs")
+    search.add_argument("keyword", help="mot-clé ou expression")
+    search.add_argument("--source", help="limite à un cours (nom du fichier)")
+    search.add_argument("--type", help="limite à un type de bloc (paragraph, code_block…)")
+    search.add_argument("--limit", type=int, default=20, help="nombre de résultats")
+    search.add_argument("--db", default=DB_PATH, help="base SQLite")
+    search.add_argument("--semantic", action="store_true", help="recherche par proximité dans l'index sémantique")
+    search.set_defaults(func=cmd_search)
+
+    index = commands.add_parser("index", help="construit ou met à jour l'index sémantique des blocs")
+    index.add_argument("--db", default=DB_PATH, help="base SQLite")
+    index.add_argument("--model", help="modèle sentence-transformers local (défaut : EMBED_MODEL ou hachage)")
+    index.add_argument("--rebuild", action="store_true", help="repart de zéro (changement de modèle)")
+    index.set_defaults(func=cmd_index)
+
+    quiz = commands.add_parser("quiz", help="génère un quiz à partir d'un cours")
+    quiz.add_argument("source", help="nom du cours dans la base")
+    quiz.set_defaults(func=cmd_quiz)
+
+    diagram = commands.add_parser("diagram", help="génère un diagramme et son explication")
+    diagram.add_argument("source", help="nom du cours dans la base")
+    diagram.add_argument("request", help="requête en langage naturel")
+    diagram.add_argument("--stream", action="store_true", help="affiche l'explication au fil de l'eau")
+    diagram.set_defaults(func=cmd_diagram)
+
+    startup = commands.add_parser("startup", help="vérifie le budget de temps d'import de chaque sous-commande")
+    startup.add_argument("--repeat", type=int, default=5, help="mesures par sous-commande (la meilleure compte)")
+    startup.set_defaults(func=cmd_startup)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
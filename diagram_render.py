@@ -0,0 +1,219 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+import subprocess
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from corpus_db import DB_PATH
+
+# Cache stocké à côté de corpus.db
+RENDER_CACHE_PATH = os.path.join(os.path.dirname(DB_PATH), "render_cache.db")
+# À incrémenter si la chaîne de rendu change (moteur, options) : invalide tout le cache
+RENDER_VERSION = b"1"
+DOT_ENGINE = "dot"
+# Nombre maximal de processus `dot` simultanés (tous appels confondus)
+MAX_DOT_PROCESSES = int(os.getenv("MAX_DOT_PROCESSES", os.cpu_count() or 2))
+RENDER_TIMEOUT = 30.0  # secondes par diagramme
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+
+class RenderError(Exception):
+    pass
+
+
+def render_key(dot_source, fmt):
+    """Hash du texte DOT exact envoyé à Graphviz et du format de sortie"""
+    digest = hashlib.sha256(RENDER_VERSION)
+    digest.update(fmt.encode() + b"\0")
+    digest.update(dot_source.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class DiagramRenderer:
+    """
+    Rendu Graphviz avec cache adressé par le contenu : un texte DOT déjà rendu dans le même
+    format n'est jamais re-rendu. Les rendus manquants passent par un pool de threads dont
+    chacun pilote un processus `dot` (au plus max_processes à la fois, avec un délai
+    maximal par diagramme) ; deux demandes identiques en cours partagent le même rendu.
+    """
+
+    def __init__(self, path=RENDER_CACHE_PATH, max_processes=MAX_DOT_PROCESSES, timeout=RENDER_TIMEOUT,
+                 max_bytes=DEFAULT_MAX_BYTES, engine=DOT_ENGINE):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.engine = engine
+        self.stats = {"hits": 0, "renders": 0, "errors": 0}
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.pool = ThreadPoolExecutor(max_workers=max_processes, thread_name_prefix="dot")
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS renders (
+                key TEXT PRIMARY KEY,
+                format TEXT NOT NULL,
+                data BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+        ''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_renders_last_access ON renders (last_access)")
+        self.conn.commit()
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+        self.conn.close()
+
+    def _get(self, key):
+        with self._lock:
+            row = self.conn.execute("SELECT data FROM renders WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE renders SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            self.stats["hits"] += 1
+        return bytes(row[0])
+
+    def _put(self, key, fmt, data):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO renders (key, format, data, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, fmt, data, len(data), time.time()),
+            )
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        """Évince les rendus les moins récemment utilisés jusqu'à repasser sous max_bytes"""
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM renders").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        freed = 0
+        victims = []
+        for key, size in self.conn.execute("SELECT key, size FROM renders ORDER BY last_access"):
+            victims.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self.conn.executemany("DELETE FROM renders WHERE key = ?", victims)
+
+    def _render(self, key, dot_source, fmt):
+        try:
+            result = subprocess.run([self.engine, f"-T{fmt}"], input=dot_source.encode("utf-8"),
+                                    capture_output=True, timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            raise RenderError(f"rendu {fmt} interrompu après {self.timeout:g}s")
+        if result.returncode != 0:
+            raise RenderError(result.stderr.decode("utf-8", "replace").strip() or f"{self.engine} a échoué")
+        self._put(key, fmt, result.stdout)
+        return result.stdout
+
+    def _done(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            if future.exception() is None:
+                self.stats["renders"] += 1
+            else:
+                self.stats["errors"] += 1
+
+    def submit(self, dot_source, fmt="svg"):
+        """Future du rendu de dot_source (résolue immédiatement si le rendu est en cache)"""
+        key = render_key(dot_source, fmt)
+        data = self._get(key)
+        if data is not None:
+            future = Future()
+            future.set_result(data)
+            return future
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future
+            future = self._inflight[key] = self.pool.submit(self._render, key, dot_source, fmt)
+        # Hors du verrou : un rendu déjà terminé (dot absent…) appelle _done ici même, qui prend _lock
+        future.add_done_callback(lambda f: self._done(key, f))
+        return future
+
+    def render(self, dot_source, fmt="svg"):
+        return self.submit(dot_source, fmt).result()
+
+    def render_many(self, dot_sources, fmt="svg"):
+        """
+        Rend plusieurs diagrammes en parallèle ; retourne, dans l'ordre, les octets rendus
+        ou l'exception levée pour chacun.
+        """
+        futures = [self.submit(dot_source, fmt) for dot_source in dot_sources]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as exc:
+                results.append(exc)
+        return results
+
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+
+def get_renderer():
+    """Moteur de rendu partagé par processus (un seul plafond de processus `dot`)"""
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            _renderer = DiagramRenderer()
+        return _renderer
+
+
+# ---- MAIN ----
+
+if __name__ == "__main__":
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Rendu Graphviz en lot avec cache des diagrammes déjà rendus")
+    parser.add_argument("paths", nargs="*", help="fichiers .dot à rendre (sortie à côté, même nom)")
+    parser.add_argument("-T", "--format", default="svg", help="format de sortie (svg, png…)")
+    parser.add_argument("-j", "--processes", type=int, default=MAX_DOT_PROCESSES, help="processus dot simultanés")
+    parser.add_argument("--timeout", type=float, default=RENDER_TIMEOUT, help="délai maximal par diagramme (s)")
+    parser.add_argument("--bench", type=int, metavar="DIAGRAMS", help="benchmark sur DIAGRAMS diagrammes synthétiques")
+    args = parser.parse_args()
+
+    if args.bench:
+        with tempfile.TemporaryDirectory() as tmp:
+            sources = [f"digraph G{i} {{ rankdir=LR; " + " ".join(f"n{j} -> n{j + 1};" for j in range(i % 20 + 5)) + " }"
+                       for i in range(args.bench)]
+            timings = {}
+            for label, processes in [("1 processus", 1), (f"{args.processes} processus", args.processes)]:
+                renderer = DiagramRenderer(os.path.join(tmp, f"{processes}.db"), max_processes=processes,
+                                           timeout=args.timeout)
+                start = time.perf_counter()
+                renderer.render_many(sources, args.format)
+                timings[label] = time.perf_counter() - start
+                start = time.perf_counter()
+                renderer.render_many(sources, args.format)
+                timings[f"{label}, cache chaud"] = time.perf_counter() - start
+                renderer.close()
+        print(f"⏱️  {args.bench} diagrammes {args.format} :")
+        for label, seconds in timings.items():
+            print(f"  - {label} : {seconds:.2f}s")
+
+    if args.paths:
+        renderer = DiagramRenderer(max_processes=args.processes, timeout=args.timeout)
+        sources = []
+        for path in args.paths:
+            with open(path, encoding="utf-8") as f:
+                sources.append(f.read())
+        for path, result in zip(args.paths, renderer.render_many(sources, args.format)):
+            if isinstance(result, Exception):
+                print(f"❌ {path} : {result}")
+                continue
+            output_path = os.path.splitext(path)[0] + "." + args.format
+            with open(output_path, "wb") as f:
+                f.write(result)
+            print(f"✅ {output_path}")
+        print(f"{renderer.stats['hits']} depuis le cache, {renderer.stats['renders']} rendus, "
+              f"{renderer.stats['errors']} erreurs")
+        renderer.close()
@@ -0,0 +1,345 @@
+import argparse
+import re
+import time
+
+# Seuls les jetons significatifs sont reconnus ; le texte entre deux jetons est recopié tel quel.
+# Les chaînes et commentaires sont lus en entier pour ne rien corriger à l'intérieur.
+# (Le préfixe (?=[/"<lc]) permet au moteur de sauter directement aux candidats.)
+TOKEN_PATTERN = re.compile(r'''(?=[/"<lc])(?:
+      (?P<comment>//[^\n]*|/\*.*?(?:\*/|\Z))
+    | (?P<string>"(?:[^"\\]|\\.)*(?:"|\Z))
+    | (?P<label>\blabel\s*=\s*(?=["<\[]))
+    | (?P<klass>\bclass\s+(?=[^\W\d]))
+    | (?P<html><)
+)''', re.VERBOSE | re.DOTALL)
+ANGLE_PATTERN = re.compile(r"[<>]")
+PORT_PATTERN = re.compile(r"<f\d+>")
+
+# Corrections dans le texte d'un label (chacune n'est tentée que si le label peut être concerné)
+LABEL_ANGLE_PATTERN = re.compile(r"<f\d+>|[<>]")          # ports <fN> et chevrons des pseudo-labels HTML
+LABEL_PRIVATE_PATTERN = re.compile(r"\|\s*-")             # "| -" → "|_"
+LABEL_STRAY_BAR_PATTERN = re.compile(r"\|\s*(?=\}|\Z)")  # "|" orphelin avant "}" ou en fin
+
+# Contexte d'une liste d'attributs [...] : forme donnée, et instruction qui la précède
+LIST_BRACKET_PATTERN = re.compile(r"[\[\];{}\n]")
+SHAPE_PATTERN = re.compile(r'\bshape\s*=\s*"?(\w+)')
+RECORD_SHAPES = {"record", "Mrecord"}
+
+
+def _scan_html(text, start):
+    """Fin (exclue) de la chaîne HTML ouverte en start, ou None si elle n'est pas refermée"""
+    depth = 0
+    for match in ANGLE_PATTERN.finditer(text, start):
+        if match.group() == "<":
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return match.end()
+    return None
+
+
+def tokenize(dot_code):
+    """
+    Découpe un texte DOT en jetons (type, texte) : comment, string, html, label (« label = »),
+    bracket (valeur label=[...]), klass (« class » devant un nom) et text pour tout le reste.
+    La concaténation des textes redonne exactement l'entrée.
+    """
+    pos = 0
+    size = len(dot_code)
+    while pos < size:
+        match = TOKEN_PATTERN.search(dot_code, pos)
+        if match is None:
+            break
+        start, end, kind = match.start(), match.end(), match.lastgroup
+        if kind == "html":
+            end = _scan_html(dot_code, start)
+            if end is None:
+                # Chevron jamais refermé (réponse tronquée) : le reste est recopié tel quel,
+                # ce qui évite de re-parcourir la fin du texte depuis chaque "<" suivant
+                end, kind = size, "text"
+        if start > pos:
+            yield "text", dot_code[pos:start]
+        yield kind, dot_code[start:end]
+        pos = end
+        if kind == "label" and dot_code.startswith("[", pos):
+            close = dot_code.find("]", pos)
+            if close != -1:
+                yield "bracket", dot_code[pos:close + 1]
+                pos = close + 1
+    if pos < size:
+        yield "text", dot_code[pos:]
+
+
+def clean_label_text(text):
+    """
+    Répare le texte d'un label d'enregistrement (sans les guillemets) : ports <fN> et chevrons,
+    \\n (centré) → \\l (aligné à gauche), "| -" → "|_", "|" orphelins, accolades manquantes.
+    """
+    if "<" in text or ">" in text:
+        text = LABEL_ANGLE_PATTERN.sub("", text)
+    if "\\n" in text:
+        text = text.replace("\\n", "\\l")
+    if "|" in text:
+        text = LABEL_PRIVATE_PATTERN.sub("|_", text)
+        text = LABEL_STRAY_BAR_PATTERN.sub("", text)
+        if "|" in text and not text.lstrip().startswith("{"):
+            text = "{" + text + "}"
+    return text
+
+
+def _quote(text):
+    return '"' + text.replace('"', '\\"') + '"'
+
+
+def _is_ai_html_label(html):
+    """<{a|b}> : label d'enregistrement écrit à tort comme une chaîne HTML"""
+    return html.startswith("<{") and html.endswith("}>")
+
+
+def _forced_record(kind, text):
+    """Valeur de label écrite comme un enregistrement quel que soit le nœud : <{...}>, [...], ports <fN>"""
+    if kind == "html":
+        return _is_ai_html_label(text)
+    if kind == "bracket":
+        return True
+    return kind == "string" and (text[1:].lstrip().startswith("<{") or PORT_PATTERN.search(text) is not None)
+
+
+def record_labels(tokens):
+    """
+    Indices des valeurs de label (jetons suivant un jeton « label = ») à réparer comme labels
+    d'enregistrement : formes propres aux enregistrements (<{...}>, label=[...], ports <fN>),
+    ou nœud de forme record/Mrecord, donnée dans sa liste d'attributs ou par un
+    « node [shape=record] » précédent. Les labels d'arcs, du graphe et des autres nœuds n'en font pas partie.
+    """
+    records = set()
+    default_record = False
+    statement = []        # textes hors liste depuis le début de l'instruction
+    in_list = False
+    list_text = []        # textes de la liste d'attributs en cours
+    list_labels = []      # indices de ses valeurs de label
+    after_label = False
+    for i, (kind, text) in enumerate(tokens):
+        if after_label:
+            after_label = False
+            if _forced_record(kind, text):
+                records.add(i)
+            elif in_list:
+                list_labels.append(i)
+        if kind == "label":
+            after_label = True
+        if kind == "comment":
+            continue
+        if kind != "text":
+            (list_text if in_list else statement).append(text)
+            continue
+        pos = 0
+        for match in LIST_BRACKET_PATTERN.finditer(text):
+            char = match.group()
+            if in_list:
+                if char != "]":
+                    continue
+                list_text.append(text[pos:match.start()])
+                shape = SHAPE_PATTERN.search("".join(list_text))
+                head = "".join(statement).strip()
+                if head == "node":
+                    if shape:
+                        default_record = shape.group(1) in RECORD_SHAPES
+                elif head not in ("edge", "graph") and "->" not in head and "--" not in head:
+                    if (shape.group(1) in RECORD_SHAPES) if shape else default_record:
+                        records.update(list_labels)
+                in_list = False
+                list_text, list_labels, statement = [], [], []
+            elif char == "[":
+                statement.append(text[pos:match.start()])
+                in_list = True
+            else:
+                statement = []
+            pos = match.end()
+        (list_text if in_list else statement).append(text[pos:])
+    return records
+
+
+def normalize_tokens(tokens):
+    """
+    Répare en un seul passage les erreurs fréquentes des modèles dans le DOT généré :
+    labels <{...}> ou label=[...], ports <fN>, mot-clé `class` devant un nœud,
+    séparateurs | orphelins. Seuls les labels d'enregistrement (voir record_labels) sont
+    réécrits ; les autres labels (« x > 0 », « List<Item> », \\n centrés), les flèches et les
+    vrais labels HTML sont conservés.
+    """
+    tokens = list(tokens)
+    records = record_labels(tokens)
+    in_label = False
+    for i, (kind, text) in enumerate(tokens):
+        if in_label:
+            in_label = False
+            if kind == "string":
+                closed = len(text) > 1 and text.endswith('"')
+                if i in records:
+                    yield '"' + clean_label_text(text[1:-1] if closed else text[1:]) + '"'
+                else:
+                    yield text if closed else text + '"'
+                continue
+            if i in records:
+                yield _quote(clean_label_text(text[1:-1].strip() if kind == "bracket" else text[1:-1]))
+                continue
+        if kind == "label":
+            in_label = True
+        elif kind == "klass":
+            continue
+        elif kind == "html" and PORT_PATTERN.fullmatch(text):
+            continue
+        yield text
+
+
+def clean_dot_labels(dot_code: str) -> str:
+    """Nettoie le DOT produit par le modèle (un seul passage, temps linéaire)"""
+    return "".join(normalize_tokens(tokenize(dot_code)))
+
+
+def clean_dot_labels_regex(dot_code: str) -> str:
+    """
+    Ancienne version (13 substitutions successives), conservée comme référence pour le
+    benchmark. Elle supprime aussi les chevrons des flèches (-> devient -) et remplace
+    tous les "];" par "};", ce qui casse la plupart des graphes.
+    """
+    dot_code = re.sub(r'label="\s*<\{([^}]*)\}>"', r'label="{\1}"', dot_code)
+    dot_code = re.sub(r'<\{([^}]*)\}>', r'{\1}', dot_code)
+    dot_code = re.sub(r'<f\d+>', '', dot_code)
+    dot_code = re.sub(r'label=\[', 'label={', dot_code)
+    dot_code = re.sub(r'\];', '};', dot_code)
+    dot_code = re.sub(r'label="([^"]+)"', lambda m: f'label="{{{m.group(1)}}}"' if not m.group(1).startswith('{') else m.group(0), dot_code)
+    dot_code = re.sub(r'\|\s*-', '|_', dot_code)
+    dot_code = dot_code.replace('\\n', '\\l')
+    dot_code = dot_code.replace('<', '').replace('>', '')
+    dot_code = re.sub(r'\|\s*}', '}', dot_code)
+    dot_code = re.sub(r'class\s+([A-Za-z0-9_]+)->([A-Za-z0-9_]+)(\[label=.*?\];)', r'\1 -> \2\3', dot_code)
+    dot_code = re.sub(r'class\s+([A-Za-z0-9_]+)\[', r'\1[', dot_code)
+    return dot_code
+
+
+# Erreurs rencontrées dans les réponses des modèles : (entrée, sortie attendue)
+DOT_FIXTURES = [
+    # DOT valide : inchangé
+    ('digraph G {\n  a -> b [color=red];\n  b -> c;\n}',
+     'digraph G {\n  a -> b [color=red];\n  b -> c;\n}'),
+    ('graph G { a -- b; label="Titre"; }',
+     'graph G { a -- b; label="Titre"; }'),
+    # Label d'enregistrement écrit comme chaîne HTML, avec ou sans guillemets
+    ('Animal [shape=record, label=<{Animal|+ nom : String|+ crier()}>];',
+     'Animal [shape=record, label="{Animal|+ nom : String|+ crier()}"];'),
+    ('Animal [label="<{Animal|+ nom}>"];',
+     'Animal [label="{Animal|+ nom}"];'),
+    # Ports <fN> et | orphelins
+    ('Chien [label="<f0> Chien|<f1> + aboyer()|"];',
+     'Chien [label="{ Chien| + aboyer()}"];'),
+    ('Chat [shape=record, label="{Chat|+ miauler()|}"];',
+     'Chat [shape=record, label="{Chat|+ miauler()}"];'),
+    ('node [shape=record];\nChat [label="Chat|+ miauler()|"];',
+     'node [shape=record];\nChat [label="{Chat|+ miauler()}"];'),
+    # label=[...] au lieu d'une chaîne
+    ('Point [label=[Point|x : int|y : int]];',
+     'Point [label="{Point|x : int|y : int}"];'),
+    # Mot-clé `class` devant les nœuds et les arcs
+    ('class Chien -> Animal [label="hérite"];',
+     'Chien -> Animal [label="hérite"];'),
+    ('class Chien[label="{Chien}"];',
+     'Chien[label="{Chien}"];'),
+    ('a [class="important"];',
+     'a [class="important"];'),
+    # Attributs privés et retours à la ligne d'un enregistrement
+    ('Compte [label="Compte|- solde : double\\n- id : int", shape=Mrecord];',
+     'Compte [label="{Compte|_ solde : double\\l- id : int}", shape=Mrecord];'),
+    # Labels ordinaires : comparaisons, génériques, \n centrés, || hors enregistrement
+    ('test [shape=diamond, label="x > 0 ?"];\ntest -> fin [label="i < n"];',
+     'test [shape=diamond, label="x > 0 ?"];\ntest -> fin [label="i < n"];'),
+    ('Panier [shape=box, label="List<Item>\\nMap<String, Double>"];',
+     'Panier [shape=box, label="List<Item>\\nMap<String, Double>"];'),
+    ('debut [label="Début\\ndu programme"];',
+     'debut [label="Début\\ndu programme"];'),
+    ('cond [label="a || b"];',
+     'cond [label="a || b"];'),
+    # Arc après node [shape=record] : son label n'est pas un enregistrement
+    ('node [shape=record];\nA -> B [label="x > 0 | y"];',
+     'node [shape=record];\nA -> B [label="x > 0 | y"];'),
+    # Vrai label HTML : conservé
+    ('n [label=<<b>gras</b>>];',
+     'n [label=<<b>gras</b>>];'),
+    # Commentaires et chaînes non refermées
+    ('// class Chien -> Animal\na -> b; /* label=<{x}> */',
+     '// class Chien -> Animal\na -> b; /* label=<{x}> */'),
+    ('a [label="ouvert',
+     'a [label="ouvert"'),
+]
+
+
+def check_fixtures():
+    failures = []
+    for source, expected in DOT_FIXTURES:
+        result = clean_dot_labels(source)
+        if result != expected:
+            failures.append((source, expected, result))
+    return failures
+
+
+def synthetic_class_diagram(class_count, seed=0):
+    """Grand diagramme de classes « façon IA » : labels HTML, ports, `class X->Y`, | orphelins"""
+    import random
+
+    rng = random.Random(seed)
+    lines = ["digraph Classes {", "  node [shape=record];"]
+    for i in range(class_count):
+        fields = "|".join(f"<f{j}> - champ{j} : int" for j in range(rng.randint(2, 8)))
+        methods = "\\n".join(f"+ methode{j}()" for j in range(rng.randint(1, 6)))
+        if i % 2:
+            lines.append(f"  C{i} [label=<{{C{i}|{fields}|{methods}|}}>];")
+        else:
+            lines.append(f'  C{i} [label="C{i}|{fields}|{methods}"];')
+        if i:
+            lines.append(f'  class C{i}->C{rng.randrange(i)} [label="hérite"];')
+    lines.append("}")
+    return "\n".join(lines)
+
+
+def truncated_response(fragment_count):
+    """Réponse coupée en plein label : des milliers de <{ jamais refermés"""
+    return "digraph G {\n" + "n [label=<{x|y " * fragment_count
+
+
+def benchmark(sizes=(100, 1000, 5000, 20000), truncated_sizes=(1000, 2000, 4000)):
+    """Temps des deux versions sur de grands diagrammes, puis sur des réponses tronquées"""
+    timings = []
+    cases = [("classes", size, synthetic_class_diagram(size)) for size in sizes]
+    cases += [("tronquée", size, truncated_response(size)) for size in truncated_sizes]
+    for case, size, dot_code in cases:
+        row = {"case": case, "size": size, "bytes": len(dot_code)}
+        for name, fn in [("tokenizer", clean_dot_labels), ("regex", clean_dot_labels_regex)]:
+            start = time.perf_counter()
+            fn(dot_code)
+            row[name] = time.perf_counter() - start
+        timings.append(row)
+    return timings
+
+
+# ---- MAIN ----
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Nettoyage du DOT généré par le modèle")
+    parser.add_argument("path", nargs="?", help="fichier .dot à nettoyer (sortie sur stdout)")
+    parser.add_argument("--bench", action="store_true", help="benchmark sur de grands diagrammes synthétiques")
+    args = parser.parse_args()
+
+    if args.path:
+        with open(args.path, encoding="utf-8") as f:
+            print(clean_dot_labels(f.read()))
+    else:
+        failures = check_fixtures()
+        for source, expected, result in failures:
+            print(f"❌ {source!r}\n   attendu : {expected!r}\n   obtenu  : {result!r}")
+        print(f"{'✅' if not failures else '❌'} {len(DOT_FIXTURES) - len(failures)}/{len(DOT_FIXTURES)} fixtures")
+    if args.bench:
+        for row in benchmark():
+            print(f"⏱️  {row['case']:<8} {row['size']:>6} ({row['bytes'] / 1024:5.0f} Ko) : "
+                  f"tokenizer {row['tokenizer'] * 1000:7.1f} ms, regex {row['regex'] * 1000:7.1f} ms")
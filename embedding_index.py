@@ -0,0 +1,492 @@
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+import zlib
+
+import numpy as np
+
+from corpus_db import DB_PATH, EMBEDDINGS_DIRNAME, get_store, migrate
+
+# Index sémantique des blocs, à côté de corpus.db : une matrice float32 (une ligne par bloc,
+# vecteurs normalisés) lue par mmap, alignée sur un tableau des ids de blocs.
+# corpus_db.ingest_blocs le met à jour après chaque ingestion dès qu'il existe.
+INDEX_DIRNAME = EMBEDDINGS_DIRNAME
+# Modèle local (nom ou chemin sentence-transformers) ; sans modèle, repli sur le hachage
+EMBED_MODEL_ENV = "EMBED_MODEL"
+# 128 composantes : 512 Mo pour 1M blocs, balayés en quelques dizaines de ms sur un cœur
+EMBED_DIM = 128
+NGRAM_SIZES = (3, 4, 5)
+SYNC_BATCH = 4096
+TOP_K = 10
+# Au-delà de cette part de lignes mortes (blocs supprimés ou ré-ingérés), l'index est compacté
+MAX_DEAD_RATIO = 0.5
+
+WORD_RE = re.compile(r"\w+")
+
+
+def index_path(db_path=DB_PATH):
+    return os.path.join(os.path.dirname(db_path), INDEX_DIRNAME)
+
+
+def _strip_accents(word):
+    return "".join(c for c in unicodedata.normalize("NFKD", word) if not unicodedata.combining(c))
+
+
+class HashingEmbedder:
+    """
+    Repli sans téléchargement : chaque mot (sans accents) et ses n-grammes de caractères, qui
+    rapprochent « héritage » et « hérite », sont hachés dans dim composantes signées ; le
+    vecteur d'un texte est la somme des vecteurs de ses mots, normalisée.
+    Les vecteurs de mots sont calculés une fois et gardés en colonnes creuses (CSR) : un
+    paquet de textes s'encode en une passe Python sur les mots puis quelques opérations NumPy.
+    """
+
+    uses_idf = True
+
+    def __init__(self, dim=EMBED_DIM, ngrams=NGRAM_SIZES):
+        self.dim = dim
+        self.ngrams = ngrams
+        self.name = f"hashing-{dim}"
+        self._word_ids = {}
+        # Vecteurs de mots : composantes et poids de chaque mot, à la suite (indptr en bornes)
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._buckets = np.zeros(0, dtype=np.int64)
+        self._weights = np.zeros(0, dtype=np.float64)
+        self._pending = []
+
+    def _add_word(self, word):
+        """Id d'un mot nouveau ; ses composantes rejoignent la CSR au prochain encodage"""
+        base = _strip_accents(word)
+        padded = f"<{base}>"
+        features = [base] + [padded[i:i + n] for n in self.ngrams for i in range(len(padded) - n + 1)]
+        hashes = [zlib.crc32(feature.encode("utf-8")) for feature in features]
+        scale = 1 / math.sqrt(len(hashes))
+        self._pending.append(([h % self.dim for h in hashes],
+                              [scale if h & 0x80000000 else -scale for h in hashes]))
+        word_id = self._word_ids[word] = len(self._word_ids)
+        return word_id
+
+    def _flush_pending(self):
+        if not self._pending:
+            return
+        lengths = [len(buckets) for buckets, _ in self._pending]
+        self._indptr = np.concatenate([self._indptr, self._indptr[-1] + np.cumsum(lengths)])
+        self._buckets = np.concatenate([self._buckets] + [np.array(b, dtype=np.int64) for b, _ in self._pending])
+        self._weights = np.concatenate([self._weights] + [np.array(w, dtype=np.float64) for _, w in self._pending])
+        self._pending = []
+
+    def tokenize(self, texts):
+        """(ids de mots de tous les textes à la suite, nombre de mots par texte, mots de chaque texte)"""
+        word_ids = self._word_ids
+        words_per_text = [WORD_RE.findall(text.lower()) for text in texts]
+        ids = [word_ids[w] if w in word_ids else self._add_word(w) for words in words_per_text for w in words]
+        self._flush_pending()
+        return np.array(ids, dtype=np.int64), [len(words) for words in words_per_text], words_per_text
+
+    def embed(self, texts, word_weights=None):
+        """Matrice float32 (len(texts), dim) de vecteurs normalisés ; word_weights : poids par occurrence"""
+        word_ids, lengths, _ = self.tokenize(texts)
+        return self.embed_tokens(word_ids, lengths, word_weights)
+
+    def embed_tokens(self, word_ids, lengths, word_weights=None):
+        n = len(lengths)
+        starts = self._indptr[word_ids]
+        counts = self._indptr[word_ids + 1] - starts
+        # Position de chaque composante de chaque occurrence de mot dans la CSR
+        ends = np.cumsum(counts)
+        positions = np.repeat(starts - (ends - counts), counts) + np.arange(ends[-1] if len(ends) else 0)
+        rows = np.repeat(np.repeat(np.arange(n), lengths), counts)
+        weights = self._weights[positions]
+        if word_weights is not None:
+            weights = weights * np.repeat(word_weights, counts)
+        vectors = np.bincount(rows * self.dim + self._buckets[positions], weights=weights,
+                              minlength=n * self.dim).reshape(n, self.dim)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return (vectors / np.where(norms == 0, 1, norms)).astype(np.float32)
+
+
+class SentenceTransformerEmbedder:
+    """Modèle local sentence-transformers (dépendance optionnelle, chargée à la création)"""
+
+    uses_idf = False
+
+    def __init__(self, model_name):
+        from sentence_transformers import SentenceTransformer
+
+        self.name = model_name
+        self.model = SentenceTransformer(model_name)
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def embed(self, texts):
+        return self.model.encode(list(texts), batch_size=64, normalize_embeddings=True,
+                                 convert_to_numpy=True).astype(np.float32)
+
+
+def get_embedder(model=None):
+    """
+    Encodeur nommé model (ou EMBED_MODEL) ; "hashing-<dim>" ou rien : repli par hachage.
+    Un encodeur est tout objet ayant name, dim, uses_idf et embed(texts) → float32 normalisé.
+    """
+    model = model or os.getenv(EMBED_MODEL_ENV)
+    if not model or model.startswith("hashing-"):
+        return HashingEmbedder(int(model.split("-", 1)[1]) if model else EMBED_DIM)
+    try:
+        return SentenceTransformerEmbedder(model)
+    except ImportError:
+        print(f"⚠️  sentence-transformers absent : repli sur l'encodage par hachage au lieu de {model}")
+        return HashingEmbedder()
+
+
+class EmbeddingIndex:
+    """
+    Index sémantique persistant : vectors.f32 (count × dim), ids.i64 et docs.i32 (id du bloc
+    et du document de chaque ligne), meta.json. Les fichiers ne font que grandir : un ajout
+    écrit ses lignes à la fin puis remplace meta.json, qui fait foi pour le nombre de lignes.
+    Un bloc supprimé garde sa ligne, marquée morte (id -1), jusqu'au compactage.
+    Pour le repli par hachage, df.json compte les blocs contenant chaque mot, pour l'IDF de
+    la requête (approché : les blocs retirés ne sont pas décomptés).
+    """
+
+    def __init__(self, path, embedder=None):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        meta = self._read_meta()
+        self.embedder = embedder or get_embedder(meta.get("model"))
+        if meta and (meta["model"], meta["dim"]) != (self.embedder.name, self.embedder.dim):
+            raise ValueError(f"Index construit avec {meta['model']} ({meta['dim']} dim.), pas "
+                             f"{self.embedder.name} : le reconstruire (rebuild).")
+        self.df = {}
+        if self.embedder.uses_idf and os.path.exists(self._file("df.json")):
+            with open(self._file("df.json"), encoding="utf-8") as f:
+                self.df = json.load(f)
+        self._load(meta)
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _read_meta(self):
+        try:
+            with open(self._file("meta.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _write_json(self, name, data):
+        tmp = self._file(name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, self._file(name))
+
+    def _load(self, meta):
+        self.count = meta.get("count", 0)
+        self.last_id = meta.get("last_id", 0)
+        self.dead = meta.get("dead", 0)
+        self._meta_mtime = self._mtime()
+        dim = self.embedder.dim
+        if not self.count:
+            self.vectors = np.zeros((0, dim), dtype=np.float32)
+            self.ids = np.zeros(0, dtype=np.int64)
+            self.docs = np.zeros(0, dtype=np.int32)
+            return
+        self.vectors = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r", shape=(self.count, dim))
+        self.ids = np.memmap(self._file("ids.i64"), dtype=np.int64, mode="r", shape=(self.count,))
+        self.docs = np.memmap(self._file("docs.i32"), dtype=np.int32, mode="r", shape=(self.count,))
+
+    def _mtime(self):
+        try:
+            return os.stat(self._file("meta.json")).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _save_meta(self):
+        self._write_json("meta.json", {"model": self.embedder.name, "dim": self.embedder.dim, "count": self.count,
+                                       "last_id": self.last_id, "dead": self.dead})
+
+    def refresh(self):
+        """Relit l'index s'il a été modifié (par un autre processus) depuis le chargement"""
+        if self._mtime() != self._meta_mtime:
+            self.__init__(self.path, self.embedder)
+
+    def __len__(self):
+        return self.count - self.dead
+
+    # ---- Écriture ----
+
+    def _embed(self, texts):
+        if not self.embedder.uses_idf:
+            return self.embedder.embed(texts)
+        word_ids, lengths, words_per_text = self.embedder.tokenize(texts)
+        df = self.df
+        for words in words_per_text:
+            for word in set(words):
+                df[word] = df.get(word, 0) + 1
+        return self.embedder.embed_tokens(word_ids, lengths)
+
+    def append(self, ids, document_ids, texts, commit=True):
+        """
+        Encode et ajoute des blocs (ids croissants, plus grands que ceux déjà indexés).
+        Avec commit=False, meta.json et df.json ne sont écrits qu'au prochain commit().
+        """
+        if not len(ids):
+            return 0
+        vectors = self._embed(texts)
+        # Des octets écrits au-delà de count par un ajout interrompu sont écrasés
+        for name, data in [("vectors.f32", vectors), ("ids.i64", np.asarray(ids, dtype=np.int64)),
+                           ("docs.i32", np.asarray(document_ids, dtype=np.int32))]:
+            mode = "r+b" if os.path.exists(self._file(name)) else "wb"
+            with open(self._file(name), mode) as f:
+                f.seek(self.count * data.itemsize * (data.shape[1] if data.ndim > 1 else 1))
+                f.write(data.tobytes())
+                f.truncate()
+        self.count += len(ids)
+        self.last_id = int(ids[-1])
+        if commit:
+            self.commit()
+        return len(ids)
+
+    def commit(self):
+        """Rend visibles les lignes ajoutées : écrit df.json puis meta.json, et relit l'index"""
+        if self.embedder.uses_idf:
+            self._write_json("df.json", self.df)
+        self._save_meta()
+        self._load(self._read_meta())
+
+    def remove(self, ids):
+        """Marque mortes les lignes des blocs ids (elles ne sortent plus dans les résultats)"""
+        rows = np.flatnonzero(np.isin(self.ids, np.asarray(ids, dtype=np.int64)) & (self.ids >= 0))
+        if not len(rows):
+            return 0
+        marks = np.memmap(self._file("ids.i64"), dtype=np.int64, mode="r+", shape=(self.count,))
+        marks[rows] = -1
+        marks.flush()
+        del marks
+        self.dead += len(rows)
+        self._save_meta()
+        self._load(self._read_meta())
+        return len(rows)
+
+    def compact(self):
+        """Réécrit l'index sans ses lignes mortes"""
+        live = np.flatnonzero(self.ids >= 0)
+        for name, column in [("vectors.f32", self.vectors), ("ids.i64", self.ids), ("docs.i32", self.docs)]:
+            with open(self._file(name + ".tmp"), "wb") as f:
+                for start in range(0, len(live), SYNC_BATCH * 16):
+                    f.write(np.ascontiguousarray(column[live[start:start + SYNC_BATCH * 16]]).tobytes())
+        self.vectors = self.ids = self.docs = None  # libère les mmap avant de remplacer les fichiers
+        for name in ("vectors.f32", "ids.i64", "docs.i32"):
+            os.replace(self._file(name + ".tmp"), self._file(name))
+        self.count, self.dead = len(live), 0
+        self._save_meta()
+        self._load(self._read_meta())
+
+    def sync(self, conn):
+        """
+        Met l'index à jour d'après la table blocs : ajoute les blocs d'id supérieur au dernier
+        indexé (par paquets, sans tout charger), marque morts les blocs disparus (source
+        ré-ingérée ou supprimée) et compacte si trop de lignes sont mortes.
+        Retourne (blocs ajoutés, blocs retirés).
+        """
+        self.refresh()  # l'index a pu être mis à jour par un autre processus ou une autre instance
+        if self.count:
+            current = np.fromiter((row[0] for row in conn.execute(
+                "SELECT id FROM blocs WHERE id <= ? ORDER BY id", (self.last_id,))), dtype=np.int64)
+            removed = self.remove(self.ids[(self.ids >= 0) & ~np.isin(self.ids, current)])
+        else:
+            removed = 0
+        added = 0
+        cursor = conn.execute("SELECT id, document_id, contenu FROM blocs WHERE id > ? ORDER BY id", (self.last_id,))
+        while True:
+            rows = cursor.fetchmany(SYNC_BATCH)
+            if not rows:
+                break
+            ids, document_ids, texts = zip(*rows)
+            added += self.append(ids, document_ids, [text or "" for text in texts], commit=False)
+        if added:
+            self.commit()
+        if self.dead > MAX_DEAD_RATIO * self.count:
+            self.compact()
+        return added, removed
+
+    # ---- Recherche ----
+
+    def query_vector(self, query):
+        """Vecteur de la requête ; avec le hachage, chaque mot est pondéré par son IDF"""
+        if not self.embedder.uses_idf:
+            return self.embedder.embed([query])[0]
+        word_ids, lengths, words_per_text = self.embedder.tokenize([query])
+        total = max(len(self), 1)
+        idf = [math.log((1 + total) / (1 + self.df.get(word, 0))) + 1 for word in words_per_text[0]]
+        return self.embedder.embed_tokens(word_ids, lengths, np.array(idf))[0]
+
+    def search(self, query, k=TOP_K, document_id=None):
+        """Les k blocs les plus proches (cosinus) : liste de (id du bloc, score), du meilleur au moins bon"""
+        self.refresh()
+        if not self.count or k <= 0:
+            return []
+        vector = self.query_vector(query)
+        if not vector.any():
+            return []
+        if document_id is None:
+            rows = None
+            scores = self.vectors @ vector
+        else:
+            # Les lignes d'un document (ingéré d'un bloc) sont seules lues dans la matrice
+            rows = np.flatnonzero(self.docs == document_id)
+            scores = self.vectors[rows] @ vector
+        if self.dead:
+            scores[(self.ids if rows is None else self.ids[rows]) < 0] = -np.inf
+        k = min(k, len(scores))
+        if not k:
+            return []
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(self.ids[i if rows is None else rows[i]]), float(scores[i])) for i in top if scores[i] > -np.inf]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(db_path=DB_PATH, model=None):
+    """Index sémantique partagé par processus pour une base donnée"""
+    key = os.path.abspath(index_path(db_path))
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = EmbeddingIndex(key, get_embedder(model) if model else None)
+        return _indexes[key]
+
+
+def semantic_search(query, source=None, bloc_type=None, db_path=DB_PATH, limit=TOP_K):
+    """
+    Comme search_blocs, mais par proximité sémantique : blocs (dicts) classés par cosinus
+    décroissant, avec un champ score. Liste vide si l'index n'a pas été construit.
+    Un index en retard sur la base (blocs écrits par un autre programme) est d'abord synchronisé.
+    """
+    if not os.path.isdir(index_path(db_path)):
+        return []
+    store = get_store(db_path)
+    index = get_index(db_path)
+    index.refresh()
+    document_id = None
+    with store.reader() as conn:
+        # Les ids ne sont jamais réutilisés (AUTOINCREMENT) : toute ré-ingestion crée des ids plus grands
+        if (conn.execute("SELECT MAX(id) FROM blocs").fetchone()[0] or 0) > index.last_id:
+            index.sync(conn)
+        if source:
+            row = conn.execute("SELECT id FROM documents WHERE source = ?", (source,)).fetchone()
+            if row is None:
+                return []
+            document_id = row[0]
+    # Le filtre de type se fait après coup : on en demande davantage
+    hits = index.search(query, limit * 4 if bloc_type else limit, document_id)
+    scores = dict(hits)
+    blocs = [dict(bloc, score=scores[bloc["id"]]) for bloc in store.get_blocs([bloc_id for bloc_id, _ in hits])]
+    if bloc_type:
+        blocs = [bloc for bloc in blocs if bloc["bloc_type"] == bloc_type]
+    return blocs[:limit]
+
+
+def sync_index(db_path=DB_PATH, model=None, rebuild=False):
+    """Construit ou met à jour l'index de db_path ; retourne (blocs ajoutés, blocs retirés)"""
+    path = index_path(db_path)
+    if rebuild:
+        with _indexes_lock:
+            _indexes.pop(os.path.abspath(path), None)
+        for name in ("meta.json", "df.json", "vectors.f32", "ids.i64", "docs.i32"):
+            if os.path.exists(os.path.join(path, name)):
+                os.remove(os.path.join(path, name))
+    conn = sqlite3.connect(db_path)
+    try:
+        migrate(conn)
+        return get_index(db_path, model).sync(conn)
+    finally:
+        conn.close()
+
+
+# ---- MAIN : vérification sur une base temporaire et mesure sur 1M blocs ----
+
+def synthetic_texts(count, seed=0):
+    """Textes de cours synthétiques (même vocabulaire que le benchmark de search_blocs)"""
+    import random
+
+    vocabulary = ("objet classe méthode attribut héritage interface tableau boucle variable "
+                  "référence constructeur exception paquetage énergie probabilité abstraite").split()
+    vocabulary += [f"terme{i}" for i in range(5000)]
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(vocabulary) for _ in range(rng.randint(5, 30))) for _ in range(count)]
+
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+    import time
+
+    from corpus_db import ingest_blocs
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "corpus.db")
+        conn = sqlite3.connect(db_path)
+        cours = [
+            ("poo.pdf", ["Une classe fille hérite des attributs de sa classe mère.",
+                         "Le constructeur initialise les attributs de l'objet.",
+                         "Une exception interrompt le flux normal du programme."]),
+            ("physique.pdf", ["L'énergie cinétique dépend de la masse et de la vitesse.",
+                              "La conservation de l'énergie mécanique en l'absence de frottements."]),
+        ]
+        for source, texts in cours:
+            ingest_blocs(conn, source, "v1", [{"source": source, "page": 1, "type": "paragraph", "text": t}
+                                              for t in texts])
+        added, removed = sync_index(db_path)
+        checks = [("ajout initial", (added, removed) == (5, 0))]
+        top = semantic_search("héritage entre classes", db_path=db_path, limit=1)
+        checks.append(("proximité", top and top[0]["contenu"].startswith("Une classe fille")))
+        top = semantic_search("energie", source="physique.pdf", db_path=db_path)
+        checks.append(("filtre source et accents", [b["source"] for b in top] == ["physique.pdf"] * 2))
+        # Ré-ingestion : anciens ids retirés, nouveaux ajoutés, sans toucher au reste
+        ingest_blocs(conn, "physique.pdf", "v2", [{"source": "physique.pdf", "page": 1, "type": "paragraph",
+                                                   "text": "Le travail d'une force et l'énergie potentielle."}])
+        checks.append(("ré-ingestion suivie", get_index(db_path).sync(conn) == (0, 0) and len(get_index(db_path)) == 4))
+        top = semantic_search("énergie", source="physique.pdf", db_path=db_path)
+        checks.append(("lignes mortes exclues", [b["contenu"][:10] for b in top] == ["Le travail"]))
+        # Blocs écrits sans passer par ingest_blocs : la recherche rattrape l'index
+        conn.execute("INSERT INTO blocs (document_id, page, bloc_type, contenu) VALUES (1, 2, 'paragraph', ?)",
+                     ("Le polymorphisme redéfinit une méthode héritée.",))
+        conn.commit()
+        top = semantic_search("polymorphisme", db_path=db_path, limit=1)
+        checks.append(("index en retard", top and top[0]["contenu"].startswith("Le polymorphisme")))
+        checks.append(("reconstruction", sync_index(db_path, rebuild=True) == (5, 0)))
+        conn.close()
+        for name, ok in checks:
+            failures += not ok
+            print(f"{'✅' if ok else '❌'} {name}")
+
+        # Mesure : encodage par paquets, ajouts incrémentaux et top-10 sur count blocs
+        count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+        index = EmbeddingIndex(os.path.join(tmp, "bench"))
+        texts = synthetic_texts(SYNC_BATCH * 4, seed=1)
+        start = time.perf_counter()
+        for first in range(0, count, len(texts)):
+            n = min(len(texts), count - first)
+            index.append(np.arange(first + 1, first + n + 1), np.full(n, first // 100_000), texts[:n])
+        elapsed = time.perf_counter() - start
+        print(f"⏱️  {count} blocs encodés et ajoutés en {elapsed:.1f}s ({count / elapsed:,.0f} blocs/s), "
+              f"{index.vectors.nbytes / 1e6:.0f} Mo de vecteurs")
+        queries = ["héritage et classe abstraite", "boucle sur un tableau", "exception du constructeur",
+                   "énergie probabilité", "interface objet méthode"]
+        index.search(queries[0])  # préchauffage : pages du mmap en cache
+        for label, kwargs in [("top-10", {}), ("top-10 d'un document", {"document_id": 3})]:
+            start = time.perf_counter()
+            for query in queries:
+                hits = index.search(query, **kwargs)
+            per_query = (time.perf_counter() - start) / len(queries)
+            print(f"⏱️  {label} sur {len(index)} blocs : {per_query * 1000:.1f} ms/requête")
+        start = time.perf_counter()
+        index.append(np.arange(count + 1, count + 1001), np.full(1000, 99), texts[:1000])
+        print(f"⏱️  ajout incrémental de 1000 blocs : {(time.perf_counter() - start) * 1000:.0f} ms")
+        del index
+    sys.exit(1 if failures else 0)
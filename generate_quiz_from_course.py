@@ -1,55 +1,69 @@
-import sqlite3
-import requests
+import os
 import sys
 
+from context_builder import CONTEXT_TOKENS, build_context, course_topics
+from llm_cache import get_cache
+
 API_KEY = ""
 MODEL = "meta-llama/llama-3-70b-instruct"
 DB_PATH = "corpus.db"
+OPENROUTER_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
+QUIZ_INSTRUCTION = "Génère 5 questions à choix multiple adaptées à un élève visuel. Réponds en français uniquement."
 
 
-def get_course_text(source, max_chars=2000):
+def get_course_text(source, request=None, max_tokens=CONTEXT_TOKENS):
     """
-    Récupère le texte concaténé de tous les blocs d'un PDF donné (source), limité à max_chars.
+    Récupère les blocs les plus utiles d'un PDF donné (source), dans la limite de max_tokens.
     """
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT contenu FROM blocs WHERE source=? ORDER BY page, id", (source,))
-    textes = [row[0] for row in c.fetchall()]
-    conn.close()
-    full_text = " ".join(textes)
-    return full_text[:max_chars]
+    return build_context(source, request, max_tokens, db_path=DB_PATH)
+
+
+def build_quiz_prompt(source):
+    # Sans requête, le contexte serait le début du cours (page de garde, bibliographie) :
+    # les blocs retenus sont ceux qui couvrent les thèmes annoncés par les titres
+    extrait = get_course_text(source, course_topics(source, db_path=DB_PATH))
+    return f"Voici un extrait du cours {source} :\n{extrait}\n\n{QUIZ_INSTRUCTION}"
 
 
 def call_openrouter(prompt):
-    url = "https://openrouter.ai/api/v1/chat/completions"
+    """Appelle le modèle via OpenRouter ; une requête identique déjà envoyée est servie par le cache"""
+    messages = [
+        {"role": "user", "content": prompt}
+    ]
+    return get_cache().get_or_call(MODEL, messages, {}, lambda: _post_openrouter(messages))
+
+
+def _post_openrouter(messages):
+    # Importé au premier appel réel : une réponse servie par le cache n'en a pas besoin
+    import requests
+
     headers = {
         "Authorization": f"Bearer {API_KEY}",
         "Content-Type": "application/json"
     }
     data = {
         "model": MODEL,
-        "messages": [
-            {"role": "user", "content": prompt}
-        ]
+        "messages": messages
     }
-    response = requests.post(url, headers=headers, json=data)
+    response = requests.post(OPENROUTER_URL, headers=headers, json=data)
     response.raise_for_status()
     return response.json()["choices"][0]["message"]["content"]
 
 
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: python generate_quiz_from_course.py <nom_du_pdf>")
-        sys.exit(1)
-    source = sys.argv[1]
+def run_quiz(source):
     print(f"Génération de quiz pour le cours : {source}")
-    extrait = get_course_text(source)
-    consigne = "Génère 5 questions à choix multiple adaptées à un élève visuel. Réponds en français uniquement."
-    prompt = f"Voici un extrait du cours {source} :\n{extrait}\n\n{consigne}"
+    prompt = build_quiz_prompt(source)
     print("\nPrompt envoyé à l'IA :\n", prompt[:400], "...\n[tronqué]" if len(prompt) > 400 else "")
     resultat = call_openrouter(prompt)
     print("\nRéponse de l'IA :\n")
     print(resultat)
 
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python generate_quiz_from_course.py <nom_du_pdf>")
+        sys.exit(1)
+    run_quiz(sys.argv[1])
+
 if __name__ == "__main__":
     main()
@@ -1,15 +1,14 @@
-import sqlite3
 import os
-import sys
-import openai
-from graphviz import Source
 import re
-from dotenv import load_dotenv
+import sys
+
+from context_builder import CONTEXT_TOKENS, build_context
+from diagram_render import get_renderer
+from dot_normalizer import clean_dot_labels
+from llm_cache import cache_key, get_cache
 
-# Charge automatiquement les variables d'environnement depuis .env
-load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = "gpt-4"
+DIAGRAM_TEMPERATURE = 0.3
 DB_PATH = "corpus.db"
 
 # Prompts pour différents types de diagrammes
@@ -35,14 +34,11 @@ DIAGRAM_PROMPTS = {
     )
 }
 
-def get_course_text(source, max_chars=2000):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT contenu FROM blocs WHERE source=? ORDER BY page, id", (source,))
-    textes = [row[0] for row in c.fetchall()]
-    conn.close()
-    full_text = " ".join(textes)
-    return full_text[:max_chars]
+# Consigne pédagogique ajoutée à chaque requête de diagramme
+PEDAGOGIC_INSTRUCTION = "Après le code DOT, fournis une explication pédagogique détaillée (en français) des classes, héritages, et relations du diagramme pour un débutant."
+
+def get_course_text(source, request=None, max_tokens=CONTEXT_TOKENS):
+    return build_context(source, request, max_tokens, db_path=DB_PATH)
 
 def call_openrouter(prompt):
     url = "https://openrouter.ai/api/v1/chat/completions"
@@ -71,40 +67,117 @@ def detect_diagram_type(user_input: str) -> str:
     else:
         return "graph"
 
-def generate_diagram(diagram_type: str, user_request: str) -> str:
+def build_diagram_request(source: str, user_input: str) -> str:
+    extrait = get_course_text(source, user_input)
+    return f"À partir de ce contenu : {extrait}\n\n{user_input}\n\n{PEDAGOGIC_INSTRUCTION}"
+
+def diagram_messages(diagram_type: str, user_request: str) -> list:
     if diagram_type not in DIAGRAM_PROMPTS:
         raise ValueError(f"Type de diagramme '{diagram_type}' non supporté.")
-    system_prompt = DIAGRAM_PROMPTS[diagram_type]
-    if not OPENAI_API_KEY:
+    return [
+        {"role": "system", "content": DIAGRAM_PROMPTS[diagram_type]},
+        {"role": "user", "content": user_request}
+    ]
+
+def openai_client():
+    """
+    Module openai prêt à l'emploi. openai et python-dotenv ne sont importés (et .env lu)
+    qu'au premier appel réel à l'API : une réponse servie par le cache n'en a pas besoin.
+    """
+    import openai
+    from dotenv import load_dotenv
+
+    # Charge automatiquement les variables d'environnement depuis .env
+    load_dotenv()
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
         raise RuntimeError("OPENAI_API_KEY n'est pas défini dans les variables d'environnement.")
-    openai.api_key = OPENAI_API_KEY
-    response = openai.ChatCompletion.create(
-        model=OPENAI_MODEL,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_request}
-        ],
-        temperature=0.3
-    )
-    return response.choices[0].message['content'].strip()
-
-def clean_dot_labels(dot_code: str) -> str:
-    # Nettoie les labels de type <{...}> ou label="<{...}>"
-    dot_code = re.sub(r'label="\s*<\{([^}]*)\}>"', r'label="{\1}"', dot_code)
-    dot_code = re.sub(r'<\{([^}]*)\}>', r'{\1}', dot_code)
-    dot_code = re.sub(r'<f\d+>', '', dot_code)
-    dot_code = re.sub(r'label=\[', 'label={', dot_code)
-    dot_code = re.sub(r'\];', '};', dot_code)
-    dot_code = re.sub(r'label="([^"]+)"', lambda m: f'label="{{{m.group(1)}}}"' if not m.group(1).startswith('{') else m.group(0), dot_code)
-    dot_code = re.sub(r'\|\s*-', '|_', dot_code)
-    dot_code = dot_code.replace('\\n', '\\l')
-    dot_code = dot_code.replace('<', '').replace('>', '')
-    dot_code = re.sub(r'\|\s*}', '}', dot_code)
-    # Corrige les flèches façon IA
-    dot_code = re.sub(r'class\s+([A-Za-z0-9_]+)->([A-Za-z0-9_]+)(\[label=.*?\];)', r'\1 -> \2\3', dot_code)
-    # Corrige les définitions de nœuds façon IA
-    dot_code = re.sub(r'class\s+([A-Za-z0-9_]+)\[', r'\1[', dot_code)
-    return dot_code
+    openai.api_key = api_key
+    return openai
+
+def generate_diagram(diagram_type: str, user_request: str) -> str:
+    messages = diagram_messages(diagram_type, user_request)
+    params = {"temperature": DIAGRAM_TEMPERATURE}
+
+    def call():
+        openai = openai_client()
+        response = openai.ChatCompletion.create(model=OPENAI_MODEL, messages=messages, **params)
+        return response.choices[0].message['content'].strip()
+
+    return get_cache().get_or_call(OPENAI_MODEL, messages, params, call)
+
+def stream_diagram(diagram_type: str, user_request: str):
+    """
+    Version en flux de generate_diagram : produit la réponse morceau par morceau.
+    Une réponse déjà en cache est produite d'un seul bloc ; une réponse reçue en flux
+    est enregistrée dans le cache une fois complète.
+    """
+    messages = diagram_messages(diagram_type, user_request)
+    params = {"temperature": DIAGRAM_TEMPERATURE}
+    cache = get_cache()
+    key = cache_key(OPENAI_MODEL, messages, params)
+    cached = cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+    openai = openai_client()
+    parts = []
+    for chunk in openai.ChatCompletion.create(model=OPENAI_MODEL, messages=messages, stream=True, **params):
+        delta = chunk["choices"][0]["delta"].get("content")
+        if delta:
+            parts.append(delta)
+            yield delta
+    cache.put(key, "".join(parts).strip(), OPENAI_MODEL)
+
+class DotStreamSplitter:
+    """
+    Sépare au fil de l'eau le bloc ```dot ... ``` du reste de la réponse :
+    on_dot(code) est appelé dès que la clôture du bloc arrive, on_text(texte) reçoit
+    l'explication au fur et à mesure. Sans bloc ```dot, toute la réponse est du DOT
+    (même repli que le mode non streamé).
+    """
+    OPEN = "```dot"
+    CLOSE = "```"
+
+    def __init__(self, on_dot, on_text):
+        self.on_dot = on_dot
+        self.on_text = on_text
+        self.state = "before"  # before → dot → after
+        self.buffer = ""
+
+    def feed(self, chunk: str):
+        self.buffer += chunk
+        if self.state == "before":
+            start = self.buffer.find(self.OPEN)
+            if start == -1:
+                # Tant qu'aucun bloc n'est ouvert, on ne sait pas si c'est de l'explication
+                return
+            self._emit_text(self.buffer[:start])
+            self.buffer = self.buffer[start + len(self.OPEN):]
+            self.state = "dot"
+        if self.state == "dot":
+            end = self.buffer.find(self.CLOSE)
+            if end == -1:
+                return
+            self.on_dot(self.buffer[:end].strip())
+            self.buffer = self.buffer[end + len(self.CLOSE):]
+            self.state = "after"
+        if self.state == "after":
+            self._emit_text(self.buffer)
+            self.buffer = ""
+
+    def _emit_text(self, text: str):
+        if text:
+            self.on_text(text)
+
+    def close(self):
+        if self.state == "before":
+            # Repli : tout le texte est mis en DOT
+            self.on_dot(self.buffer.strip())
+        elif self.state == "dot":
+            self.on_dot(self.buffer.strip())
+        self.buffer = ""
+        self.state = "after"
 
 def apply_default_style(dot_code: str, dpi: int = 300) -> str:
     # Ajoute des options pour éviter la coupure et améliorer la lisibilité
@@ -118,40 +191,75 @@ def apply_default_style(dot_code: str, dpi: int = 300) -> str:
     return '\n'.join(lines)
 
 
-def main():
-    if len(sys.argv) < 3:
-        print("Usage: python generer_visuel.py <nom_du_pdf> <requete utilisateur>")
-        sys.exit(1)
-    source = sys.argv[1]
-    user_input = sys.argv[2]
-    print(f"Génération de diagramme pour : {source}\nRequête : {user_input}")
-    extrait = get_course_text(source)
+def split_dot_response(full_response: str):
+    """Sépare le bloc ```dot de l'explication ; sans bloc, toute la réponse est du DOT"""
+    dot_match = re.search(r'```dot(.*?)```', full_response, re.DOTALL)
+    if dot_match:
+        return dot_match.group(1).strip(), full_response.replace(dot_match.group(0), '').strip()
+    return full_response.strip(), ''
+
+def prepare_dot(dot_code: str) -> str:
+    """Texte DOT exact envoyé à Graphviz (et clé du cache de rendu)"""
+    dot_clean = "\n".join(line for line in dot_code.strip().splitlines() if not line.strip().startswith("```"))
+    return apply_default_style(clean_dot_labels(dot_clean))
+
+def render_diagram(dot_code: str, output_path: str = "output_diagramme.svg", fmt: str = "svg") -> str:
+    """Met en forme le code DOT et le rend dans output_path (rendus identiques servis par le cache)"""
+    data = get_renderer().render(prepare_dot(dot_code), fmt)
+    with open(output_path, "wb") as f:
+        f.write(data)
+    return output_path
+
+def main_stream(source: str, user_input: str):
+    """
+    Mode streaming : le rendu Graphviz démarre dès la fermeture du bloc ```dot,
+    pendant que l'explication continue d'arriver (affichée et écrite au fil de l'eau).
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    import time
+
+    start = time.perf_counter()
+    diagram_type = detect_diagram_type(user_input)
+    user_request = build_diagram_request(source, user_input)
+    renders = []
+    with ThreadPoolExecutor(max_workers=1) as pool, \
+            open("output_explanation.txt", "w", encoding="utf-8") as explanation_file:
+
+        def on_dot(dot_code):
+            print("\n--- CODE DOT GÉNÉRÉ ---\n")
+            print(dot_code)
+            print("\n------------------------\n")
+            renders.append(pool.submit(render_diagram, dot_code))
+            renders[-1].add_done_callback(lambda _: print(
+                f"\n✅ Diagramme SVG généré dans output_diagramme.svg ({time.perf_counter() - start:.1f}s)"))
+
+        def on_text(text):
+            print(text, end="", flush=True)
+            explanation_file.write(text)
+            explanation_file.flush()
+
+        splitter = DotStreamSplitter(on_dot, on_text)
+        for chunk in stream_diagram(diagram_type, user_request):
+            splitter.feed(chunk)
+        splitter.close()
+    for render in renders:
+        render.result()
+    print(f"\n\n✅ Explication pédagogique enregistrée dans output_explanation.txt ({time.perf_counter() - start:.1f}s)")
+
+def main_full(source: str, user_input: str):
+    """Mode par défaut : attend la réponse complète, puis rend le diagramme et écrit l'explication"""
     diagram_type = detect_diagram_type(user_input)
     # Ajoute une consigne pédagogique explicite
-    pedagogic_instruction = "Après le code DOT, fournis une explication pédagogique détaillée (en français) des classes, héritages, et relations du diagramme pour un débutant."
-    user_request = f"À partir de ce contenu : {extrait}\n\n{user_input}\n\n{pedagogic_instruction}"
+    user_request = build_diagram_request(source, user_input)
     full_response = generate_diagram(diagram_type, user_request)
 
-    # Extraction du code DOT et de l'explication
-    import re
-    dot_match = re.search(r'```dot(.*?)```', full_response, re.DOTALL)
-    if dot_match:
-        dot_code = dot_match.group(1).strip()
-        explanation = full_response.replace(dot_match.group(0), '').strip()
-    else:
-        # Fallback : tout le texte est mis en DOT
-        dot_code = full_response.strip()
-        explanation = ''
+    # Extraction du code DOT et de l'explication (sans bloc ```dot, tout le texte est mis en DOT)
+    dot_code, explanation = split_dot_response(full_response)
 
-    dot_clean = "\n".join(line for line in dot_code.strip().splitlines() if not line.strip().startswith("```"))
-    dot_styled = apply_default_style(dot_clean)
-    src = Source(dot_styled)
     print("\n--- CODE DOT GÉNÉRÉ ---\n")
     print(dot_code)
     print("\n------------------------\n")
-    svg_output = src.pipe(format="svg").decode("utf-8")
-    with open("output_diagramme.svg", "w", encoding="utf-8") as f:
-        f.write(svg_output)
+    render_diagram(dot_code)
     print("\n✅ Diagramme SVG généré dans output_diagramme.svg")
     if explanation:
         print("\n--- EXPLICATION PÉDAGOGIQUE ---\n")
@@ -161,5 +269,18 @@ def main():
             f.write(explanation)
         print("\n✅ Explication pédagogique enregistrée dans output_explanation.txt")
 
+def main():
+    args = [arg for arg in sys.argv[1:] if arg != "--stream"]
+    if len(args) < 2:
+        print("Usage: python generer_visuel.py [--stream] <nom_du_pdf> <requete utilisateur>")
+        sys.exit(1)
+    source = args[0]
+    user_input = args[1]
+    print(f"Génération de diagramme pour : {source}\nRequête : {user_input}")
+    if "--stream" in sys.argv:
+        main_stream(source, user_input)
+    else:
+        main_full(source, user_input)
+
 if __name__ == "__main__":
     main()
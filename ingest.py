@@ -0,0 +1,89 @@
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+from corpus_db import (
+    BATCH_SIZE,
+    DB_PATH,
+    configure_for_load,
+    document_hash,
+    file_hash,
+    ingest_blocs,
+    migrate,
+    sync_embeddings,
+)
+
+
+def ingest_file(filepath, db_path=DB_PATH, force=False, batch_size=BATCH_SIZE, index=False):
+    """
+    Ingère un cours dans la base, de façon idempotente :
+    - fichier inchangé (même hash) : ignoré, sans même être ré-extrait ;
+    - fichier modifié : ses anciens blocs sont remplacés atomiquement.
+    L'index sémantique de la base, s'il existe, suit l'ingestion (voir ingest_blocs) ;
+    index=True le crée s'il n'existe pas encore.
+    Retourne le nombre de blocs insérés, ou None si le fichier a été ignoré.
+    """
+    from app import extract_stream
+
+    if index:
+        from embedding_index import get_index
+
+        get_index(db_path)
+    source = os.path.basename(filepath)
+    content_hash = file_hash(filepath)
+    conn = sqlite3.connect(db_path)
+    try:
+        configure_for_load(conn)
+        migrate(conn)
+        if not force and document_hash(conn, source) == content_hash:
+            if index:
+                sync_embeddings(conn)  # index demandé pour une base déjà à jour
+            return None
+        return ingest_blocs(conn, source, content_hash, extract_stream(filepath), batch_size, force=force)
+    finally:
+        conn.close()
+
+
+def benchmark(bloc_count=10_000):
+    """Chronomètre l'ingestion de bloc_count blocs synthétiques dans une base temporaire"""
+    blocs = [
+        {"source": "bench.pdf", "page": i // 20 + 1, "type": "paragraph", "text": f"Bloc de test numéro {i} " * 4}
+        for i in range(bloc_count)
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "bench.db"))
+        configure_for_load(conn)
+        start = time.perf_counter()
+        ingest_blocs(conn, "bench.pdf", "v1", blocs)
+        first = time.perf_counter() - start
+        start = time.perf_counter()
+        ingest_blocs(conn, "bench.pdf", "v2", blocs)
+        replace = time.perf_counter() - start
+        conn.close()
+    return first, replace
+
+
+# ---- MAIN ----
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingestion idempotente de cours dans corpus.db")
+    parser.add_argument("paths", nargs="*", help="fichiers à ingérer (PDF, DOCX, PPTX)")
+    parser.add_argument("--db", default=DB_PATH, help="base SQLite")
+    parser.add_argument("--force", action="store_true", help="ré-ingère même si le fichier est inchangé")
+    parser.add_argument("--index", action="store_true",
+                        help="met aussi à jour l'index sémantique (toujours fait s'il existe déjà)")
+    parser.add_argument("--bench", type=int, metavar="N", help="chronomètre l'ingestion de N blocs synthétiques")
+    args = parser.parse_args()
+
+    if args.bench:
+        first, replace = benchmark(args.bench)
+        print(f"⏱️  {args.bench} blocs : insertion {first * 1000:.0f} ms, remplacement {replace * 1000:.0f} ms")
+    for path in args.paths:
+        start = time.perf_counter()
+        count = ingest_file(path, args.db, force=args.force, index=args.index)
+        if count is None:
+            print(f"⏭️  {path} inchangé, ignoré")
+        else:
+            print(f"✅ {path} : {count} blocs ingérés en {time.perf_counter() - start:.2f}s")
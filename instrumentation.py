@@ -0,0 +1,256 @@
+import heapq
+import json
+import os
+import time
+from contextlib import nullcontext
+
+# Chemin du rapport (.json ou .prom) : si la variable est définie, app.py et stream_pipeline.py
+# activent l'instrumentation et écrivent le rapport en fin d'exécution
+METRICS_ENV = "INGEST_METRICS"
+SLOWEST_BLOCKS = 20
+PREVIEW_CHARS = 80
+# Bornes (s) de l'histogramme Prometheus des temps par page
+PAGE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+# Instance active, ou None : les points de mesure testent `metrics is not None`
+# une fois par page ou par appel, ce qui ne coûte presque rien quand c'est désactivé
+METRICS = None
+
+_NULL_STAGE = nullcontext()
+
+
+class _Stage:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.add_time(self.name, time.perf_counter() - self.start)
+
+
+class Metrics:
+    """
+    Chronos et compteurs d'une exécution : temps cumulé par étape, temps de chaque page,
+    nombre de blocs par catégorie du classifieur, blocs testés, trouvés et temps passé par
+    famille de patterns regex, et blocs les plus lents à traiter (nettoyage + classification,
+    mesurés un par un). Prévu pour le thread principal.
+    """
+
+    def __init__(self, slowest=SLOWEST_BLOCKS, profile_blocks=True):
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.stages = {}       # étape → [appels, secondes, max]
+        self.counters = {}
+        self.categories = {}   # type détecté → nombre de blocs
+        self.patterns = {}     # famille de patterns → [blocs testés, trouvés, secondes, max]
+        self.pages = []        # (source, page, secondes, blocs)
+        self.slowest_count = slowest
+        self.profile_blocks = profile_blocks
+        self._slowest = []     # tas (secondes, n°, détail) des blocs les plus lents
+        self._seq = 0
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def add_time(self, name, seconds):
+        entry = self.stages.get(name)
+        if entry is None:
+            self.stages[name] = [1, seconds, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+            if seconds > entry[2]:
+                entry[2] = seconds
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def count_categories(self, labels):
+        categories = self.categories
+        for label in labels:
+            categories[label] = categories.get(label, 0) + 1
+
+    def pattern_steps(self, steps):
+        """Étapes (famille, trouvée, secondes) de la classification d'un bloc"""
+        patterns = self.patterns
+        for label, matched, seconds in steps:
+            entry = patterns.get(label)
+            if entry is None:
+                patterns[label] = [1, int(matched), seconds, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += matched
+                entry[2] += seconds
+                if seconds > entry[3]:
+                    entry[3] = seconds
+
+    def page(self, source, page, seconds, blocks):
+        self.pages.append((source, page, seconds, blocks))
+
+    def block(self, seconds, text, source=None, page=None, **timings):
+        """Retient le bloc s'il fait partie des plus lents"""
+        self._seq += 1
+        if len(self._slowest) >= self.slowest_count and seconds <= self._slowest[0][0]:
+            return
+        detail = {"source": source, "page": page, "seconds": seconds, **timings,
+                  "chars": len(text), "preview": text[:PREVIEW_CHARS]}
+        if len(self._slowest) < self.slowest_count:
+            heapq.heappush(self._slowest, (seconds, self._seq, detail))
+        else:
+            heapq.heapreplace(self._slowest, (seconds, self._seq, detail))
+
+    # ---- Rapports ----
+
+    def report(self):
+        """Rapport lisible par une machine (dict sérialisable en JSON)"""
+        return {
+            "started_at": self.started,
+            "wall_seconds": time.perf_counter() - self._start,
+            "stages": {name: {"calls": calls, "seconds": seconds, "max_seconds": longest}
+                       for name, (calls, seconds, longest) in sorted(self.stages.items())},
+            "counters": dict(sorted(self.counters.items())),
+            "categories": dict(sorted(self.categories.items())),
+            "patterns": {label: {"tried": tried, "matched": matched, "seconds": seconds, "max_seconds": longest}
+                         for label, (tried, matched, seconds, longest) in sorted(self.patterns.items())},
+            "pages": [{"source": source, "page": page, "seconds": seconds, "blocks": blocks}
+                      for source, page, seconds, blocks in self.pages],
+            "slowest_blocks": [detail for _, _, detail in sorted(self._slowest, reverse=True)],
+        }
+
+    def to_prometheus(self, prefix="ingest"):
+        """Même rapport au format texte d'exposition Prometheus"""
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for suffix, labels, value in samples:
+                label_text = ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+                value = repr(value) if isinstance(value, (int, float)) else value
+                lines.append(f"{prefix}_{name}{suffix}{{{label_text}}} {value}" if label_text
+                             else f"{prefix}_{name}{suffix} {value}")
+
+        stages = sorted(self.stages.items())
+        metric("stage_seconds_total", "counter", "Temps cumulé par étape",
+               [("", {"stage": name}, seconds) for name, (_, seconds, _) in stages])
+        metric("stage_calls_total", "counter", "Nombre de passages par étape",
+               [("", {"stage": name}, calls) for name, (calls, _, _) in stages])
+        metric("stage_max_seconds", "gauge", "Passage le plus long par étape",
+               [("", {"stage": name}, longest) for name, (_, _, longest) in stages])
+        metric("blocks_total", "counter", "Blocs par catégorie détectée",
+               [("", {"category": label}, n) for label, n in sorted(self.categories.items())])
+        patterns = sorted(self.patterns.items())
+        metric("pattern_tried_total", "counter", "Blocs testés par famille de patterns",
+               [("", {"category": label}, tried) for label, (tried, _, _, _) in patterns])
+        metric("pattern_matched_total", "counter", "Blocs reconnus par famille de patterns",
+               [("", {"category": label}, matched) for label, (_, matched, _, _) in patterns])
+        metric("pattern_seconds_total", "counter", "Temps cumulé par famille de patterns",
+               [("", {"category": label}, seconds) for label, (_, _, seconds, _) in patterns])
+        metric("pattern_max_seconds", "gauge", "Test le plus long par famille de patterns",
+               [("", {"category": label}, longest) for label, (_, _, _, longest) in patterns])
+        for name, value in sorted(self.counters.items()):
+            metric(f"{name}_total", "counter", f"Compteur {name}", [("", {}, value)])
+        samples = []
+        times = sorted(seconds for _, _, seconds, _ in self.pages)
+        below = 0
+        for bound in PAGE_BUCKETS:
+            while below < len(times) and times[below] <= bound:
+                below += 1
+            samples.append(("_bucket", {"le": f"{bound:g}"}, below))
+        samples.append(("_bucket", {"le": "+Inf"}, len(times)))
+        samples.append(("_sum", {}, sum(times)))
+        samples.append(("_count", {}, len(times)))
+        metric("page_seconds", "histogram", "Temps d'extraction par page", samples)
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Écrit le rapport : Prometheus si path finit par .prom, JSON sinon"""
+        with open(path, "w", encoding="utf-8") as f:
+            if path.endswith(".prom"):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.report(), f, ensure_ascii=False, indent=2)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def enable(slowest=SLOWEST_BLOCKS, profile_blocks=True):
+    """Active l'instrumentation (remplace les mesures en cours) et retourne l'instance"""
+    global METRICS
+    METRICS = Metrics(slowest, profile_blocks)
+    return METRICS
+
+
+def disable():
+    global METRICS
+    METRICS = None
+
+
+def enable_from_env():
+    """Active l'instrumentation si INGEST_METRICS est défini ; retourne le chemin du rapport ou None"""
+    path = os.getenv(METRICS_ENV)
+    if path:
+        enable()
+    return path
+
+
+def stage(name):
+    """Chrono d'une étape (contexte vide si l'instrumentation est désactivée)"""
+    metrics = METRICS
+    return _NULL_STAGE if metrics is None else metrics.stage(name)
+
+
+# ---- MAIN : coût de l'instrumentation sur une extraction ----
+
+if __name__ == "__main__":
+    import sys
+
+    # Les modules du pipeline lisent instrumentation.METRICS, pas celui de __main__
+    import instrumentation
+    from app import extract_table
+
+    paths = sys.argv[1:] or ["JavaLesBases.pdf", "document.pdf"]
+
+    def run():
+        start = time.perf_counter()
+        for path in paths:
+            extract_table(path)
+        return time.perf_counter() - start
+
+    run()  # préchauffage (imports, caches regex)
+    timings = {}
+    for label, setup in [("désactivée", instrumentation.disable),
+                         ("chronos seuls", lambda: instrumentation.enable(profile_blocks=False)),
+                         ("chronos + blocs lents", instrumentation.enable)]:
+        times = []
+        for _ in range(5):
+            setup()  # mesures remises à zéro à chaque passe
+            times.append(run())
+        timings[label] = min(times)
+    metrics = instrumentation.METRICS
+    instrumentation.disable()
+
+    print(f"⏱️  Extraction de {', '.join(paths)} :")
+    base = timings["désactivée"]
+    for label, seconds in timings.items():
+        print(f"  - {label:<22} {seconds * 1000:7.0f} ms ({(seconds / base - 1) * 100:+.1f} %)")
+    report = metrics.report()
+    print("\n📊 Étapes (dernière passe) :")
+    for name, stats in sorted(report["stages"].items(), key=lambda item: -item[1]["seconds"]):
+        print(f"  - {name:<14} {stats['seconds'] * 1000:7.1f} ms en {stats['calls']} appels")
+    print("\n🔎 Familles de patterns (dernière passe) :")
+    for label, stats in sorted(report["patterns"].items(), key=lambda item: -item[1]["seconds"]):
+        print(f"  - {label:<16} {stats['seconds'] * 1000:7.1f} ms, {stats['matched']}/{stats['tried']} blocs reconnus, "
+              f"max {stats['max_seconds'] * 1e6:.0f} µs")
+    print("\n🐢 Blocs les plus lents :")
+    for detail in report["slowest_blocks"][:5]:
+        print(f"  - {detail['seconds'] * 1e6:7.0f} µs  {detail['source']} p.{detail['page']} "
+              f"({detail['chars']} car.) {detail['preview'][:50]!r}")
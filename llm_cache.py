@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from corpus_db import DB_PATH
+
+# Cache stocké à côté de corpus.db
+LLM_CACHE_PATH = os.path.join(os.path.dirname(DB_PATH), "llm_cache.db")
+DEFAULT_TTL = 7 * 24 * 3600  # secondes
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+
+
+def cache_key(model, messages, params=None):
+    """Hash stable du modèle, des messages et des paramètres d'appel"""
+    payload = json.dumps(
+        {"model": model, "messages": messages, "params": params or {}},
+        ensure_ascii=False, sort_keys=True, separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Cache persistant des réponses LLM, adressé par le contenu de la requête.
+    - ttl : une réponse plus ancienne est considérée absente (et supprimée) ;
+    - max_bytes : au-delà, les réponses les moins récemment utilisées sont évincées (LRU) ;
+    - bypass : ignore le cache en lecture (la réponse fraîche est tout de même enregistrée).
+    La variable d'environnement LLM_CACHE=off active bypass par défaut.
+    """
+
+    def __init__(self, path=LLM_CACHE_PATH, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES, bypass=None):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.bypass = os.getenv("LLM_CACHE", "").lower() == "off" if bypass is None else bypass
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        ''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def get(self, key):
+        """Réponse en cache pour key, ou None (absente, expirée ou bypass)"""
+        now = time.time()
+        with self._lock:
+            if self.bypass:
+                self.misses += 1
+                return None
+            row = self.conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.ttl is not None and now - row[1] > self.ttl):
+                if row is not None:
+                    self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self.conn.commit()
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+        return row[0]
+
+    def put(self, key, response, model=None):
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, size, now, now),
+            )
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        """Évince les entrées les moins récemment utilisées jusqu'à repasser sous max_bytes"""
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        freed = 0
+        victims = []
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            victims.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self.conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+
+    def get_or_call(self, model, messages, params, call):
+        """Retourne la réponse en cache, sinon appelle call() et enregistre son résultat"""
+        key = cache_key(model, messages, params)
+        response = self.get(key)
+        if response is None:
+            response = call()
+            self.put(key, response, model)
+        return response
+
+    def stats(self):
+        with self._lock:
+            entries, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Cache LLM partagé par processus"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache()
+        return _cache
+
+
+# ---- MAIN : vérification hors ligne contre un faux serveur local ----
+
+if __name__ == "__main__":
+    import tempfile
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    calls = []
+
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            calls.append(body)
+            answer = json.dumps({"choices": [{"message": {"content": f"réponse n°{len(calls)}"}}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(answer)))
+            self.end_headers()
+            self.wfile.write(answer)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["OPENROUTER_URL"] = f"http://127.0.0.1:{server.server_port}/v1/chat/completions"
+        import generate_quiz_from_course as quiz
+        import llm_cache
+
+        cache = llm_cache._cache = LLMCache(os.path.join(tmp, "cache.db"))
+        first = quiz.call_openrouter("Bonjour")
+        second = quiz.call_openrouter("Bonjour")
+        assert first == second == "réponse n°1" and len(calls) == 1, (first, second, calls)
+        cache.bypass = True
+        assert quiz.call_openrouter("Bonjour") == "réponse n°2"
+        cache.bypass = False
+        assert quiz.call_openrouter("Bonjour") == "réponse n°2"
+        print(f"✅ Cache vérifié contre le serveur local : {cache.stats()}")
+        cache.close()
+
+        # TTL et éviction LRU
+        small = LLMCache(os.path.join(tmp, "small.db"), ttl=60, max_bytes=20)
+        for i in range(3):
+            small.put(f"k{i}", "x" * 8)
+            time.sleep(0.01)
+        assert small.get("k0") is None and small.get("k2") == "x" * 8, small.stats()
+        small.ttl = 0
+        time.sleep(0.01)
+        assert small.get("k2") is None
+        print(f"✅ TTL et éviction LRU vérifiés : {small.stats()}")
+        small.close()
+    server.shutdown()
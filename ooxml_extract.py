@@ -0,0 +1,417 @@
+import os
+import posixpath
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from xml.etree import ElementTree as ET
+
+# Lecture directe des parties XML des fichiers Office (sans python-docx ni python-pptx) :
+# chaque partie est lue en flux avec iterparse, et le corps d'un DOCX est vidé au fur et à
+# mesure, si bien que la mémoire ne dépend pas de la taille du document.
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+A = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+P = "{http://schemas.openxmlformats.org/presentationml/2006/main}"
+R = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+# Les zones de texte sont souvent écrites deux fois (DrawingML et, en secours, VML) : le secours est ignoré
+MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+
+REL_OFFICE_DOCUMENT = "/officeDocument"
+REL_NOTES_SLIDE = "/notesSlide"
+TABLE_CELL_SEPARATOR = " | "
+
+# Diapositives réparties entre processus au-delà de PPTX_PARALLEL_MIN_SLIDES, par paquets.
+# Série par défaut : relire l'archive et renvoyer les blocs coûte plus que l'extraction
+# d'une diapositive (voir le benchmark du MAIN) ; OFFICE_WORKERS=N pour essayer N processus.
+OFFICE_WORKERS = int(os.getenv("OFFICE_WORKERS", 1))
+PPTX_PARALLEL_MIN_SLIDES = 48
+SLIDES_PER_TASK = 16
+
+
+# ---- Paquet OPC : parties et relations ----
+
+def _rels_path(part):
+    directory, name = posixpath.split(part)
+    return posixpath.join(directory, "_rels", name + ".rels")
+
+
+def part_rels(zf, part):
+    """Relations d'une partie : {rId: (type, chemin de la cible dans le zip)}"""
+    try:
+        data = zf.read(_rels_path(part))
+    except KeyError:
+        return {}
+    rels = {}
+    base = posixpath.dirname(part)
+    for rel in ET.fromstring(data).iter(PKG_REL + "Relationship"):
+        if rel.get("TargetMode") == "External":
+            continue
+        target = rel.get("Target")
+        target = target[1:] if target.startswith("/") else posixpath.normpath(posixpath.join(base, target))
+        rels[rel.get("Id")] = (rel.get("Type"), target)
+    return rels
+
+
+def main_part(zf):
+    """Partie principale du paquet (word/document.xml, ppt/presentation.xml…)"""
+    for rel_type, target in part_rels(zf, "").values():
+        if rel_type.endswith(REL_OFFICE_DOCUMENT):
+            return target
+    raise ValueError("Paquet Office sans document principal")
+
+
+def _end_tag_text(elem, in_run):
+    """Texte apporté par un élément d'un run Word (comme python-docx : tabulations, sauts de ligne)"""
+    tag = elem.tag
+    if tag == W + "t":
+        return elem.text or ""
+    if not in_run:
+        return None
+    if tag == W + "tab" or tag == W + "ptab":
+        return "\t"
+    if tag == W + "br":
+        return "\n" if elem.get(W + "type", "textWrapping") == "textWrapping" else ""
+    if tag == W + "cr":
+        return "\n"
+    if tag == W + "noBreakHyphen":
+        return "-"
+    return None
+
+
+# ---- DOCX ----
+
+def heading_styles(zf):
+    """Identifiants des styles de paragraphe dont le nom contient « heading » (Titre 1 en français…)"""
+    try:
+        data = zf.read("word/styles.xml")
+    except KeyError:
+        return set()
+    headings = set()
+    for style in ET.fromstring(data).iter(W + "style"):
+        name = style.find(W + "name")
+        if name is not None and "heading" in (name.get(W + "val") or "").lower():
+            headings.add(style.get(W + "styleId"))
+    return headings
+
+
+def iter_docx_entries(stream, headings):
+    """
+    Générateur : (texte brut, type imposé ou None, section) pour chaque paragraphe et chaque
+    ligne de tableau du corps d'un document Word, dans l'ordre du document.
+    Les paragraphes de titre ont le type "title", les lignes de tableau "table_row" (cellules
+    séparées par " | ", un tableau imbriqué devient des lignes de sa cellule). Les paragraphes
+    des zones de texte sont rendus comme des paragraphes à part.
+    """
+    section = 1
+    paragraphs = []   # paragraphes ouverts : [morceaux de texte, style, fin de section]
+    tables = []       # tableaux ouverts : [cellules de la ligne en cours, paragraphes de la cellule en cours]
+    in_run = 0
+    skip = 0
+    depth = 0
+    body = None
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        tag = elem.tag
+        if event == "start":
+            depth += 1
+            if skip or tag == MC_FALLBACK:
+                skip += 1
+            elif tag == W + "p":
+                paragraphs.append([[], None, False])
+            elif tag == W + "r":
+                in_run += 1
+            elif tag == W + "tbl":
+                tables.append([None, None])
+            elif tag == W + "tr":
+                tables[-1][0] = []
+            elif tag == W + "tc":
+                tables[-1][1] = []
+            elif tag == W + "body":
+                body = elem
+            continue
+
+        depth -= 1
+        if skip:
+            skip -= 1
+        elif tag == W + "p":
+            parts, style, ends_section = paragraphs.pop()
+            text = "".join(parts)
+            if tables and tables[-1][1] is not None and not paragraphs:
+                tables[-1][1].append(text)
+            elif text:
+                yield text, "title" if style in headings else None, section
+            if ends_section:
+                section += 1
+        elif tag == W + "r":
+            in_run -= 1
+        elif tag == W + "pStyle":
+            if paragraphs:
+                paragraphs[-1][1] = elem.get(W + "val")
+        elif tag == W + "sectPr":
+            # Un sectPr dans les propriétés d'un paragraphe termine la section ; celui du corps est la dernière
+            if paragraphs:
+                paragraphs[-1][2] = True
+        elif tag == W + "tc":
+            table = tables[-1]
+            table[0].append("\n".join(table[1]).strip())
+            table[1] = None
+        elif tag == W + "tr":
+            cells = tables[-1][0]
+            tables[-1][0] = None
+            if any(cells):
+                row = TABLE_CELL_SEPARATOR.join(cells)
+                if len(tables) > 1 and tables[-2][1] is not None:
+                    tables[-2][1].append(row)
+                else:
+                    yield row, "table_row", section
+        elif tag == W + "tbl":
+            tables.pop()
+        elif paragraphs:
+            text = _end_tag_text(elem, in_run)
+            if text is not None:
+                paragraphs[-1][0].append(text)
+        # Fin d'un élément de premier niveau du corps : tout ce qui précède est traité
+        if depth == 2 and body is not None:
+            body.clear()
+
+
+def iter_docx_blocks(filepath):
+    """Générateur : blocs (non regroupés) d'un DOCX — paragraphes, titres, lignes de tableau"""
+    from app import DOCX_CLASSIFY_BATCH, office_blocks
+
+    source = os.path.basename(filepath)
+    with zipfile.ZipFile(filepath) as zf:
+        headings = heading_styles(zf)
+        with zf.open(main_part(zf)) as stream:
+            batch = []
+            for raw, fixed_type, section in iter_docx_entries(stream, headings):
+                batch.append((raw, fixed_type, section, False))
+                if len(batch) >= DOCX_CLASSIFY_BATCH:
+                    yield from office_blocks(source, batch, "section")
+                    batch = []
+            yield from office_blocks(source, batch, "section")
+
+
+# ---- PPTX ----
+
+def pptx_slide_parts(zf):
+    """(partie de la diapositive, partie des notes ou None) pour chaque diapositive, dans l'ordre"""
+    presentation = main_part(zf)
+    rels = part_rels(zf, presentation)
+    root = ET.fromstring(zf.read(presentation))
+    slides = []
+    for slide_id in root.iter(P + "sldId"):
+        slide_part = rels[slide_id.get(R + "id")][1]
+        notes_part = None
+        for rel_type, target in part_rels(zf, slide_part).values():
+            if rel_type.endswith(REL_NOTES_SLIDE):
+                notes_part = target
+        slides.append((slide_part, notes_part))
+    return slides
+
+
+def iter_slide_entries(stream, notes=False):
+    """
+    Générateur : (texte brut, type imposé ou None) pour chaque forme texte d'une diapositive,
+    y compris dans les groupes, et chaque ligne de tableau ("table_row").
+    Comme python-pptx, le texte d'une forme joint ses paragraphes par "\\n" et un saut de
+    ligne vaut "\\v". Pour une page de notes, seule la zone de notes (placeholder body) compte.
+    """
+    containers = []   # textes des paragraphes de la forme ou de la cellule en cours
+    shapes = []       # formes ouvertes : type de placeholder
+    rows = []         # lignes de tableau ouvertes
+    parts = None
+    skip = 0
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        tag = elem.tag
+        if event == "start":
+            if skip or tag == MC_FALLBACK:
+                skip += 1
+            elif tag == P + "sp":
+                shapes.append(None)
+                containers.append([])
+            elif tag == A + "tr":
+                rows.append([])
+            elif tag == A + "tc":
+                containers.append([])
+            elif tag == A + "p":
+                parts = []
+            continue
+
+        if skip:
+            skip -= 1
+        elif tag == A + "t":
+            if parts is not None:
+                parts.append(elem.text or "")
+        elif tag == A + "br":
+            if parts is not None:
+                parts.append("\v")
+        elif tag == A + "p":
+            if containers and parts is not None:
+                containers[-1].append("".join(parts))
+            parts = None
+        elif tag == P + "ph":
+            if shapes:
+                shapes[-1] = elem.get("type")
+        elif tag == P + "sp":
+            text = "\n".join(containers.pop())
+            placeholder = shapes.pop()
+            if text and (not notes or placeholder == "body"):
+                yield text, None
+        elif tag == A + "tc":
+            rows[-1].append("\n".join(containers.pop()).strip())
+        elif tag == A + "tr":
+            cells = rows.pop()
+            if any(cells) and not notes:
+                yield TABLE_CELL_SEPARATOR.join(cells), "table_row"
+        elif tag == P + "spTree":
+            elem.clear()
+
+
+def extract_slide(zf, slide_num, slide_part, notes_part, source):
+    """Blocs (non regroupés) d'une diapositive : formes, tableaux, puis notes de l'orateur"""
+    from app import office_blocks
+
+    entries = []
+    with zf.open(slide_part) as stream:
+        entries += [(raw, fixed_type, slide_num, False) for raw, fixed_type in iter_slide_entries(stream)]
+    if notes_part is not None:
+        with zf.open(notes_part) as stream:
+            entries += [(raw, fixed_type, slide_num, True) for raw, fixed_type in iter_slide_entries(stream, True)]
+    return list(office_blocks(source, entries, "slide", page=slide_num))
+
+
+def extract_slide_range(filepath, first_num, slides):
+    """Tâche d'un processus : blocs d'un paquet de diapositives consécutives, la première numérotée first_num"""
+    source = os.path.basename(filepath)
+    with zipfile.ZipFile(filepath) as zf:
+        return [extract_slide(zf, slide_num, slide_part, notes_part, source)
+                for slide_num, (slide_part, notes_part) in enumerate(slides, start=first_num)]
+
+
+def iter_pptx_slides(filepath, workers=None):
+    """
+    Générateur : blocs (non regroupés) de chaque diapositive, une liste par diapositive, dans
+    l'ordre. Au-delà de PPTX_PARALLEL_MIN_SLIDES, les diapositives sont réparties par paquets
+    entre processus, avec un nombre borné de paquets en attente.
+    """
+    workers = workers or OFFICE_WORKERS
+    source = os.path.basename(filepath)
+    with zipfile.ZipFile(filepath) as zf:
+        slides = pptx_slide_parts(zf)
+        if workers <= 1 or len(slides) < PPTX_PARALLEL_MIN_SLIDES:
+            for slide_num, (slide_part, notes_part) in enumerate(slides, start=1):
+                yield extract_slide(zf, slide_num, slide_part, notes_part, source)
+            return
+
+    ranges = deque(range(0, len(slides), SLIDES_PER_TASK))
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as pool:
+        while ranges or pending:
+            while ranges and len(pending) < 2 * workers:
+                start = ranges.popleft()
+                pending.append(pool.submit(extract_slide_range, filepath, start + 1,
+                                           slides[start:start + SLIDES_PER_TASK]))
+            yield from pending.popleft().result()
+
+
+# ---- MAIN : contenu supplémentaire et comparaison avec python-docx / python-pptx ----
+
+def write_rich_docx(path):
+    """DOCX avec titres, tableau (dont un tableau imbriqué) et deux sections"""
+    from docx import Document
+    from docx.enum.section import WD_SECTION
+
+    doc = Document()
+    doc.add_heading("Les tableaux", level=1)
+    doc.add_paragraph("Un tableau de notes :")
+    table = doc.add_table(rows=3, cols=3)
+    for r, row in enumerate([("Nom", "Age", "Note"), ("Alice", "21", "15.5"), ("Bob", "22", "12")]):
+        for c, value in enumerate(row):
+            table.cell(r, c).text = value
+    table.cell(2, 2).add_table(rows=1, cols=2).cell(0, 0).text = "détail"
+    doc.add_section(WD_SECTION.NEW_PAGE)
+    doc.add_paragraph("int x = 1;")
+    doc.save(path)
+
+
+def write_rich_pptx(path):
+    """PPTX avec une forme groupée, un tableau et des notes de l'orateur"""
+    from pptx import Presentation
+    from pptx.util import Pt
+
+    prs = Presentation()
+    slide = prs.slides.add_slide(prs.slide_layouts[5])
+    slide.shapes.title.text = "Héritage"
+    group = slide.shapes.add_group_shape()
+    group.shapes.add_textbox(Pt(30), Pt(120), Pt(200), Pt(20)).text_frame.text = "Animal -> Etre"
+    group.shapes.add_textbox(Pt(30), Pt(150), Pt(200), Pt(20)).text_frame.text = "Chien -> Animal"
+    table = slide.shapes.add_table(2, 2, Pt(300), Pt(120), Pt(300), Pt(60)).table
+    for r, row in enumerate([("Classe", "Parent"), ("Chien", "Animal")]):
+        for c, value in enumerate(row):
+            table.cell(r, c).text = value
+    slide.notes_slide.notes_text_frame.text = "Rappeler la différence entre classe et instance."
+    prs.save(path)
+
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+    import time
+
+    from app import group_similar_blocks, iter_docx_blocks_reference, iter_pptx_slides_reference
+    from bench_suite import synthetic_course, write_docx, write_pptx
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        docx_path, pptx_path = os.path.join(tmp, "riche.docx"), os.path.join(tmp, "riche.pptx")
+        write_rich_docx(docx_path)
+        write_rich_pptx(pptx_path)
+        docx_blocks = list(iter_docx_blocks(docx_path))
+        pptx_blocks = [bloc for slide in iter_pptx_slides(pptx_path) for bloc in slide]
+        expected = [
+            ("docx", docx_blocks, [("title", "Les tableaux", 1), ("table_row", "Nom | Age | Note", 1),
+                                   ("table_row", "Alice | 21 | 15.5", 1), ("table_row", "Bob | 22 | 12 détail |", 1),
+                                   ("code_line", "int x = 1;", 2)]),
+            ("pptx", pptx_blocks, [("diagram_element", "Animal -> Etre", 1), ("diagram_element", "Chien -> Animal", 1),
+                                   ("table_row", "Classe | Parent", 1), ("table_row", "Chien | Animal", 1)]),
+        ]
+        for name, blocks, wanted in expected:
+            got = [(b["type"], b["text"], b.get("section", b.get("slide"))) for b in blocks]
+            missing = [entry for entry in wanted if entry not in got]
+            if missing:
+                failures += 1
+                print(f"❌ {name} : manquant {missing}\n   obtenu {got}")
+        if not any(b.get("notes") and "instance" in b["text"] for b in pptx_blocks):
+            failures += 1
+            print("❌ pptx : notes de l'orateur absentes")
+        print(f"{'✅' if not failures else '❌'} tableaux, formes groupées, notes et sections extraits")
+
+        # Sans tableaux ni notes, même résultat que le modèle objet
+        scales = [int(arg) for arg in sys.argv[1:]] or [40, 400]
+        parallel = max(OFFICE_WORKERS, 2)  # au moins 2 pour vérifier aussi le chemin parallèle
+        for scale in scales:
+            course = synthetic_course(scale, seed=scale)
+            docx_path, pptx_path = os.path.join(tmp, f"{scale}.docx"), os.path.join(tmp, f"{scale}.pptx")
+            write_docx(course, docx_path)
+            write_pptx(course, pptx_path)
+            runs = [
+                ("docx", "python-docx", lambda: group_similar_blocks(iter_docx_blocks_reference(docx_path))),
+                ("docx", "iterparse", lambda: group_similar_blocks(iter_docx_blocks(docx_path))),
+                ("pptx", "python-pptx", lambda: group_similar_blocks(
+                    [b for slide in iter_pptx_slides_reference(pptx_path) for b in slide])),
+                ("pptx", "iterparse, 1 processus", lambda: group_similar_blocks(
+                    [b for slide in iter_pptx_slides(pptx_path, workers=1) for b in slide])),
+                ("pptx", f"iterparse, {parallel} processus", lambda: group_similar_blocks(
+                    [b for slide in iter_pptx_slides(pptx_path, workers=parallel) for b in slide])),
+            ]
+            reference = {}
+            for fmt, label, run in runs:
+                start = time.perf_counter()
+                blocks = run()
+                elapsed = time.perf_counter() - start
+                same = reference.setdefault(fmt, blocks) == blocks
+                failures += not same
+                print(f"{'⏱️ ' if same else '❌'} {fmt} {scale} pages, {label:<24} {elapsed * 1000:7.0f} ms "
+                      f"({len(blocks)} blocs){'' if same else ' — résultat différent'}")
+    sys.exit(1 if failures else 0)
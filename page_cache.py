@@ -0,0 +1,291 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import time
+import zipfile
+
+import fitz  # PyMuPDF
+
+from app import extract_any, group_similar_blocks, route_pdf_page, routed_page_blocks
+from ooxml_extract import extract_slide, pptx_slide_parts
+from pdf_ocr import OcrRouter, get_ocr_cache
+
+PAGE_CACHE_PATH = "page_cache.db"
+# À incrémenter quand l'extraction ou la classification change : invalide tout le cache
+CACHE_VERSION = b"5"
+
+# Références indirectes « 12 0 R » dans la source d'un objet PDF ; /Parent remonterait l'arbre des pages
+PDF_REF = re.compile(r"(\d+) 0 R")
+PDF_PARENT = re.compile(r"/Parent\s+\d+ 0 R")
+
+
+def pdf_object_hash(doc, xref, memo):
+    """
+    Empreinte d'un objet PDF et de tout ce qu'il référence (sources et flux bruts), calculée
+    une fois par objet et par document : les polices et formulaires partagés ne sont lus qu'une fois.
+    """
+    if xref in memo:
+        return memo[xref]
+    memo[xref] = b""  # garde contre les cycles
+    source = PDF_PARENT.sub("", doc.xref_object(xref, compressed=True))
+    digest = hashlib.sha256(source.encode())
+    if doc.xref_is_stream(xref):
+        digest.update(doc.xref_stream_raw(xref) or b"")
+    for ref in PDF_REF.findall(source):
+        digest.update(pdf_object_hash(doc, int(ref), memo))
+    memo[xref] = digest.digest()
+    return memo[xref]
+
+
+def pdf_page_resources(doc, page):
+    """Source du dictionnaire /Resources de la page, hérité des nœuds parents s'il est absent"""
+    xref = page.xref
+    while xref:
+        kind, value = doc.xref_get_key(xref, "Resources")
+        if kind != "null":
+            return value
+        kind, parent = doc.xref_get_key(xref, "Parent")
+        xref = int(parent.split()[0]) if kind == "xref" else 0
+    return ""
+
+
+def pdf_page_hash(doc, page, source, memo):
+    """
+    Empreinte d'une page PDF (sans passer par get_text) : fichier, géométrie, flux de contenu
+    et ressources résolues — polices, images et formulaires (Form XObject) qu'elle dessine.
+    Deux pages « q /fzFrm0 Do Q » ne diffèrent que par leur formulaire.
+    """
+    digest = hashlib.sha256(CACHE_VERSION)
+    digest.update(source.encode() + b"\0")
+    digest.update(repr((tuple(page.rect), page.rotation)).encode())
+    digest.update(page.read_contents())
+    resources = pdf_page_resources(doc, page)
+    digest.update(PDF_PARENT.sub("", resources).encode())
+    for ref in PDF_REF.findall(resources):
+        digest.update(pdf_object_hash(doc, int(ref), memo))
+    return digest.hexdigest()
+
+
+def pptx_slide_hash(zf, slide_part, notes_part, source):
+    """Empreinte d'une diapositive : fichier, XML de la diapositive et de ses notes"""
+    digest = hashlib.sha256(CACHE_VERSION)
+    digest.update(source.encode() + b"\0")
+    digest.update(zf.read(slide_part))
+    if notes_part is not None:
+        digest.update(b"\0" + zf.read(notes_part))
+    return digest.hexdigest()
+
+
+def _strip(blocks, page_key):
+    return [{k: v for k, v in bloc.items() if k not in ("source", page_key)} for bloc in blocks]
+
+
+def _stamp(blocks, source, page_key, page_num):
+    return [{"source": source, page_key: page_num, **bloc} for bloc in blocks]
+
+
+class PageCache:
+    """
+    Cache persistant des blocs classifiés par page/diapositive, adressé par l'empreinte
+    du contenu de la page : seule une page modifiée est ré-analysée et re-classifiée,
+    même si des pages ont été insérées ou supprimées avant elle.
+    """
+
+    def __init__(self, path=PAGE_CACHE_PATH):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS page_blocks (
+                page_hash TEXT PRIMARY KEY,
+                blocks TEXT NOT NULL,
+                grouped TEXT NOT NULL
+            )
+        ''')
+        self.conn.commit()
+        self.stats = {"pages": 0, "reused": 0}
+
+    def close(self):
+        self.conn.close()
+
+    def _lookup(self, page_hashes):
+        found = {}
+        hashes = list(set(page_hashes))
+        # Par paquets pour rester sous la limite de variables SQLite
+        for i in range(0, len(hashes), 500):
+            chunk = hashes[i:i + 500]
+            rows = self.conn.execute(
+                f"SELECT page_hash, blocks, grouped FROM page_blocks WHERE page_hash IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            for page_hash, blocks, grouped in rows:
+                found[page_hash] = (json.loads(blocks), json.loads(grouped))
+        return found
+
+    def _store(self, entries):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO page_blocks (page_hash, blocks, grouped) VALUES (?, ?, ?)",
+            [(h, json.dumps(b, ensure_ascii=False), json.dumps(g, ensure_ascii=False)) for h, b, g in entries],
+        )
+        self.conn.commit()
+
+    def extract_pdf(self, filepath):
+        source = os.path.basename(filepath)
+        output = []
+        new_entries = []
+        router = OcrRouter(filepath, cache=get_ocr_cache)
+        try:
+            with fitz.open(filepath) as doc:
+                memo = {}
+                page_hashes = [pdf_page_hash(doc, page, source, memo) for page in doc]
+                cached = self._lookup(page_hashes)
+                # Pages absentes du cache : extraction directe, les pages scannées partent à l'OCR
+                routed = {}
+                for page_num, page_hash in enumerate(page_hashes, start=1):
+                    if page_hash in cached or page_hash in routed:
+                        continue
+                    routed[page_hash] = (page_num, *route_pdf_page(doc, doc[page_num - 1], page_num, source, router))
+            for page_hash, (page_num, blocks, future) in routed.items():
+                blocks = routed_page_blocks(source, page_num, future, blocks)
+                # Les groupes ne franchissent jamais une frontière de page :
+                # seule la page modifiée est regroupée
+                entry = (_strip(blocks, "page"), _strip(group_similar_blocks(blocks), "page"))
+                cached[page_hash] = entry
+                # Une page dont l'OCR a échoué n'est pas mise en cache : elle sera retentée
+                if future is None or future.exception() is None:
+                    new_entries.append((page_hash, *entry))
+        finally:
+            router.close()
+        for page_num, page_hash in enumerate(page_hashes, start=1):
+            if page_num != routed.get(page_hash, (None,))[0]:
+                self.stats["reused"] += 1
+            output.extend(_stamp(cached[page_hash][1], source, "page", page_num))
+        self.stats["pages"] += len(page_hashes)
+        self._store(new_entries)
+        return output
+
+    def extract_pptx(self, filepath):
+        source = os.path.basename(filepath)
+        output = []
+        new_entries = []
+        with zipfile.ZipFile(filepath) as zf:
+            slides = pptx_slide_parts(zf)
+            slide_hashes = [pptx_slide_hash(zf, *parts, source) for parts in slides]
+            cached = self._lookup(slide_hashes)
+            for slide_num, (parts, slide_hash) in enumerate(zip(slides, slide_hashes), start=1):
+                if slide_hash in cached:
+                    grouped = cached[slide_hash][1]
+                    self.stats["reused"] += 1
+                else:
+                    blocks = extract_slide(zf, slide_num, *parts, source)
+                    # Comme pour les pages PDF : les groupes s'arrêtent à la diapositive
+                    grouped = _strip(group_similar_blocks(blocks), "slide")
+                    cached[slide_hash] = (_strip(blocks, "slide"), grouped)
+                    new_entries.append((slide_hash, *cached[slide_hash]))
+                output.extend(_stamp(grouped, source, "slide", slide_num))
+        self.stats["pages"] += len(slide_hashes)
+        self._store(new_entries)
+        return output
+
+    def extract(self, filepath):
+        """Même résultat que extract_any, en ne ré-analysant que les pages modifiées"""
+        ext = os.path.splitext(filepath)[-1].lower()
+        if ext == ".pdf":
+            return self.extract_pdf(filepath)
+        elif ext == ".pptx":
+            return self.extract_pptx(filepath)
+        # DOCX : pas de découpage en pages, extraction complète
+        return extract_any(filepath)
+
+
+def _make_synthetic_pdf(path, page_count, edited_page=None):
+    doc = fitz.open()
+    for i in range(page_count):
+        page = doc.new_page()
+        marker = " (modifiée)" if i == edited_page else ""
+        page.insert_text((72, 72), f"CHAPITRE {i + 1}{marker}")
+        page.insert_text((72, 110), f"Les objets de la page {i + 1} sont décrits ici en détail.")
+        for line in range(8):
+            page.insert_text((72, 140 + 16 * line), f"int valeur{line} = {i} + {line};")
+    doc.save(path)
+    doc.close()
+
+
+def check_form_pages(page_count=3):
+    """
+    Pages qui dessinent tout via un formulaire (sortie de show_pdf_page, pdfpages) : leurs flux de
+    contenu sont identiques, le cache doit pourtant rendre le texte de chacune. Lève AssertionError sinon.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "formulaires.pdf")
+        with fitz.open() as pages, fitz.open() as doc:
+            for i in range(page_count):
+                pages.new_page().insert_text((72, 72), f"Contenu propre à la page {i + 1}")
+            for i in range(page_count):
+                doc.new_page().show_pdf_page(fitz.Rect(0, 0, 595, 842), pages, i)
+            doc.save(path)
+        cache = PageCache(os.path.join(tmp, "cache.db"))
+        try:
+            for _ in range(2):  # à froid puis entièrement depuis le cache
+                assert cache.extract(path) == extract_any(path), "le cache confond des pages à formulaire"
+        finally:
+            cache.close()
+
+
+def benchmark(page_count=500):
+    """Compare extraction complète et ré-extraction incrémentale après modification d'une page"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cours.pdf")
+        cache = PageCache(os.path.join(tmp, "cache.db"))
+
+        _make_synthetic_pdf(path, page_count)
+        start = time.perf_counter()
+        cache.extract(path)
+        cold = time.perf_counter() - start
+
+        _make_synthetic_pdf(path, page_count, edited_page=page_count // 2)
+        start = time.perf_counter()
+        incremental = cache.extract(path)
+        warm = time.perf_counter() - start
+
+        start = time.perf_counter()
+        full = extract_any(path)
+        baseline = time.perf_counter() - start
+        cache.close()
+
+    assert incremental == full, "le résultat incrémental diffère de l'extraction complète"
+    return {"cold": cold, "incremental": warm, "full": baseline}
+
+
+# ---- MAIN ----
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extraction incrémentale avec cache d'empreintes par page")
+    parser.add_argument("paths", nargs="*", help="fichiers à extraire")
+    parser.add_argument("--cache", default=PAGE_CACHE_PATH, help="base SQLite du cache de pages")
+    parser.add_argument("--bench", type=int, metavar="PAGES", help="benchmark sur un PDF synthétique de PAGES pages")
+    parser.add_argument("--check", action="store_true", help="vérifie les empreintes de pages à formulaire")
+    args = parser.parse_args()
+
+    if args.check:
+        check_form_pages()
+        print("✅ Pages à formulaire : une empreinte distincte par page")
+
+    if args.bench:
+        timings = benchmark(args.bench)
+        print(f"⏱️  {args.bench} pages : première extraction {timings['cold']:.2f}s, "
+              f"après modification d'une page {timings['incremental']:.2f}s "
+              f"(extraction complète {timings['full']:.2f}s)")
+
+    if args.paths:
+        # Base ouverte seulement pour une extraction : --check et --bench travaillent dans un dossier temporaire
+        cache = PageCache(args.cache)
+        for path in args.paths:
+            start = time.perf_counter()
+            cache.stats = {"pages": 0, "reused": 0}
+            blocks = cache.extract(path)
+            print(f"✅ {path} : {len(blocks)} blocs en {time.perf_counter() - start:.2f}s "
+                  f"({cache.stats['reused']}/{cache.stats['pages']} pages réutilisées)")
+        cache.close()
@@ -0,0 +1,216 @@
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+
+from app import extract_any, group_similar_blocks, route_pdf_page, routed_page_blocks
+from block_export import write_export
+from pdf_ocr import OcrRouter, get_ocr_cache
+
+PAGES_PER_TASK = 16
+
+
+def _extract_page_range(filepath, start, stop):
+    """
+    Tâche d'un worker : ouvre son propre document fitz et extrait les pages [start, stop).
+    Les pages scannées sont reconnues sur place (OcrRouter sans pool) : le worker est déjà
+    un processus, un pool OCR par worker multiplierait les processus par OCR_WORKERS.
+    """
+    source = os.path.basename(filepath)
+    router = OcrRouter(filepath, workers=0, cache=get_ocr_cache)
+    try:
+        pending = []  # (numéro de page, Future OCR ou None, blocs extraits directement)
+        with fitz.open(filepath) as doc:
+            for page_num in range(start + 1, stop + 1):
+                blocks, future = route_pdf_page(doc, doc[page_num - 1], page_num, source, router)
+                pending.append((page_num, future, blocks))
+        content = []
+        for page_num, future, blocks in pending:
+            content.extend(routed_page_blocks(source, page_num, future, blocks))
+        return content
+    finally:
+        router.close()
+
+
+def _shard_pdf(filepath, pages_per_task):
+    """Découpe un PDF en plages de pages (start, stop) de taille pages_per_task"""
+    with fitz.open(filepath) as doc:
+        page_count = doc.page_count
+    return [(start, min(start + pages_per_task, page_count))
+            for start in range(0, page_count, pages_per_task)]
+
+
+def extract_many(paths, workers=None, pages_per_task=PAGES_PER_TASK):
+    """
+    Extrait plusieurs fichiers en parallèle. Les pages des PDF sont réparties entre
+    les processus, puis recollées dans l'ordre des pages avant group_similar_blocks :
+    le résultat est identique à extract_any fichier par fichier.
+    Retourne un dictionnaire {chemin: blocs} dans l'ordre de `paths`.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        return {path: extract_any(path) for path in paths}
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for path in paths:
+            if os.path.splitext(path)[-1].lower() == ".pdf":
+                futures[path] = [pool.submit(_extract_page_range, path, start, stop)
+                                 for start, stop in _shard_pdf(path, pages_per_task)]
+            else:
+                # DOCX/PPTX : un fichier entier par tâche
+                futures[path] = pool.submit(extract_any, path)
+
+        for path in paths:
+            if isinstance(futures[path], list):
+                content = []
+                for future in futures[path]:
+                    content.extend(future.result())
+                results[path] = group_similar_blocks(content)
+            else:
+                results[path] = futures[path].result()
+    return results
+
+
+def count_pages(paths):
+    total = 0
+    for path in paths:
+        if os.path.splitext(path)[-1].lower() == ".pdf":
+            with fitz.open(path) as doc:
+                total += doc.page_count
+    return total
+
+
+def scaling_report(paths, max_workers=None, pages_per_task=PAGES_PER_TASK):
+    """Mesure le débit (pages/s) de 1 à max_workers processus"""
+    max_workers = max_workers or os.cpu_count() or 1
+    pages = count_pages(paths)
+    report = []
+    workers = 1
+    while True:
+        start = time.perf_counter()
+        extract_many(paths, workers=workers, pages_per_task=pages_per_task)
+        elapsed = time.perf_counter() - start
+        report.append({"workers": workers, "seconds": elapsed, "pages_per_sec": pages / elapsed})
+        if workers >= max_workers:
+            break
+        workers = min(workers * 2, max_workers)
+    return report
+
+
+def _process_tree(pid):
+    """
+    Descendants Python vivants de pid (Linux, via /proc) : {pid: pid du parent}.
+    Les commandes lancées en passant (whereis tesseract de PyMuPDF) ne sont pas comptées.
+    """
+    python = os.path.realpath(sys.executable)
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # « pid (nom) état ppid ... » : le nom peut contenir des espaces
+        parents[int(entry)] = int(stat.rsplit(")", 1)[1].split()[1])
+    tree = {}
+    for child, parent in parents.items():
+        ancestor = parent
+        while ancestor and ancestor != pid and ancestor in parents:
+            ancestor = parents[ancestor]
+        if ancestor != pid:
+            continue
+        try:
+            if os.path.realpath(f"/proc/{child}/exe") == python:
+                tree[child] = parent
+        except OSError:
+            continue
+    return tree
+
+
+def _make_scanned_pdf(path, page_count):
+    """PDF de pages scannées : une image pleine page, aucun texte"""
+    import fitz  # PyMuPDF
+
+    pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 200, 280), False)
+    pixmap.set_rect(pixmap.irect, (255, 255, 255))
+    image = pixmap.tobytes("png")
+    with fitz.open() as doc:
+        for _ in range(page_count):
+            page = doc.new_page()
+            page.insert_image(page.rect, stream=image)
+        doc.save(path)
+
+
+def check_ocr_processes(workers=4, page_count=32, pages_per_task=4):
+    """
+    Compte les processus vivants pendant extract_many(workers) sur un PDF scanné : au plus
+    `workers` processus d'extraction, et aucun pool OCR imbriqué sous eux. Lève AssertionError sinon.
+    """
+    if not os.path.isdir("/proc"):
+        return None
+    peak = {"workers": 0, "nested": 0}
+    done = threading.Event()
+
+    def sample():
+        while not done.is_set():
+            tree = _process_tree(os.getpid())
+            peak["workers"] = max(peak["workers"], sum(1 for p in tree.values() if p == os.getpid()))
+            peak["nested"] = max(peak["nested"], sum(1 for p in tree.values() if p != os.getpid()))
+            time.sleep(0.005)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "scanne.pdf")
+        _make_scanned_pdf(path, page_count)
+        sampler = threading.Thread(target=sample)
+        sampler.start()
+        try:
+            extract_many([path], workers=workers, pages_per_task=pages_per_task)
+        finally:
+            done.set()
+            sampler.join()
+    assert peak["workers"] <= workers, f"{peak['workers']} processus d'extraction pour {workers} demandés"
+    assert peak["nested"] == 0, f"{peak['nested']} processus OCR imbriqués dans les workers"
+    return peak
+
+
+# ---- MAIN ----
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extraction parallèle de plusieurs cours (PDF, DOCX, PPTX)")
+    parser.add_argument("paths", nargs="*", help="fichiers à extraire")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="nombre de processus (défaut : nombre de cœurs)")
+    parser.add_argument("--pages-per-task", type=int, default=PAGES_PER_TASK, help="pages par tâche PDF")
+    parser.add_argument("-o", "--output", default="output_structured.json", help="fichier de sortie (.json, .jsonl ou .blk)")
+    parser.add_argument("--bench", action="store_true", help="affiche le débit en pages/s de 1 à N processus")
+    parser.add_argument("--check", action="store_true", help="compte les processus OCR sur un PDF scanné")
+    args = parser.parse_args()
+
+    if args.check:
+        peak = check_ocr_processes(workers=args.workers or 4)
+        if peak is None:
+            print("⚠️  /proc indisponible : comptage des processus ignoré")
+        else:
+            print(f"✅ PDF scanné : {peak['workers']} processus d'extraction au plus, aucun pool OCR imbriqué")
+    if args.paths and args.bench:
+        print("⏱️  Débit d'extraction :")
+        baseline = None
+        for row in scaling_report(args.paths, args.workers, args.pages_per_task):
+            baseline = baseline or row["pages_per_sec"]
+            print(f"  - {row['workers']:>3} processus : {row['pages_per_sec']:8.1f} pages/s "
+                  f"(x{row['pages_per_sec'] / baseline:.2f})")
+    elif args.paths:
+        start = time.perf_counter()
+        results = extract_many(args.paths, workers=args.workers, pages_per_task=args.pages_per_task)
+        output = [bloc for blocs in results.values() for bloc in blocs]
+        write_export(output, args.output)
+        print(f"✅ {len(args.paths)} fichiers extraits en {time.perf_counter() - start:.1f}s "
+              f"→ {args.output} ({len(output)} blocs)")
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from corpus_db import DB_PATH
+
+# Cache stocké à côté de corpus.db
+OCR_CACHE_PATH = os.path.join(os.path.dirname(DB_PATH), "ocr_cache.db")
+# À incrémenter si le moteur ou les réglages OCR changent : invalide tout le cache
+OCR_VERSION = b"1"
+OCR_LANGUAGE = "fra"
+OCR_DPI = 300
+# L'OCR est gourmand en CPU et en mémoire : peu de processus, et un nombre borné de pages en attente
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", min(2, os.cpu_count() or 1)))
+OCR_MAX_PENDING = 4 * OCR_WORKERS
+# Sonde : une page avec moins de MIN_TEXT_CHARS caractères de texte, dont les images
+# couvrent au moins MIN_IMAGE_COVERAGE de la surface, est considérée comme scannée
+MIN_TEXT_CHARS = 20
+MIN_IMAGE_COVERAGE = 0.5
+
+
+def needs_ocr(page, blocks):
+    """Sonde de densité : pas (ou presque pas) de texte, mais une page couverte d'images"""
+    if sum(len(bloc["text"]) for bloc in blocks) >= MIN_TEXT_CHARS:
+        return False
+    page_area = abs(page.rect)
+    if not page_area:
+        return False
+    import fitz  # PyMuPDF
+
+    covered = sum(abs(fitz.Rect(info["bbox"]) & page.rect) for info in page.get_image_info())
+    return covered / page_area >= MIN_IMAGE_COVERAGE
+
+
+def page_image_hash(doc, page):
+    """Empreinte d'une page scannée : flux bruts de ses images, géométrie et réglages OCR"""
+    digest = hashlib.sha256(OCR_VERSION)
+    digest.update(f"{OCR_LANGUAGE}:{OCR_DPI}:{tuple(page.rect)}:{page.rotation}".encode())
+    images = page.get_images(full=True)
+    for image in images:
+        digest.update(doc.xref_stream_raw(image[0]) or b"")
+    if not images:
+        digest.update(page.read_contents())
+    return digest.hexdigest()
+
+
+def ocr_page(filepath, page_index, language=OCR_LANGUAGE, dpi=OCR_DPI):
+    """Tâche d'un processus OCR : blocs d'une page reconnue par Tesseract (via PyMuPDF)"""
+    import fitz  # PyMuPDF
+
+    from app import extract_pdf_page
+
+    with fitz.open(filepath) as doc:
+        page = doc[page_index]
+        textpage = page.get_textpage_ocr(language=language, dpi=dpi, full=True)
+        blocks = extract_pdf_page(page, page_index + 1, os.path.basename(filepath), textpage=textpage)
+    for bloc in blocks:
+        bloc["ocr"] = True
+    return blocks
+
+
+class OcrCache:
+    """Blocs OCR par empreinte d'image de page : une page scannée n'est reconnue qu'une fois"""
+
+    def __init__(self, path=OCR_CACHE_PATH):
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS ocr_pages (
+                page_hash TEXT PRIMARY KEY,
+                blocks TEXT NOT NULL
+            )
+        ''')
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def get(self, page_hash):
+        with self._lock:
+            row = self.conn.execute("SELECT blocks FROM ocr_pages WHERE page_hash = ?", (page_hash,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, page_hash, blocks):
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO ocr_pages (page_hash, blocks) VALUES (?, ?)",
+                              (page_hash, json.dumps(blocks, ensure_ascii=False)))
+            self.conn.commit()
+
+
+class OcrRouter:
+    """
+    Envoie les pages scannées d'un PDF à un pool de processus OCR de taille bornée.
+    submit() rend un Future des blocs de la page ; le pool n'est créé qu'à la première page
+    qui en a besoin, et les résultats sont mis en cache par empreinte d'image. cache peut
+    aussi être une fonction (get_ocr_cache) : le cache n'est alors ouvert qu'à ce moment-là.
+    Avec workers=0, l'OCR tourne dans le processus courant (déjà un worker, par exemple) :
+    submit() rend alors un Future déjà terminé.
+    """
+
+    def __init__(self, filepath, workers=OCR_WORKERS, cache=None, ocr_fn=ocr_page):
+        self.filepath = filepath
+        self.workers = workers
+        self.cache = cache
+        self.ocr_fn = ocr_fn
+        self.pool = None
+        self.stats = {"pages": 0, "cached": 0}
+
+    def submit(self, doc, page, page_num):
+        self.stats["pages"] += 1
+        if callable(self.cache):
+            self.cache = self.cache()
+        page_hash = page_image_hash(doc, page) if self.cache else None
+        cached = self.cache.get(page_hash) if self.cache else None
+        if cached is not None:
+            self.stats["cached"] += 1
+            future = Future()
+            future.set_result([{"source": os.path.basename(self.filepath), "page": page_num, **bloc}
+                               for bloc in cached])
+            return future
+        if not self.workers:
+            future = Future()
+            try:
+                future.set_result(self.ocr_fn(self.filepath, page_num - 1))
+            except Exception as exc:
+                future.set_exception(exc)
+        else:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(max_workers=self.workers)
+            future = self.pool.submit(self.ocr_fn, self.filepath, page_num - 1)
+        if self.cache:
+            future.add_done_callback(lambda f: self._store(page_hash, f))
+        return future
+
+    def _store(self, page_hash, future):
+        if future.exception() is None:
+            self.cache.put(page_hash, [{k: v for k, v in bloc.items() if k not in ("source", "page")}
+                                       for bloc in future.result()])
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+            self.pool = None
+
+
+_cache = None
+_cache_pid = None
+_cache_lock = threading.Lock()
+
+
+def get_ocr_cache():
+    """Cache OCR partagé par processus (un processus forké ouvre sa propre connexion)"""
+    global _cache, _cache_pid
+    with _cache_lock:
+        if _cache is None or _cache_pid != os.getpid():
+            _cache = OcrCache()
+            _cache_pid = os.getpid()
+        return _cache
@@ -1,19 +1,46 @@
 import sqlite3
 
-def search_blocs(keyword, source=None, bloc_type=None, db_path="corpus.db"):
+from corpus_db import get_store
+
+
+def search_blocs(keyword, source=None, bloc_type=None, db_path="corpus.db", limit=None, offset=0, as_table=False):
     """
     Recherche les blocs contenant un mot-clé, éventuellement filtrés par source (PDF) et/ou type de bloc.
-    Retourne une liste de dictionnaires.
+    La recherche passe par l'index FTS5 (insensible à la casse et aux accents) et les résultats
+    sont classés par pertinence BM25. limit/offset permettent de paginer.
+    Retourne une liste de dictionnaires, ou avec as_table une BlockTable (id, source, page,
+    type, text) dans l'ordre de pertinence.
+    """
+    results = get_store(db_path).search(keyword, source=source, bloc_type=bloc_type, limit=limit, offset=offset)
+    if not as_table:
+        return results
+    # BlockTable tire NumPy : importée seulement pour les résultats en colonnes
+    from block_table import UNIT_NONE, UNIT_PAGE, BlockTable
+
+    table = BlockTable()
+    for bloc in results:
+        unit = UNIT_NONE if bloc["page"] is None else UNIT_PAGE
+        table.add(bloc["source"], bloc["bloc_type"], bloc["contenu"], unit, bloc["page"] or 0, bloc_id=bloc["id"])
+    return table
+
+
+def search_blocs_like(keyword, source=None, bloc_type=None, db_path="corpus.db"):
+    """
+    Ancienne recherche par sous-chaîne (LIKE, parcours complet de la table),
+    conservée comme référence pour le benchmark.
     """
     conn = sqlite3.connect(db_path)
     c = conn.cursor()
-    query = "SELECT id, source, page, bloc_type, contenu FROM blocs WHERE contenu LIKE ?"
+    query = (
+        "SELECT b.id, d.source, b.page, b.bloc_type, b.contenu"
+        " FROM blocs b JOIN documents d ON d.id = b.document_id WHERE b.contenu LIKE ?"
+    )
     params = [f"%{keyword}%"]
     if source:
-        query += " AND source = ?"
+        query += " AND d.source = ?"
         params.append(source)
     if bloc_type:
-        query += " AND bloc_type = ?"
+        query += " AND b.bloc_type = ?"
         params.append(bloc_type)
     c.execute(query, params)
     results = [
@@ -29,16 +56,60 @@ def search_blocs(keyword, source=None, bloc_type=None, db_path="corpus.db"):
     conn.close()
     return results
 
+
+def benchmark(bloc_count=1_000_000, keywords=("héritage", "tableau", "classe abstraite")):
+    """Compare FTS5 et LIKE sur un corpus synthétique de bloc_count blocs"""
+    import os
+    import random
+    import tempfile
+    import time
+
+    from corpus_db import ingest_blocs
+
+    # Quelques termes de cours noyés dans un vocabulaire plus large, pour une sélectivité réaliste
+    vocabulary = ("objet classe méthode attribut héritage interface tableau boucle variable "
+                  "référence constructeur exception paquetage énergie probabilité abstraite").split()
+    vocabulary += [f"terme{i}" for i in range(5000)]
+    rng = random.Random(42)
+    blocs = (
+        {"source": f"cours{i % 200}.pdf", "page": i % 300 + 1, "type": rng.choice(["paragraph", "code_line"]),
+         "text": " ".join(rng.choice(vocabulary) for _ in range(rng.randint(5, 30)))}
+        for i in range(bloc_count)
+    )
+    timings = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        conn = sqlite3.connect(db_path)
+        ingest_blocs(conn, "synthetique", "v1", blocs)
+        conn.close()
+        for name, fn in [("fts5", lambda k: search_blocs(k, db_path=db_path, limit=20)),
+                         ("like", lambda k: search_blocs_like(k, db_path=db_path))]:
+            start = time.perf_counter()
+            for keyword in keywords:
+                fn(keyword)
+            timings[name] = (time.perf_counter() - start) / len(keywords)
+    return timings
+
+
 if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 2 and sys.argv[1] == "--bench":
+        count = int(sys.argv[2])
+        timings = benchmark(count)
+        print(f"⏱️  {count} blocs : FTS5 (top 20) {timings['fts5'] * 1000:.1f} ms/requête, "
+              f"LIKE {timings['like'] * 1000:.1f} ms/requête")
+        sys.exit(0)
+
     # Exemples d'utilisation
     print("Recherche de 'probabilité' dans tous les PDF :")
     for bloc in search_blocs("probabilité"):
-        print(f"- [{bloc['source']}][page {bloc['page']}][{bloc['bloc_type']}] {bloc['contenu'][:80]}...")
+        print(f"- [{bloc['source']}][page {bloc['page']}][{bloc['bloc_type']}] {bloc['snippet']}")
 
     print("\nRecherche de 'énergie' dans physique.pdf :")
     for bloc in search_blocs("énergie", source="physique.pdf"):
-        print(f"- [page {bloc['page']}][{bloc['bloc_type']}] {bloc['contenu'][:80]}...")
+        print(f"- [page {bloc['page']}][{bloc['bloc_type']}] {bloc['snippet']}")
 
-    print("\nRecherche de paragraphes contenant 'code' dans JavaLesBases.pdf :")
-    for bloc in search_blocs("main", source="JavaLesBases.pdf", bloc_type=""):
-        print(f"- [page {bloc['page']}] {bloc['contenu'][:80]}...")
+    print("\nRecherche de paragraphes contenant 'code' dans JavaLesBases.pdf (10 premiers) :")
+    for bloc in search_blocs("main", source="JavaLesBases.pdf", bloc_type="", limit=10):
+        print(f"- [page {bloc['page']}] {bloc['snippet']}")
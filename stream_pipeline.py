@@ -0,0 +1,58 @@
+import argparse
+import os
+import sqlite3
+import time
+import tracemalloc
+
+import instrumentation
+from app import extract_stream
+from block_export import iter_jsonl_writer
+from corpus_db import BATCH_SIZE, DB_PATH, configure_for_load, file_hash, ingest_blocs
+
+
+def stream_ingest(filepath, jsonl_path="output_structured.jsonl", db_path=DB_PATH, batch_size=BATCH_SIZE):
+    """
+    Pipeline en flux : pages → regroupement → JSON Lines + SQLite par lots.
+    La mémoire reste bornée par une page, le groupe en cours et un lot d'insertion,
+    quelle que soit la taille du document. Le JSON Lines se remplit au fil de l'eau ;
+    côté SQLite, les blocs de la source sont remplacés en une seule transaction.
+    Retourne le nombre de blocs écrits.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        configure_for_load(conn)
+        with open(jsonl_path, "w", encoding="utf-8") as f:
+            blocs = iter_jsonl_writer(extract_stream(filepath), f)
+            count = ingest_blocs(conn, os.path.basename(filepath), file_hash(filepath), blocs, batch_size, force=True)
+    finally:
+        conn.close()
+    return count
+
+
+# ---- MAIN ----
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extraction en flux d'un cours vers JSON Lines et SQLite")
+    parser.add_argument("path", help="fichier à extraire (PDF, DOCX, PPTX)")
+    parser.add_argument("-o", "--output", default="output_structured.jsonl", help="fichier JSON Lines de sortie")
+    parser.add_argument("--db", default=DB_PATH, help="base SQLite")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="taille des lots executemany")
+    parser.add_argument("--memory", action="store_true", help="mesure le pic mémoire Python (tracemalloc)")
+    parser.add_argument("--metrics", default=os.getenv(instrumentation.METRICS_ENV),
+                        help="rapport d'instrumentation par étape (.json ou .prom)")
+    args = parser.parse_args()
+
+    if args.metrics:
+        instrumentation.enable()
+
+    if args.memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    count = stream_ingest(args.path, args.output, args.db, args.batch_size)
+    print(f"✅ {count} blocs écrits dans {args.output} et {args.db} en {time.perf_counter() - start:.1f}s")
+    if args.memory:
+        _, peak = tracemalloc.get_traced_memory()
+        print(f"📈 Pic mémoire Python : {peak / 1024:.0f} Ko")
+    if args.metrics:
+        instrumentation.METRICS.write(args.metrics)
+        print(f"⏱️  Rapport d'instrumentation écrit dans {args.metrics}")